@@ -27,7 +27,7 @@ let full_analysis_workflow ?get_reads ?debug ~outdir p =
         (Filename.concat outdir "report_end.html")
     ]
 
-let main sample_sheet outdir species_tree_file alignments_dir seq2sp_dir np memory no_reconcile _refinetree (*refineali*) ali_sister_threshold merge_criterion debug (get_reads:bool) just_parse_input html_report quiet use_docker family_to_use () =
+let main sample_sheet outdir species_tree_file alignments_dir seq2sp_dir np memory no_reconcile _refinetree (*refineali*) ali_sister_threshold merge_criterion large_aligner large_family_size add_mode collapse_queries debug (get_reads:bool) just_parse_input html_report quiet use_docker family_to_use () =
   let open Defs in
   let open Bistro_utils in
   let loggers quiet html_report = List.filter_opt [
@@ -45,10 +45,31 @@ let main sample_sheet outdir species_tree_file alignments_dir seq2sp_dir np memo
         | None -> failwith "Invalid merge criterion argument"
       )
   in
+  let large_aligner =
+    Option.map large_aligner ~f:(fun s ->
+        match large_aligner_of_string s with
+        | Some la -> la
+        | None -> failwith "Invalid large aligner argument"
+      )
+  in
+  let add_mode =
+    Option.map add_mode ~f:(fun s ->
+        match add_mode_of_string s with
+        | Some m -> m
+        | None -> failwith "Invalid add mode argument"
+      )
+  in
+  let collapse_queries =
+    Option.map collapse_queries ~f:(fun s ->
+        match query_collapse_of_string s with
+        | Some c -> c
+        | None -> failwith "Invalid collapse queries argument"
+      )
+  in
   let nthreads = Option.value ~default:2 np in
   let memory = Option.value ~default:1 memory in
   let dataset = Dataset.make ?family_subset_file:family_to_use ~sample_sheet ~species_tree_file ~alignments_dir ~seq2sp_dir () in
-  let pipeline = Pipeline.make ~nthreads ~memory ~merge_criterion dataset ~filter_threshold:ali_sister_threshold ~refine_ali:false ~run_reconciliation in
+  let pipeline = Pipeline.make ~nthreads ~memory ?large_aligner ?large_family_size ?add_mode ?collapse_queries ~merge_criterion dataset ~filter_threshold:ali_sister_threshold ~refine_ali:false ~run_reconciliation in
   let caars_workflow =
     if just_parse_input then
       just_parse_workflow ~outdir pipeline
@@ -81,6 +102,10 @@ let command =
       (*  and = flag "--refineali"       no_arg            ~doc:"Refine MSA after the final Reconciliation step (Default:false)"*)
       and ali_sister_threshold = flag "--mpast"           (optional float)  ~doc:"FLOAT Minimal percentage of alignment of a caars sequence on its (non Caars) closest sequence to be kept in the final output"
       and merge_criterion = flag "--merge-criterion" (optional string) ~doc:"STR Merge criterion during redundancy removing. It must be “length“ or “length_complete” or “merge”. “length” means the longest sequence is selected. “length.complete” : means the largest number of complete sites (no gaps). “merge” means that the set of monophyletic sequences is used to build one long “chimera” sequence corresponding to the merging of them."
+      and large_aligner = flag "--large-aligner"   (optional string) ~doc:"STR Aligner of the families larger than --large-family-size, instead of mafft. It must be “famsa” or “muscle5” (MUSCLE 5 Super5, which can not add sequences to an alignment: mafft is then used). (Default: mafft for all families)"
+      and large_family_size = flag "--large-family-size" (optional int) ~doc:"INT Number of sequences above which --large-aligner is used. (Default:5000)"
+      and add_mode = flag "--add-mode" (optional string) ~doc:"STR How the new sequences are added to the alignments. It must be “realign” or “fragments” or “fragments.keeplength”. “realign” means they are added with mafft --add and the whole alignment is realigned. “fragments” means they are added as fragments of the existing alignment with mafft --addfragments, without realignment. “fragments.keeplength” also keeps the length of the alignment. (Default:realign)"
+      and collapse_queries = flag "--collapse-queries" (optional string) ~doc:"STR Search only one representative of the identical Trinity transcripts (“duplicates”), and also of the isoforms of a gene contained in a longer isoform (“contained”), and give its hits to the other ones. The hits of a contained isoform are approximate. (Default: all the transcripts are searched)"
       and debug = flag "--debug"           no_arg            ~doc:" Get intermediary files (Default:false)"
       and get_reads = flag "--get-reads"       no_arg            ~doc:" Get normalized reads (Default:false)"
       and just_parse_input = flag "--just-parse-input"no_arg            ~doc:" Parse input and exit. Recommended to check all input files. (Default:false)"
@@ -90,5 +115,5 @@ let command =
       and use_docker = flag "--use-docker"      no_arg            ~doc:" Use docker in caars.  Default: off"
       and family_to_use = flag "--family-subset"  (optional Filename.arg_type)    ~doc:"PATH A file containing a subset of families to use.  Default: off"
       in
-      main sample_sheet outdir species_tree_file alignments_dir seq2sp_dir np memory no_reconcile refinetree (*refineali*) ali_sister_threshold merge_criterion debug get_reads just_parse_input html_report quiet use_docker family_to_use
+      main sample_sheet outdir species_tree_file alignments_dir seq2sp_dir np memory no_reconcile refinetree (*refineali*) ali_sister_threshold merge_criterion large_aligner large_family_size add_mode collapse_queries debug get_reads just_parse_input html_report quiet use_docker family_to_use
     ]
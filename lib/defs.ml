@@ -36,6 +36,35 @@ let merge_criterion_of_string = function
   | "length.complete" -> Some Length_complete
   | _ -> None
 
+type large_aligner =
+  | Famsa
+  | Muscle5
+
+let large_aligner_of_string = function
+  | "famsa" -> Some Famsa
+  | "muscle5" -> Some Muscle5
+  | _ -> None
+
+type add_mode =
+  | Add_realign
+  | Add_fragments
+  | Add_fragments_keeplength
+
+let add_mode_of_string = function
+  | "realign" -> Some Add_realign
+  | "fragments" -> Some Add_fragments
+  | "fragments.keeplength" -> Some Add_fragments_keeplength
+  | _ -> None
+
+type query_collapse =
+  | Collapse_duplicates
+  | Collapse_contained
+
+let query_collapse_of_string = function
+  | "duplicates" -> Some Collapse_duplicates
+  | "contained" -> Some Collapse_contained
+  | _ -> None
+
 let ( $ ) a k = List.Assoc.find_exn ~equal:Poly.equal a k
 
 let assoc keys ~f =
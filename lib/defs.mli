@@ -30,6 +30,28 @@ type merge_criterion =
 
 val merge_criterion_of_string : string -> merge_criterion option
 
+(** aligner of the families larger than the large family size *)
+type large_aligner =
+  | Famsa
+  | Muscle5
+
+val large_aligner_of_string : string -> large_aligner option
+
+(** how seq_integrator adds the sequences to the alignments *)
+type add_mode =
+  | Add_realign
+  | Add_fragments
+  | Add_fragments_keeplength
+
+val add_mode_of_string : string -> add_mode option
+
+(** queries searched by seq_dispatcher through a representative *)
+type query_collapse =
+  | Collapse_duplicates
+  | Collapse_contained
+
+val query_collapse_of_string : string -> query_collapse option
+
 (** concatenates strings using underscore as separator *)
 val id_concat : string list -> string
 
@@ -183,30 +183,45 @@ let blast_dbs_of_norm_fasta norm_fasta =
         None
     )
 
-let trinity_annotated_families_of_trinity_assemblies config_dir assemblies ref_blast_dbs threads =
-  assoc_map assemblies  ~f:(fun (s : Rna_sample.t) trinity_assembly ->
-      let ref_db = List.map s.reference_species ~f:(fun r -> ref_blast_dbs $ r) in
-      let query = trinity_assembly in
-      let query_species= s.species in
-      let query_id = s.id in
-      let tag = id_concat s.reference_species in
-      let ref_transcriptome =
-        List.map s.reference_species ~f:(Configuration_directory.ref_transcriptome config_dir)
-        |> fasta_concat ~tag:(tag ^ ".ref_transcriptome")
-      in
-      let seq2fam =
-        List.map s.reference_species ~f:(Configuration_directory.ref_seq_fam_links config_dir)
-        |> fasta_concat ~tag:(tag ^ ".seq2fam")
-      in
-      Seq_dispatcher.seq_dispatcher
-        ~s2s_tab_by_family:true
-        ~query
-        ~query_species
-        ~query_id
-        ~ref_transcriptome
-        ~seq2fam
-        ~ref_db
-        ~threads
+let trinity_annotated_families_of_trinity_assemblies ?family_subset ?collapse_queries config_dir assemblies ref_blast_dbs threads max_threads =
+  (* One seq_dispatcher run for all the samples with the same reference
+     species, sharing the threads of its samples, at most max_threads *)
+  let reference_species_groups =
+    List.map assemblies ~f:(fun ((s : Rna_sample.t), _) -> s.reference_species)
+    |> List.dedup_and_sort ~compare:(List.compare String.compare)
+  in
+  let seq_dispatcher_dirs =
+    List.map reference_species_groups ~f:(fun reference_species ->
+        let queries =
+          List.filter assemblies ~f:(fun ((s : Rna_sample.t), _) ->
+              List.equal String.equal s.reference_species reference_species
+            )
+        in
+        let ref_db = List.map reference_species ~f:(fun r -> ref_blast_dbs $ r) in
+        let tag = id_concat reference_species in
+        let ref_transcriptome =
+          List.map reference_species ~f:(Configuration_directory.ref_transcriptome config_dir)
+          |> fasta_concat ~tag:(tag ^ ".ref_transcriptome")
+        in
+        let seq2fam =
+          List.map reference_species ~f:(Configuration_directory.ref_seq_fam_links config_dir)
+          |> fasta_concat ~tag:(tag ^ ".seq2fam")
+        in
+        reference_species,
+        Seq_dispatcher.seq_dispatcher_samples
+          ~s2s_tab_by_family:true
+          ?family_subset
+          ?collapse_queries
+          ~queries
+          ~ref_transcriptome
+          ~seq2fam
+          ~target_index:(Seq_dispatcher.target_index ~ref_transcriptome ~seq2fam)
+          ~ref_db
+          ~threads:(Int.min max_threads (threads * List.length queries))
+      )
+  in
+  assoc_map assemblies ~f:(fun (s : Rna_sample.t) _ ->
+      List.Assoc.find_exn ~equal:Poly.( = ) seq_dispatcher_dirs s.reference_species
     )
 
 (* This is needed by [build_target_query] to concat a list of fasta
@@ -289,51 +304,77 @@ let apytram_annotated_ref_fams_by_fam_by_groups (dataset : Dataset.t) configurat
 
 let checkfamily
     ?(descr="")
+    ?(threads = 1)
     ~ref_db
-    ~(input:fasta file)
-    ~family
+    ~(inputs : (Family.t * fasta file) list)
     ~ref_transcriptome
     ~seq2fam
     ~evalue
-  : fasta file =
+    ()
+  : [`checkfamily] directory =
   let open Bistro.Shell_dsl in
   let tmp_checkfamily = tmp // "tmp" in
-  let dest_checkfamily = dest // "sequences.fa" in
-
-  Workflow.shell ~version:8 ~descr:("CheckFamily.py" ^ descr) [
+  let manifest =
+    List.map inputs ~f:(fun ((f : Family.t), input) ->
+        seq ~sep:"\t" [ dep input ; string f.name ; dest // (f.name ^ ".fa") ]
+      )
+    |> seq ~sep:"\n"
+  in
+  Workflow.shell ~version:9 ~descr:("CheckFamily.py" ^ descr) ~np:threads [
+    mkdir_p dest;
     mkdir_p tmp_checkfamily;
     cd tmp_checkfamily;
     cmd "python" ~img:caars_img [
       file_dump (string Scripts.check_family);
       opt "-tmp" ident tmp_checkfamily ;
-      opt "-i" dep input;
+      opt "-manifest" file_dump manifest;
       opt "-t" dep ref_transcriptome ;
-      opt "-f" string family;
       opt "-t2f" dep seq2fam;
-      opt "-o" ident dest_checkfamily;
+      opt "-t2f_index" dep (Seq_dispatcher.target_index ~ref_transcriptome ~seq2fam);
       opt "-d" ident (seq ~sep:"," (List.map ref_db ~f:(fun blast_db -> seq [dep blast_db ; string "/db"]) ));
       opt "-e" float evalue;
+      opt "-threads" ident np;
     ]
   ]
-  |> Fn.flip Workflow.select [ "sequences.fa" ]
 
-let apytram_checked_families_of_orfs_ref_fams apytram_orfs_ref_fams configuration_dir ref_blast_dbs =
+let apytram_checked_families_of_orfs_ref_fams apytram_orfs_ref_fams configuration_dir ref_blast_dbs threads =
+  (* all the families of a sample are checked by a single run of
+     CheckFamily.py, which blasts their sequences at once *)
+  let samples =
+    List.concat_map apytram_orfs_ref_fams ~f:(fun (_, fws) ->
+        List.map fws ~f:(fun ((s : Rna_sample.t), _, _) -> s)
+      )
+    |> List.dedup_and_sort ~compare:(fun (s1 : Rna_sample.t) s2 -> String.compare s1.id s2.id)
+  in
+  let checked_samples =
+    List.map samples ~f:(fun (s : Rna_sample.t) ->
+        let inputs =
+          List.concat_map apytram_orfs_ref_fams ~f:(fun (_, fws) ->
+              List.filter_map fws ~f:(fun ((s' : Rna_sample.t), (f : Family.t), apytram_orfs_fasta) ->
+                  if String.(s'.id = s.id) then Some (f, apytram_orfs_fasta) else None
+                )
+            )
+        in
+        let tag = id_concat s.reference_species in
+        let ref_transcriptome =
+          List.map s.reference_species ~f:(Configuration_directory.ref_transcriptome configuration_dir)
+          |> fasta_concat ~tag:(tag ^ ".ref_transcriptome")
+        in
+        let seq2fam =
+          List.map s.reference_species ~f:(Configuration_directory.ref_seq_fam_links configuration_dir)
+          |> fasta_concat ~tag:(tag ^ ".seq2fam") in
+        let ref_db =
+          List.map s.reference_species ~f:(( $ ) ref_blast_dbs) in
+        let w =
+          checkfamily ~descr:(":"^s.id) ~threads ~inputs ~ref_transcriptome ~seq2fam ~ref_db ~evalue:1e-6 ()
+        in
+        (s.id, w)
+      )
+  in
   List.map apytram_orfs_ref_fams ~f:(fun (fam, fws) ->
-      let checked_fws = List.map fws ~f:(fun ((s : Rna_sample.t), (f : Family.t), apytram_orfs_fasta) ->
-          let input = apytram_orfs_fasta in
-          let tag = id_concat s.reference_species in
-          let ref_transcriptome =
-            List.map s.reference_species ~f:(Configuration_directory.ref_transcriptome configuration_dir)
-            |> fasta_concat ~tag:(tag ^ ".ref_transcriptome")
-          in
-          let seq2fam =
-            List.map s.reference_species ~f:(Configuration_directory.ref_seq_fam_links configuration_dir)
-            |> fasta_concat ~tag:(tag ^ ".seq2fam") in
-          let ref_db =
-            List.map s.reference_species ~f:(( $ ) ref_blast_dbs) in
-          let checked_families_fasta =
-            checkfamily ~descr:(":"^s.id^"."^f.name) ~input ~family:f.name ~ref_transcriptome ~seq2fam ~ref_db ~evalue:1e-6
-          in
+      let checked_fws = List.map fws ~f:(fun ((s : Rna_sample.t), (f : Family.t), _) ->
+          let w = List.Assoc.find_exn checked_samples ~equal:String.equal s.id in
+          let checked_families_fasta = Workflow.select w [ f.name ^ ".fa" ] in
           (s, f, checked_families_fasta)
         ) in
       (fam, checked_fws)
@@ -360,7 +401,7 @@ let parse_apytram_results apytram_annotated_ref_fams =
       (fam, fw)
     )
 
-let merged_families_of_families (dataset : Dataset.t) configuration_dir trinity_annotated_fams apytram_annotated_fams merge_criterion filter_threshold =
+let merged_families_of_families ?large_aligner ?large_family_size ?add_mode (dataset : Dataset.t) configuration_dir trinity_annotated_fams apytram_annotated_fams merge_criterion filter_threshold threads =
   List.map dataset.used_families ~f:(fun family ->
       let trinity_fam_results_dirs=
         List.map (Dataset.trinity_samples dataset) ~f:(fun s ->
@@ -372,9 +413,9 @@ let merged_families_of_families (dataset : Dataset.t) configuration_dir trinity_
       let alignment_sp2seq = Configuration_directory.ali_species2seq_links configuration_dir family.name  in
       let species_to_refine_list = List.map (Dataset.reference_samples dataset) ~f:(fun s -> s.species) in
       let w = if (List.length species_to_refine_list) = 0 then
-          Seq_integrator.seq_integrator ~realign_ali:false ~resolve_polytomy:true ~no_merge:true ~family:family.name ~trinity_fam_results_dirs ~apytram_results_dir ~alignment_sp2seq ~merge_criterion alignment
+          Seq_integrator.seq_integrator ~realign_ali:false ~resolve_polytomy:true ~no_merge:true ~threads ?large_aligner ?large_family_size ?add_mode ~family:family.name ~trinity_fam_results_dirs ~apytram_results_dir ~alignment_sp2seq ~merge_criterion alignment
         else
-          Seq_integrator.seq_integrator ~realign_ali:false ~resolve_polytomy:true ~species_to_refine_list ~family:family.name ~trinity_fam_results_dirs ~apytram_results_dir ~alignment_sp2seq ~merge_criterion alignment
+          Seq_integrator.seq_integrator ~realign_ali:false ~resolve_polytomy:true ~species_to_refine_list ~threads ?large_aligner ?large_family_size ?add_mode ~family:family.name ~trinity_fam_results_dirs ~apytram_results_dir ~alignment_sp2seq ~merge_criterion alignment
       in
       let tree = Seq_integrator.tree w family in
       let alignment = Seq_integrator.alignment w family in
@@ -382,7 +423,7 @@ let merged_families_of_families (dataset : Dataset.t) configuration_dir trinity_
 
       let wf =
         if List.length species_to_refine_list > 0 then
-          Some (Seq_integrator.seq_filter ~realign_ali:true ~resolve_polytomy:true ~filter_threshold ~species_to_refine_list ~family:family.name ~tree ~alignment ~sp2seq)
+          Some (Seq_integrator.seq_filter ~realign_ali:true ~resolve_polytomy:true ~filter_threshold ~species_to_refine_list ~threads ?large_aligner ?large_family_size ~family:family.name ~tree ~alignment ~sp2seq)
         else None
       in
       (family, w, wf )
@@ -544,6 +585,7 @@ let build_final_plots dataset orthologs_per_seq merged_reconciled_and_realigned_
 
 let make
     ?(memory = 4) ?(nthreads = 2)
+    ?large_aligner ?large_family_size ?add_mode ?collapse_queries
     ~merge_criterion ~filter_threshold
     ~refine_ali ~run_reconciliation
     (dataset : Dataset.t) =
@@ -563,14 +605,19 @@ let make
   let trinity_orfs = transdecoder_orfs_of_trinity_assemblies trinity_assemblies ~memory:memory_per_sample ~nthreads:threads_per_sample in
   let trinity_assemblies_stats = assemblies_stats_of_assemblies trinity_assemblies in
   let trinity_orfs_stats = assemblies_stats_of_assemblies trinity_orfs in
-  let trinity_annotated_fams = trinity_annotated_families_of_trinity_assemblies config_dir trinity_orfs ref_blast_dbs threads_per_sample in
+  let family_subset =
+    if List.length dataset.used_families < List.length dataset.all_families then
+      Some (List.map dataset.used_families ~f:(fun (f : Family.t) -> f.name))
+    else None
+  in
+  let trinity_annotated_fams = trinity_annotated_families_of_trinity_assemblies ?family_subset ?collapse_queries config_dir trinity_orfs ref_blast_dbs threads_per_sample nthreads in
   let reads_blast_dbs = blast_dbs_of_norm_fasta normalized_fasta_reads in
   let apytram_orfs_ref_fams =
     apytram_annotated_ref_fams_by_fam_by_groups dataset config_dir trinity_annotated_fams reads_blast_dbs memory_per_sample
   in
-  let apytram_checked_families = apytram_checked_families_of_orfs_ref_fams apytram_orfs_ref_fams config_dir ref_blast_dbs in
+  let apytram_checked_families = apytram_checked_families_of_orfs_ref_fams apytram_orfs_ref_fams config_dir ref_blast_dbs threads_per_sample in
   let apytram_annotated_families = parse_apytram_results apytram_checked_families in
-  let merged_families = merged_families_of_families dataset config_dir trinity_annotated_fams apytram_annotated_families merge_criterion filter_threshold in
+  let merged_families = merged_families_of_families ?large_aligner ?large_family_size ?add_mode dataset config_dir trinity_annotated_fams apytram_annotated_families merge_criterion filter_threshold threads_per_sample in
   let merged_and_reconciled_families = generax_by_fam_of_merged_families dataset merged_families memory nthreads in
   let merged_reconciled_and_realigned_families_dirs =
     merged_families_distributor dataset merged_and_reconciled_families ~refine_ali ~run_reconciliation
@@ -29,6 +29,10 @@ type t = {
 val make :
   ?memory:int ->
   ?nthreads:int ->
+  ?large_aligner:large_aligner ->
+  ?large_family_size:int ->
+  ?add_mode:add_mode ->
+  ?collapse_queries:query_collapse ->
   merge_criterion:merge_criterion ->
   filter_threshold:float ->
   refine_ali:bool ->
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# File: build_target_index.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+import sys
+import logging
+import argparse
+
+import BlastPlus
+import TargetIndex
+
+### Option defining
+parser = argparse.ArgumentParser(prog="build_target_index.py",
+                                 description='''
+    Compile the link file between the reference transcriptome and the
+    families in an index directory usable by SeqDispatcher.py and
+    CheckFamily.py (option -t2f_index).''')
+parser.add_argument('-t', '--target', type=str,
+                    help='Target fasta file name.', required=True)
+parser.add_argument('-t2f', '--ref_transcriptome2family', type=str,
+                    help='Link file name. A tabular file, each line correspond to a sequence name and its family. ', required=True)
+parser.add_argument('-o', '--output', type=str,
+                    help='Output index directory name.', required=True)
+
+args = parser.parse_args()
+
+### Set up the logger
+logger = logging.getLogger("main")
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+ch.setFormatter(formatter)
+logger.addHandler(ch)
+
+(TargetCodes, MissingTargets, DuplicatedTargets) = TargetIndex.load_or_build(args.output, args.target, args.ref_transcriptome2family,
+                                                                              BlastPlus.file_fingerprint([args.target, args.ref_transcriptome2family]))
+if MissingTargets:
+    logger.warning("These targets are not present in the target2family link file, they will be added:\n\t- %s", "\n\t- ".join(MissingTargets))
+if DuplicatedTargets:
+    logger.error("There are not unique target names")
+    sys.exit(1)
@@ -40,11 +40,12 @@ import tempfile
 import shutil
 import logging
 import argparse
-import subprocess
 
-import pandas
 
 import BlastPlus
+import Fasta
+import HitAssignment
+import TargetIndex
 
 start_time = time.time()
 
@@ -58,21 +59,25 @@ parser.add_argument('--version', action='version', version='%(prog)s 1.0')
 ##############
 requiredOptions = parser.add_argument_group('Required arguments')
 requiredOptions.add_argument('-i', '--input', type=str,
-                             help='fasta file name.', required=True)
+                             help='fasta file name.', required=False)
 requiredOptions.add_argument('-t', '--ref_transcriptome', type=str,
                              help='Target fasta file name', required=True)
 requiredOptions.add_argument('-f', '--family', type=str,
-                             help='family name', required=True)
+                             help='family name', required=False)
 requiredOptions.add_argument('-d', '--database', type=str,
                              help='''Database prefix name of the ref transcriptome fasta file.
                               If a database with the same name already exists,
                               the existing database will be kept and the database will NOT be rebuilt.
                               (default=: The database will be build in the temporary directory and will be remove at the end.)''',
                               required=False)
+requiredOptions.add_argument('-t2f_index', type=str, default="",
+                             help='Directory of the compiled index of the link file, built if it does not exist or if the link file or the ref transcriptome fasta file changed. (default: next to the first database if writable, else in the temporary directory)')
 requiredOptions.add_argument('-t2f', '--ref_transcriptome2family', type=str,
                              help='Link file name. A tabular file, each line correspond to a sequence name and its family. ', required=True)
 requiredOptions.add_argument('-o', '--output', type=str, default="./output.fa",
                    help="Output name (default= ./output.fa)")
+requiredOptions.add_argument('-manifest', type=str, default="",
+                   help="Tabular file of the fasta files to check, each line contains a fasta file name, its family and its output name. All the fasta files are blasted at once. Replace -i, -f and -o.")
 ##############
 
 
@@ -81,6 +86,17 @@ Options = parser.add_argument_group('Options')
 Options.add_argument('-e', '--evalue', type=float,
                      help="Evalue threshold of the blastn of the queries on the database of the ref transcriptome. (default= 1e-3)",
                      default=1e-3)
+Options.add_argument('-blast_cache', type=str, default="",
+                     help="Directory of a blast hit cache shared between runs, only query sequences not already blasted with the same database and options are blasted. (default: no cache)")
+Options.add_argument('-blast_cache_size', type=int, default=2000,
+                     help="Maximal size of the blast hit cache in MB, the least recently used hits are removed. (default= 2000)")
+Options.add_argument('-db_registry', type=str, default="",
+                     help="Directory of a blast database registry shared between runs. Databases are only checked again with blastdbcmd when their files change and a missing target database is built once in the registry for all runs. (default: no registry)")
+
+Options.add_argument('-threads', type=int,
+                     help="Number of available threads. (default= 1)",
+                     default=1)
+
 Options.add_argument('-tmp', type=str,
                      help="Directory to stock all intermediary files for the job. (default=: a directory in /tmp which will be removed at the end)",
                      default="")
@@ -99,10 +115,7 @@ MiscellaneousOptions.add_argument('--debug', action='store_true', default=False,
 args = parser.parse_args()
 
 ### Read arguments
-FastaFile = args.input
-OutputFasta = args.output
 TargetFile = args.ref_transcriptome
-ExpectedFamily = args.family
 Target2FamilyFilename = args.ref_transcriptome2family
 
 Evalue = args.evalue
@@ -160,24 +173,36 @@ def end(exit_code):
             shutil.rmtree(TmpDirName)
     sys.exit(exit_code)
 
-### Set up the output directory
-if args.output and os.path.dirname(args.output):
-    OutDirName = os.path.dirname(args.output)
-    OutName = args.output
-    if os.path.isdir(OutDirName):
-        logger.info("The output directory %s exists", os.path.dirname(args.output))
-    elif OutDirName: # if OutDirName is not a empty string we create the directory
-        logger.info("The output directory %s does not exist, it will be created", os.path.dirname(args.output))
-        os.makedirs(os.path.dirname(args.output))
+### Read the fasta files to check: (fasta file, expected family, output name)
+Jobs = []
+if args.manifest:
+    with open(args.manifest) as ManifestFile:
+        for Line in ManifestFile:
+            if Line.strip():
+                Jobs.append(tuple(Line.rstrip("\n").split("\t")[:3]))
+elif args.input and args.family:
+    Jobs.append((args.input, args.family, args.output))
 else:
-    logger.error("The output prefix must be defined")
+    logger.error("-i and -f (or -manifest) must be defined")
     end(1)
 
-### Check that input files exist
-if not os.path.isfile(args.input):
-    logger.error(args.input + " (-q) is not a file.")
-    end(1)
+### Set up the output directories
+for (FastaFile, _, OutputFasta) in Jobs:
+    if not OutputFasta or not os.path.dirname(OutputFasta):
+        logger.error("The output prefix must be defined")
+        end(1)
+    OutDirName = os.path.dirname(OutputFasta)
+    if os.path.isdir(OutDirName):
+        logger.info("The output directory %s exists", OutDirName)
+    else:
+        logger.info("The output directory %s does not exist, it will be created", OutDirName)
+        os.makedirs(OutDirName)
 
+### Check that input files exist
+for (FastaFile, _, _) in Jobs:
+    if not os.path.isfile(FastaFile):
+        logger.error(FastaFile + " (-i) is not a file.")
+        end(1)
 
 if not os.path.isfile(args.ref_transcriptome):
     logger.error(args.ref_transcriptome + " (-t) is not a file.")
@@ -188,50 +213,31 @@ if not os.path.isfile(args.ref_transcriptome2family):
     end(1)
 
 ### Parse input fasta files
-## Get query names
+## Get query names, the query headers and sequences are kept to write the retained ones
 logger.info("Get query names")
-BashProcess = subprocess.Popen(["grep", "-e", "^>", args.input],
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-OutBashProcess = BashProcess.communicate()
-if not OutBashProcess[1]:
-    QueryNames = OutBashProcess[0].strip().replace(">", "").split("\n")
-    logger.debug("query: %s", "\n".join(QueryNames))
-else:
-    logger.error(OutBashProcess[1])
-    end(1)
-
-## Get ref_transcriptome sequence names
-logger.info("Get ref_transcriptome names")
-BashProcess = subprocess.Popen(["grep", "-e", "^>",
-                                 args.ref_transcriptome],
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE)
-OutBashProcess = BashProcess.communicate()
-if not  OutBashProcess[1]:
-    TargetNames = OutBashProcess[0].strip().replace(">", "").split("\n")
+QueryNames = []
+QueryRecords = []
+DuplicatedQueries = []
+for (FastaFile, _, _) in Jobs:
+    QueryNames.append([])
+    QueryRecords.append({})
+    DuplicatedQueries.append(set())
+    for (Query, Header, Sequence) in Fasta.iter_fasta_headers(FastaFile):
+        if Query in QueryRecords[-1]:
+            DuplicatedQueries[-1].add(Query)
+        QueryNames[-1].append(Query)
+        QueryRecords[-1][Query] = (Header, Sequence)
+if len(Jobs) == 1:
+    QueryFile = Jobs[0][0]
+    logger.debug("query: %s", "\n".join(QueryNames[0]))
 else:
-    logger.error(OutBashProcess[1])
-    end(1)
-
-### Parse the ref_transcriptome2family, create dictionnaries target2family and family2target
-Target2FamilyTable = pandas.read_csv(Target2FamilyFilename,
-                                      sep=None, engine='python',
-                                      header=None,
-                                      names=["Target", "Family"])
-
-# Check if there are no missing data
-MissingTargets = [target for target in TargetNames if not target in Target2FamilyTable.Target.values]
-if MissingTargets:
-    logger.warning("These targets are not present in the target2family link file, they will be added:\n\t- %s", "\n\t- ".join(MissingTargets))
-    MissingData = pandas.DataFrame({"Target" : MissingTargets,
-                                     "Family": MissingTargets})
-    Target2FamilyTable = pandas.concat([Target2FamilyTable, MissingData], ignore_index=True)
-
-
-if len(Target2FamilyTable['Target']) != len(Target2FamilyTable['Target'].unique()):
-    logger.error("There are not unique target names")
-    end(1)
+    # Blast the queries of all fasta files at once, query names are prefixed by J<job index>_
+    logger.info("Concatenate the queries of %s fasta files", len(Jobs))
+    QueryFile = "%s/Queries.fa" %(TmpDirName)
+    with open(QueryFile, "w") as AllQueryFile:
+        for (JobIndex, Names) in enumerate(QueryNames):
+            for Query in Names:
+                AllQueryFile.write(Fasta.format_fasta("J%s_%s" %(JobIndex, Query), QueryRecords[JobIndex][Query][1]))
 
 ### Check that there is a target database, otherwise build it
 logger.info("Check that there is a target database, otherwise build it")
@@ -243,14 +249,31 @@ if not args.database:
 else:
     Databases.extend(args.database.split(","))
 
+if args.db_registry:
+    Registry = BlastPlus.DatabaseRegistry(args.db_registry)
+    is_database = Registry.is_database
+else:
+    Registry = None
+    is_database = lambda DatabaseName: BlastPlus.Blastdbcmd(DatabaseName, "", "").is_database()
+
 Not_correct_database = False
 for DatabaseName in Databases:
-    CheckDatabase_BlastdbcmdProcess = BlastPlus.Blastdbcmd(DatabaseName, "", "")
-    if not CheckDatabase_BlastdbcmdProcess.is_database():
+    if not is_database(DatabaseName):
         logger.info("Database %s does not exist", DatabaseName)
         Not_correct_database = True
 
-if Not_correct_database:
+if Not_correct_database and Registry:
+    #Get the database of the fasta file from the registry, built once for all runs
+    if not os.path.isfile(TargetFile):
+       logger.error("The fasta file (-t) does not exist.")
+       end(1)
+    DatabaseName = Registry.database(TargetFile)
+    if not DatabaseName:
+        end(1)
+    Databases = [DatabaseName]
+    logger.info("Database %s exists", DatabaseName)
+
+elif Not_correct_database:
     #Build blast formated database from a fasta file
     if not os.path.isfile(TargetFile):
        logger.error("The fasta file (-t) does not exist.")
@@ -273,8 +296,6 @@ if Not_correct_database:
     if err:
         end(1)
 
-
-for DatabaseName in Databases:
     CheckDatabase_BlastdbcmdProcess = BlastPlus.Blastdbcmd(DatabaseName, "", "")
     if not CheckDatabase_BlastdbcmdProcess.is_database():
         logger.error("Problem in the database building")
@@ -283,27 +304,48 @@ for DatabaseName in Databases:
     else:
         logger.info("Database %s exists", DatabaseName)
 
+### Load the target -> family index of the ref_transcriptome2family, otherwise build it
+TargetIndexDirName = args.t2f_index or "%s.t2f_index" %(Databases[0])
+# An existing given index is a dependency: if it is outdated, it is rebuilt in the temporary directory
+TargetIndexBuildDirName = "%s/Target.t2f_index" %(TmpDirName)
+if (not args.t2f_index or not os.path.exists(TargetIndexDirName)) and \
+   os.access(os.path.dirname(os.path.abspath(TargetIndexDirName)), os.W_OK):
+    TargetIndexBuildDirName = TargetIndexDirName
+(TargetCodes, MissingTargets, DuplicatedTargets) = TargetIndex.load_or_build(TargetIndexDirName, TargetFile, Target2FamilyFilename,
+                                                                              BlastPlus.file_fingerprint([TargetFile, Target2FamilyFilename]),
+                                                                              BuildDirName=TargetIndexBuildDirName)
+if MissingTargets:
+    logger.warning("These targets are not present in the target2family link file, they will be added:\n\t- %s", "\n\t- ".join(MissingTargets))
+if DuplicatedTargets:
+    logger.error("There are not unique target names")
+    end(1)
+
 ### Blast the query fasta on the target database
 logger.info("Blast the query fasta on the target database")
 start_blast_time = time.time()
 BlastOutputFile = "%s/Queries_Targets.blast" %(TmpDirName)
-BlastnProcess = BlastPlus.Blast("blastn", FastaFile, db_list=Databases)
+BlastnProcess = BlastPlus.Blast("blastn", QueryFile, db_list=Databases)
 BlastnProcess.Evalue = Evalue
 BlastnProcess.Task = "blastn"
 BlastnProcess.max_target_seqs = 100
 BlastnProcess.max_hsps_per_subject = 1
+BlastnProcess.Threads = args.threads
 BlastnProcess.OutFormat = "6"
 BlastnProcess.Strand = "plus"
+if args.blast_cache:
+    BlastnProcess.Cache = BlastPlus.BlastCache(args.blast_cache)
+    BlastnProcess.Cache.MaxSize = args.blast_cache_size * 1024 * 1024
 
-# Write an empty output file to be sure
-OutputFile = open(OutputFasta, "w")
-OutputFile.write("")
-OutputFile.close()
+# Write empty output files to be sure
+for (_, _, OutputFasta) in Jobs:
+    OutputFile = open(OutputFasta, "w")
+    OutputFile.write("")
+    OutputFile.close()
 
 # Write blast ouptut in BlastOutputFile if the file does not exist
-logger.debug("%s : %s", FastaFile, os.stat(FastaFile).st_size)
+logger.debug("%s : %s", QueryFile, os.stat(QueryFile).st_size)
 
-if os.stat(FastaFile).st_size == 0:
+if os.stat(QueryFile).st_size == 0:
     logger.info("Empty query file")
     end(0)
 else:
@@ -318,89 +360,62 @@ if not os.stat(BlastOutputFile).st_size:
 logger.debug("blast --- %s seconds ---", str(time.time() - start_blast_time))
 
 ### Parse blast results
-# Fields: query id, subject id, % identity, alignment length, mismatches, gap opens, q. start, q. end, s. start, s. end, evalue, bit score
-FieldNames = ["qid", "tid", "id", "alilen", "mis", "gap", "qstart", "qend", "tstart", "tend", "evalue", "score"]
-BlastTable = pandas.read_csv(BlastOutputFile, sep=None, engine='python', header=None, names=FieldNames)
+BlastTable = HitAssignment.read_blast_table(BlastOutputFile)
 
 # Get Family for each Target:
-BlastTableWithFamilies = pandas.merge(BlastTable, Target2FamilyTable, how='left', left_on=['tid'], right_on=['Target'])
+BlastTableWithFamilies = TargetCodes.add_families(BlastTable)
+if len(Jobs) == 1:
+    JobTables = {0: BlastTableWithFamilies}
+else:
+    QueryParts = BlastTableWithFamilies.qid.str.split("_", n=1, expand=True)
+    BlastTableWithFamilies = BlastTableWithFamilies.assign(qid=QueryParts[1].values)
+    JobTables = dict(list(BlastTableWithFamilies.groupby(QueryParts[0].str[1:].astype(int).values)))
+
+def job_tmp_dir(JobIndex):
+    if len(Jobs) == 1:
+        return TmpDirName
+    JobTmpDirName = "%s/%s" %(TmpDirName, JobIndex)
+    if not os.path.isdir(JobTmpDirName):
+        os.makedirs(JobTmpDirName)
+    return JobTmpDirName
 
 ### First: Find the best hit for each Query sequences and check family
 logger.info("First Step")
-RetainedQuery = []
-DiscardedQuery = []
-for Query in QueryNames:
-    Query = Query.split()[0]
-    logger.debug("Query: %s", Query)
-    TmpTable = BlastTableWithFamilies[BlastTableWithFamilies.qid == Query]
-    if len(TmpTable.index):
-        TmpBestScore = max(TmpTable.score)
-
-        BestTargetTable = TmpTable[TmpTable.score == TmpBestScore]
-        BestTargetTable.is_copy = False
-
-        logger.debug(BestTargetTable)
-        TmpFamily = BestTargetTable["Family"].unique()
-        Family = TmpFamily[0]
-        logger.debug("Family: %s", " ".join(TmpFamily))
-        if len(TmpFamily) > 1:
-            logger.info("More than one family can be attributed to %s:\n\t- %s\nIt will be discarded.", Query, "\n\t- ".join(TmpFamily))
-            DiscardedQuery.append(Query + "\t" + ",".join(TmpFamily))
-        elif Family != ExpectedFamily:
-            logger.info("Observed family (%s) is different of the expected family (%s). %s will be discarded.", Family, ExpectedFamily, Query)
-            DiscardedQuery.append(Query + "\t" + Family)
-        else:
-            RetainedQuery.append(Query)
-    logger.debug("end: %s", Query)
-
-
-DiscardedFilename = "%s/%s_discarded_sequences_names.txt" %(TmpDirName, Family)
-TmpFile = open(DiscardedFilename, "w")
-TmpFile.write("\n".join(DiscardedQuery))
-TmpFile.close()
-
-if not RetainedQuery:
-    end(0)
-
-### Second : Build a query database
-# Build a query database
-logger.info("Build a query database")
-QueryDatabaseName = "%s/Query_DB" %TmpDirName
-if not os.path.isfile(FastaFile):
-    logger.error("The query fasta file (-i) does not exist.")
-    end(1)
-# database building
-logger.info(QueryDatabaseName + " database building")
-MakeblastdbProcess = BlastPlus.Makeblastdb(FastaFile, QueryDatabaseName)
-ExitCode = MakeblastdbProcess.launch()
-
-CheckDatabase_BlastdbcmdProcess = BlastPlus.Blastdbcmd(QueryDatabaseName, "", "")
-if not CheckDatabase_BlastdbcmdProcess.is_database():
-    logger.error("Problem in the database building")
-    logger.info("Database %s does not exist", QueryDatabaseName)
-    end(1)
-else:
-    logger.info("Database %s exists", QueryDatabaseName)
-
-## Third step: write a fasta which contained all retained sequences
+RetainedJobs = []
+for (JobIndex, (FastaFile, Family, OutputFasta)) in enumerate(Jobs):
+    if not JobIndex in JobTables:
+        continue
+    logger.info("Check %s (%s)", FastaFile, Family)
+    (RetainedQuery, DiscardedQuery) = HitAssignment.check_families(JobTables[JobIndex], QueryNames[JobIndex], Family)
+
+    DiscardedFilename = "%s/%s_discarded_sequences_names.txt" %(job_tmp_dir(JobIndex), Family)
+    TmpFile = open(DiscardedFilename, "w")
+    TmpFile.write("\n".join(DiscardedQuery))
+    TmpFile.close()
+
+    if RetainedQuery:
+        RetainedJobs.append((JobIndex, RetainedQuery))
+del JobTables
+
+# blastdbcmd writes the name and the title of a sequence and the upper case
+# sequence by lines of 80 characters
+BlastdbcmdWidth = 80
+
+def format_blastdbcmd(Header, Sequence):
+    Header = " ".join(Header.split(None, 1))
+    return Fasta.format_fasta(Header, Sequence.upper(), width=BlastdbcmdWidth)
+
+### Second: write a fasta which contained all retained sequences, as blastdbcmd
+### on a database of the fasta file would
 logger.info("Write output files")
-
-#Get retained sequences names
-start_blastdbcmd_time = time.time()
-TmpFilename = "%s/%s_sequences_names.txt" %(TmpDirName, Family)
-TmpFile = open(TmpFilename, "w")
-TmpFile.write("\n".join(RetainedQuery))
-TmpFile.close()
-
-#Get retained sequences
-BlastdbcmdProcess = BlastPlus.Blastdbcmd(QueryDatabaseName, TmpFilename, "")
-BlastdbcmdProcess.OutputFile = OutputFasta
-
-(out, err) = BlastdbcmdProcess.launch()
-
-if err:
-    end(1)
-logger.debug("blastdbcmd --- %s seconds ---", time.time() - start_blastdbcmd_time)
+for (JobIndex, RetainedQuery) in RetainedJobs:
+    (FastaFile, Family, OutputFasta) = Jobs[JobIndex]
+    if DuplicatedQueries[JobIndex]:
+        logger.error("There are not unique query names in %s:\n\t- %s", FastaFile, "\n\t- ".join(sorted(DuplicatedQueries[JobIndex])))
+        end(1)
+    with open(OutputFasta, "w") as OutputFile:
+        for Query in RetainedQuery:
+            OutputFile.write(format_blastdbcmd(*QueryRecords[JobIndex][Query]))
 
 logger.info("--- %s seconds ---", str(time.time() - start_time))
 
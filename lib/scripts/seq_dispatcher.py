@@ -35,18 +35,29 @@
 
 import os
 import sys
+import copy
+import collections
+import bisect
+import resource
+import itertools
 import time
-import string
+import random
 import tempfile
 import shutil
 import logging
 import argparse
 import subprocess
-import re
 
-import pandas
 
 import BlastPlus
+import Collapser
+import Demultiplexer
+import Fasta
+import FastSearch
+import HitAssignment
+import TargetIndex
+import KmerIndex
+import Metrics
 
 
 
@@ -63,11 +74,16 @@ parser.add_argument('--version', action='version', version='%(prog)s 1.0')
 ##############
 requiredOptions = parser.add_argument_group('Required arguments')
 requiredOptions.add_argument('-q', '--query', type=str,
-                             help='Query fasta file name.', required=True)
+                             help='Query fasta file name.', required=False)
 requiredOptions.add_argument('-qs', '--query_species', type=str,
-                             help='query species', required=True)
+                             help='query species', required=False)
 requiredOptions.add_argument('-qid', '--query_id', type=str,
-                             help='query unique id', required=True)
+                             help='query unique id', required=False)
+requiredOptions.add_argument('-sample', type=str, nargs=3, action='append', default=[],
+                             metavar=("QUERY", "SPECIES", "ID"),
+                             help='''A query fasta file name, its species and its unique id, instead of -q, -qs and -qid.
+                              This option can be repeated to search the queries of several samples in one run,
+                              the output prefix of each sample is then <output_prefix>.<ID>.<SPECIES>.''')
 requiredOptions.add_argument('-t', '--ref_transcriptome', type=str,
                              help='Target fasta file name', required=True)
 requiredOptions.add_argument('-d', '--database', type=str,
@@ -76,6 +92,8 @@ requiredOptions.add_argument('-d', '--database', type=str,
                               the existing database will be kept and the database will NOT be rebuilt.
                               (default=: The database will be build in the temporary directory and will be remove at the end.)''',
                               required=False)
+requiredOptions.add_argument('-t2f_index', type=str, default="",
+                             help='Directory of the compiled index of the link file, built if it does not exist or if the link file or the ref transcriptome fasta file changed. (default: next to the first database if writable, else in the temporary directory)')
 requiredOptions.add_argument('-t2f', '--ref_transcriptome2family', type=str,
                              help='Link file name. A tabular file, each line correspond to a sequence name and its family. ', required=True)
 requiredOptions.add_argument('-out', '--output_prefix', type=str, default="./output",
@@ -95,6 +113,46 @@ Options.add_argument('-e', '--evalue', type=float,
                      help="Evalue threshold of the blastn of the queries on the database of the ref transcriptome. (default= 1e-6)",
                      default=1e-6)
 
+Options.add_argument('-search_backend', type=str, choices=["blastn", "mmseqs", "minimap2"], default="blastn",
+                     help="Program used to search the queries on the ref transcriptome. mmseqs and minimap2 outputs are converted in blast tabular hits. (default: blastn)")
+Options.add_argument('-backend_check_sample', type=int, default=200,
+                     help="Number of queries also blasted to report the agreement between the search backend and blastn, 0 to disable. (default= 200)")
+
+Options.add_argument('--kmer_prefilter', action='store_true', default=False,
+                     help="Assign directly the queries whose minimizers shared with the ref transcriptome point to a unique family and orientation, discard the queries without shared minimizer and search only the others. The scores of the assigned queries are estimated, they are only compared between them to retain the queries of a target. (default: False)")
+Options.add_argument('-kmer_index', type=str, default="",
+                     help="Minimizer index file of the ref transcriptome, built if it does not exist. (default: next to the first database if writable, else in the temporary directory)")
+Options.add_argument('-kmer_size', type=int, default=15,
+                     help="k-mer size of the minimizers (default= 15)")
+Options.add_argument('-kmer_window', type=int, default=10,
+                     help="Number of consecutive k-mers in which a minimizer is selected (default= 10)")
+
+Options.add_argument('--collapse_duplicates', action='store_true', default=False,
+                     help="Search only one representative of the identical query sequences, the hits of the representative are given to the other sequences. (default: False)")
+Options.add_argument('--collapse_contained', action='store_true', default=False,
+                     help="As --collapse_duplicates, and also search only the longest isoforms of a Trinity gene containing the other isoforms, the hits of a contained isoform are clipped to its part of the longest isoform and kept if their recomputed evalue passes the threshold. These hits are approximate: a direct search of the contained isoforms may give them other families. Only the identical queries are collapsed with the mmseqs and minimap2 backends. (default: False)")
+
+Options.add_argument('-family_subset', '--family-subset', type=str, default="",
+                     help="File of the used families, one by line. The queries are first searched on a database of the targets of these families only, and only the queries with a hit are searched on the whole ref transcriptome, so that a query also similar to another family is still discarded. The queries attributed to other families are not written. (default: all families)")
+Options.add_argument('-subset_db', type=str, default="",
+                     help="Prefix of the database of the targets of the used families, built if it does not exist or if the families, the link file or the ref transcriptome fasta file changed. (default: in the temporary directory)")
+Options.add_argument('-search_direction', type=str, choices=["auto", "forward", "reverse"], default="forward",
+                     help="With -family_subset, search the queries on a database of the targets of the used families (forward) or these targets on a database of the queries (reverse). auto chooses the direction with the smallest estimated cost from the numbers and the lengths of the sequences. The reverse search is approximate: the low complexity filter and the e-values are those of the targets, so it may miss queries found by the forward search. (default: forward)")
+Options.add_argument('-query_db', type=str, default="",
+                     help="Prefix of the database of the queries for the reverse search, built if it does not exist or if the queries changed. (default: in the temporary directory)")
+
+Options.add_argument('--stream_blast', action='store_true', default=False,
+                     help="Parse the blast output while the blast is running, without writing it in the temporary directory. (default: False)")
+Options.add_argument('--blast_chunksize', type=int, default=100000,
+                     help="Number of blast hits parsed at once with --stream_blast. (default= 100000)")
+
+Options.add_argument('-blast_cache', type=str, default="",
+                     help="Directory of a blast hit cache shared between runs, only query sequences not already blasted with the same database and options are blasted. (default: no cache)")
+Options.add_argument('-blast_cache_size', type=int, default=2000,
+                     help="Maximal size of the blast hit cache in MB, the least recently used hits are removed. (default= 2000)")
+Options.add_argument('-db_registry', type=str, default="",
+                     help="Directory of a blast database registry shared between runs. Databases are only checked again with blastdbcmd when their files change and a missing target database is built once in the registry for all runs. (default: no registry)")
+
 Options.add_argument('-tmp', type=str,
                      help="Directory to stock all intermediary files for the job. (default=: a directory in /tmp which will be removed at the end)",
                      default="")
@@ -108,6 +166,16 @@ MiscellaneousOptions = parser.add_argument_group('Miscellaneous options')
 MiscellaneousOptions.add_argument('-threads', type=int,
                                   help="Number of available threads. (default= 1)",
                                   default=1)
+MiscellaneousOptions.add_argument('-blast_shards', type=int,
+                                  help="Split the queries in this number of shards blasted in parallel, the threads are shared between shards. (default= 1)",
+                                  default=1)
+MiscellaneousOptions.add_argument('-db_volumes', type=int,
+                                  help="Split the target database built from the ref transcriptome in this number of volumes of similar length and blast the queries on the volumes in parallel, the threads are shared between volumes. The effective search space of each query on the whole database is given to the blasts of the volumes, so the hits are those of a single database, but each volume is blasted once by query length. (default= 1)",
+                                  default=1)
+MiscellaneousOptions.add_argument('-max_memory', '--max-memory', type=int, default=0,
+                                  help="Memory budget in MB for large assemblies. The hits are parsed by chunks of queries sized from the budget. The best hits are kept in memory until the resident memory of the process is above the budget, then on disk in buckets of families until the end. The query names, the target index and the output buffers are not bounded. (default: 0, no budget)")
+MiscellaneousOptions.add_argument('-metrics_json', '--metrics-json', type=str, default="",
+                                  help="Write in this JSON file the wall time, the CPU time and the resident memory at the end of each stage (query names, database check or building, target index, prefilter, search, parsing, assignment, retention and output) and the number of queries, hits, queries without hit, queries attributed to several families by threshold, retained queries by family and reversed queries. The peak resident memory is given for the whole process. (default: no file)")
 MiscellaneousOptions.add_argument('--debug', action='store_true', default=False,
                    help="debug mode, default False")
 ##############
@@ -116,9 +184,6 @@ MiscellaneousOptions.add_argument('--debug', action='store_true', default=False,
 args = parser.parse_args()
 
 ### Read arguments
-QueryFile = args.query
-SpeciesQuery = args.query_species
-SpeciesID = args.query_id
 TargetFile = args.ref_transcriptome
 Target2FamilyFilename = args.ref_transcriptome2family
 
@@ -158,6 +223,8 @@ logger.addHandler(ch)
 
 logger.info(" ".join(sys.argv))
 
+RunMetrics = Metrics.StageMetrics("SeqDispatcher.py")
+
 ### Set up the working directory
 if args.tmp:
     if os.path.isdir(args.tmp):
@@ -170,6 +237,8 @@ else:
     TmpDirName = tempfile.mkdtemp(prefix='tmp_SeqDispatcher')
 
 def end(exit_code):
+    if args.metrics_json:
+        RunMetrics.write(args.metrics_json, exit_code)
     ### Remove tempdir if the option --tmp have not been use
     if not args.tmp:
         logger.debug("Remove the temporary directory")
@@ -191,10 +260,23 @@ else:
     logger.error("The output prefix must be defined")
     end(1)
 
-### Check that input files exist
-if not os.path.isfile(args.query):
-    logger.error(args.query + " (-q) is not a file.")
+### Set up the samples: (query file, species, id, output prefix)
+if args.sample and (args.query or args.query_species or args.query_id):
+    logger.error("-sample can not be used with -q, -qs and -qid")
     end(1)
+elif args.sample:
+    Samples = [(Query, Species, ID, "%s.%s.%s" %(OutPrefixName, ID, Species)) for (Query, Species, ID) in args.sample]
+elif args.query and args.query_species and args.query_id:
+    Samples = [(args.query, args.query_species, args.query_id, OutPrefixName)]
+else:
+    logger.error("-q, -qs and -qid (or at least one -sample) must be defined")
+    end(1)
+
+### Check that input files exist
+for (Query, _, _, _) in Samples:
+    if not os.path.isfile(Query):
+        logger.error(Query + " (-q) is not a file.")
+        end(1)
 
 if not os.path.isfile(args.ref_transcriptome):
     logger.error(args.ref_transcriptome + " (-t) is not a file.")
@@ -207,53 +289,35 @@ if not os.path.isfile(args.ref_transcriptome2family):
 ### Parse input fasta files
 ## Get query names
 logger.info("Get query names")
-BashProcess = subprocess.Popen(["grep", "-e", "^>", args.query],
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-OutBashProcess = BashProcess.communicate()
-if not  OutBashProcess[1]:
-    QueryNames = OutBashProcess[0].strip().replace(">", "").split("\n")
-else:
-    logger.error(OutBashProcess[1])
-    end(1)
-
-## Get ref_transcriptome sequence names
-logger.info("Get ref_transcriptome names")
-BashProcess = subprocess.Popen(["grep", "-e", "^>",
-                                 args.ref_transcriptome],
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE)
-OutBashProcess = BashProcess.communicate()
-if not  OutBashProcess[1]:
-    TargetNames = OutBashProcess[0].strip().replace(">", "").split("\n")
+RunMetrics.start("query_names")
+SampleStarts = [0]
+if len(Samples) == 1:
+    QueryFile = Samples[0][0]
+    BashProcess = subprocess.Popen(["grep", "-e", "^>", QueryFile],
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    OutBashProcess = BashProcess.communicate()
+    if not  OutBashProcess[1]:
+        QueryNames = OutBashProcess[0].strip().replace(">", "").split("\n")
+    else:
+        logger.error(OutBashProcess[1])
+        end(1)
 else:
-    logger.error(OutBashProcess[1])
-    end(1)
-
-### Parse the ref_transcriptome2family
-Target2FamilyTable = pandas.read_csv(Target2FamilyFilename,
-                                      sep=None, engine='python',
-                                      header=None,
-                                      names=["Target", "Family"])
-
-# Check if there are no missing data
-MissingTargets = [target for target in TargetNames if not target in Target2FamilyTable.Target.values]
-if MissingTargets:
-    logger.warning("These targets are not present in the target2family link file, they will be added:\n\t- %s", "\n\t- ".join(MissingTargets))
-    MissingData = pandas.DataFrame({"Target" : MissingTargets,
-                                     "Family": MissingTargets})
-    Target2FamilyTable = pandas.concat([Target2FamilyTable, MissingData], ignore_index=True)
-
-
-if len(Target2FamilyTable['Target']) != len(Target2FamilyTable['Target'].unique()):
-    logger.error("There are not unique target names")
-    end(1)
-Target2FamilyDic = Target2FamilyTable.set_index('Target').T.to_dict('list')
-
-
+    # Search the queries of all samples at once, query names are prefixed by S<sample index>_
+    logger.info("Concatenate the queries of %s samples", len(Samples))
+    QueryFile = "%s/Queries.fa" %(TmpDirName)
+    QueryNames = []
+    SampleStarts = []
+    with open(QueryFile, "w") as AllQueryFile:
+        for (SampleIndex, Sample) in enumerate(Samples):
+            SampleStarts.append(len(QueryNames))
+            for (Query, Sequence) in Fasta.iter_fasta(Sample[0]):
+                QueryNames.append("S%s_%s" %(SampleIndex, Query))
+                AllQueryFile.write(Fasta.format_fasta(QueryNames[-1], Sequence))
 
 ### Check that there is a target database, otherwise build it
 logger.info("Check that there is a target database, otherwise build it")
+RunMetrics.start("database_check")
 
 Databases = []
 
@@ -262,14 +326,32 @@ if not args.database:
 else:
     Databases.extend(args.database.split(","))
 
+if args.db_registry:
+    Registry = BlastPlus.DatabaseRegistry(args.db_registry)
+    Registry.VolumeNb = args.db_volumes
+    is_database = Registry.is_database
+else:
+    Registry = None
+    is_database = lambda DatabaseName: BlastPlus.Blastdbcmd(DatabaseName, "", "").is_database()
+
 Not_correct_database = False
 for DatabaseName in Databases:
-    CheckDatabase_BlastdbcmdProcess = BlastPlus.Blastdbcmd(DatabaseName, "", "")
-    if not CheckDatabase_BlastdbcmdProcess.is_database():
+    if not is_database(DatabaseName):
         logger.info("Database %s does not exist", DatabaseName)
         Not_correct_database = True
 
-if Not_correct_database:
+if Not_correct_database and Registry:
+    #Get the database of the fasta file from the registry, built once for all runs
+    if not os.path.isfile(TargetFile):
+       logger.error("The fasta file (-t) does not exist.")
+       end(1)
+    DatabaseName = Registry.database(TargetFile)
+    if not DatabaseName:
+        end(1)
+    Databases = [DatabaseName]
+    logger.info("Database %s exists", DatabaseName)
+
+elif Not_correct_database:
     #Build blast formated database from a fasta file
     if not os.path.isfile(TargetFile):
        logger.error("The fasta file (-t) does not exist.")
@@ -287,13 +369,14 @@ if Not_correct_database:
         os.makedirs(os.path.dirname(DatabaseName))
     # database building
     logger.info(DatabaseName + " database building")
+    RunMetrics.start("makeblastdb")
     MakeblastdbProcess = BlastPlus.Makeblastdb(TargetFile, DatabaseName)
+    MakeblastdbProcess.VolumeNb = args.db_volumes
+    MakeblastdbProcess.Threads = Threads
     (out, err) = MakeblastdbProcess.launch()
     if err:
         end(1)
 
-
-for DatabaseName in Databases:
     CheckDatabase_BlastdbcmdProcess = BlastPlus.Blastdbcmd(DatabaseName, "", "")
     if not CheckDatabase_BlastdbcmdProcess.is_database():
         logger.error("Problem in the database building")
@@ -304,6 +387,24 @@ for DatabaseName in Databases:
 
 
 
+### Load the target -> family index of the ref_transcriptome2family, otherwise build it
+RunMetrics.start("target_index")
+TargetIndexDirName = args.t2f_index or "%s.t2f_index" %(Databases[0])
+# An existing given index is a dependency: if it is outdated, it is rebuilt in the temporary directory
+TargetIndexBuildDirName = "%s/Target.t2f_index" %(TmpDirName)
+if (not args.t2f_index or not os.path.exists(TargetIndexDirName)) and \
+   os.access(os.path.dirname(os.path.abspath(TargetIndexDirName)), os.W_OK):
+    TargetIndexBuildDirName = TargetIndexDirName
+(TargetCodes, MissingTargets, DuplicatedTargets) = TargetIndex.load_or_build(TargetIndexDirName, TargetFile, Target2FamilyFilename,
+                                                                              BlastPlus.file_fingerprint([TargetFile, Target2FamilyFilename]),
+                                                                              BuildDirName=TargetIndexBuildDirName)
+if MissingTargets:
+    logger.warning("These targets are not present in the target2family link file, they will be added:\n\t- %s", "\n\t- ".join(MissingTargets))
+if DuplicatedTargets:
+    logger.error("There are not unique target names")
+    end(1)
+
+
 #### Check that there is a target database, otherwise build it
 #logger.info("Check that there is a target database, otherwise build it")
 #if not args.database:
@@ -340,7 +441,6 @@ for DatabaseName in Databases:
 
 ### Blast the query fasta on the target database
 logger.info("Blast the query fasta on the target database")
-start_blast_time = time.time()
 BlastOutputFile = "%s/Queries_Targets.blast" % (TmpDirName)
 BlastnProcess = BlastPlus.Blast("blastn", QueryFile, db_list=Databases)
 BlastnProcess.Evalue = Evalue
@@ -349,238 +449,368 @@ BlastnProcess.max_target_seqs = 500
 BlastnProcess.max_hsps_per_subject = 1
 BlastnProcess.Threads = Threads
 BlastnProcess.OutFormat = "6"
+if args.blast_cache:
+    BlastnProcess.Cache = BlastPlus.BlastCache(args.blast_cache)
+    BlastnProcess.Cache.MaxSize = args.blast_cache_size * 1024 * 1024
 
 # Write blast ouptut in BlastOutputFile if the file does not exist
 if not os.stat(QueryFile).st_size:
     logger.info("No sequence in the query")
     end(0)
 
-(out, err) = BlastnProcess.launch(BlastOutputFile)
-if err:
-    end(1)
-
-if not os.stat(BlastOutputFile).st_size:
-    logger.info("Blast found no hit")
-    end(0)
-
-logger.debug("blast --- %s seconds ---", str(time.time() - start_blast_time))
-
-### Parse blast results
-# Fields: query id, subject id, % identity, alignment length, mismatches, gap opens, q. start, q. end, s. start, s. end, evalue, bit score
-FieldNames = ["qid", "tid", "id", "alilen", "mis", "gap", "qstart", "qend", "tstart", "tend", "evalue", "score"]
-BlastTable = pandas.read_csv(BlastOutputFile, sep=None, engine='python', header=None, names=FieldNames)
-
-# Get Family for each Target:
-BlastTableWithFamilies = pandas.merge(BlastTable, Target2FamilyTable, how='left', left_on=['tid'], right_on=['Target'])
-
-# First: Find the best hit for each Query sequences and create a Hit dictonary
-logger.info("First Step")
-HitDic = {}
-NoHitList = []
-
-for Query in QueryNames:
-    Query = Query.split()[0]
-    TmpTable = BlastTableWithFamilies[BlastTableWithFamilies.qid == Query]
-    if not len(TmpTable.index):
-        NoHitList.append(Query)
+### Integer codes of the queries
+QueryIndex = HitAssignment.QueryIndex(QueryNames)
+QueryNb = len(QueryNames)
+del QueryNames
+RunMetrics.set("queries", len(QueryIndex))
+SearchedNb = len(QueryIndex)
+
+### Assign directly the queries with an unambiguous minimizer support
+DirectHits = HitAssignment.HitTable()
+SearchQueryFile = QueryFile
+if args.kmer_prefilter:
+    logger.info("Minimizer prefilter")
+    RunMetrics.start("prefilter")
+    Index = KmerIndex.MinimizerIndex(args.kmer_size, args.kmer_window)
+    Index.Fingerprint = BlastPlus.file_fingerprint([TargetFile, Target2FamilyFilename])
+    IndexFilename = args.kmer_index
+    if not IndexFilename:
+        IndexFilename = "%s.k%sw%s.minimizers.npz" %(Databases[0], args.kmer_size, args.kmer_window)
+        if not os.access(os.path.dirname(os.path.abspath(IndexFilename)), os.W_OK):
+            IndexFilename = "%s/Target.k%sw%s.minimizers.npz" %(TmpDirName, args.kmer_size, args.kmer_window)
+    if Index.load(IndexFilename):
+        logger.info("Minimizer index %s loaded", IndexFilename)
     else:
-        TmpBestScore = max(TmpTable.score)
-
-        flag_dup_fam = True
-        threshold_list=[1]
-        t_i=0
-
-        while flag_dup_fam and t_i < len(threshold_list):
-
-            BestTargetTable = TmpTable[TmpTable.score >= threshold_list[t_i] * TmpBestScore]
-            BestTargetTable.is_copy = False
-
-            BestTarget = BestTargetTable.tid.values
-            BestTargetTable["reverse_calc"] = (BestTargetTable["qend"] - BestTargetTable["qstart"]) * (BestTargetTable["tend"] - BestTargetTable["tstart"])
-
-            BestTargetTable.loc[BestTargetTable['reverse_calc'] >= 0, "reverse"] = False
-            BestTargetTable.loc[BestTargetTable['reverse_calc'] < 0, 'reverse'] = True
-
-            TmpFamily = BestTargetTable["Family"].unique()
-
-            if len(TmpFamily) > 1:
-                logger.debug("More than one family can be attributed with the threshold [%s * maxscore] to %s. Try with another threshold.", threshold_list[t_i], Query)
-            else:
-                flag_dup_fam = False
-
-            t_i+=1
-
-        if len(TmpFamily) > 1:
-            logger.info("More than one family can be attributed to %s:\n\t- %s\nIt will be discarded.", Query, "\n\t- ".join(TmpFamily))
+        logger.info("Build the minimizer index %s", IndexFilename)
+        Index.build(TargetFile, TargetCodes.target2family_dic())
+        Index.save(IndexFilename)
+
+    SearchQueryFile = "%s/Prefiltered_queries.fa" %(TmpDirName)
+    (Assigned, NoSupportNb, AmbiguousNb) = KmerIndex.prefilter(QueryFile, Index, SearchQueryFile)
+    # The scores of the assigned queries are estimated: they are only compared between them
+    DirectHits = HitAssignment.hit_table(TargetCodes.add_families(Assigned), QueryIndex, Approximate=True)
+    logger.info("Minimizer prefilter: %s queries assigned, %s queries without support discarded, %s queries to search",
+                DirectHits.query_nb(), NoSupportNb, AmbiguousNb)
+    RunMetrics.set("prefilter_assigned", DirectHits.query_nb())
+    RunMetrics.set("prefilter_no_support", NoSupportNb)
+    SearchedNb = AmbiguousNb
+    BlastnProcess.QueryFile = SearchQueryFile
+
+### Search only one representative of the identical (or contained) queries
+QueryCollapser = None
+CollapseContained = args.collapse_contained and args.search_backend == "blastn"
+if args.collapse_contained and not CollapseContained:
+    logger.warning("--collapse_contained needs the blastn evalues, only the identical queries are collapsed with %s", args.search_backend)
+if (args.collapse_duplicates or args.collapse_contained) and os.stat(SearchQueryFile).st_size:
+    logger.info("Collapse the identical queries%s", " and the contained isoforms" if CollapseContained else "")
+    RunMetrics.start("collapse")
+    QueryCollapser = Collapser.QueryCollapser()
+    QueryCollapser.Contained = CollapseContained
+    QueryCollapser.Evalue = Evalue
+    RepresentativeFile = "%s/Representative_queries.fa" %(TmpDirName)
+    QueryCollapser.collapse(SearchQueryFile, RepresentativeFile)
+    RunMetrics.set("collapsed", QueryCollapser.QueryNb - QueryCollapser.RepresentativeNb)
+    SearchQueryFile = RepresentativeFile
+    BlastnProcess.QueryFile = SearchQueryFile
+
+### Restrict the search to the queries with a hit on the targets of the used families
+SubsetFamilies = None
+if args.family_subset:
+    logger.info("Search on the targets of the families of %s", args.family_subset)
+    RunMetrics.start("subset_search")
+    with open(args.family_subset) as FamilySubsetFile:
+        SubsetFamilies = set([Line.strip() for Line in FamilySubsetFile if Line.strip()])
+    (SubsetTargets, UnknownFamilies) = TargetCodes.family_targets(SubsetFamilies)
+    if UnknownFamilies:
+        logger.warning("These families have no target in the link file:\n\t- %s", "\n\t- ".join(UnknownFamilies))
+    logger.info("%s families, %s targets", len(SubsetFamilies), len(SubsetTargets))
+
+    SubsetQueryFile = "%s/Subset_queries.fa" %(TmpDirName)
+    SubsetQueries = set()
+    if SubsetTargets and os.stat(SearchQueryFile).st_size:
+        SubsetTargetFile = "%s/Subset_targets.fa" %(TmpDirName)
+        SubsetTargetLengths = Fasta.extract_sequences(TargetFile, SubsetTargets, SubsetTargetFile)
+        QueryLengths = Fasta.fasta_lengths(SearchQueryFile)
+        SubsetDatabaseName = args.subset_db
+        if not SubsetDatabaseName:
+            SubsetDatabaseName = "%s/Subset_DB" %(TmpDirName)
+        SubsetFingerprint = "%s;%s" %(BlastPlus.file_fingerprint([TargetFile, Target2FamilyFilename]), ",".join(sorted(SubsetFamilies)))
+        QueryDatabaseName = args.query_db
+        if not QueryDatabaseName:
+            QueryDatabaseName = "%s/Query_DB" %(TmpDirName)
+        QueryFingerprint = BlastPlus.content_fingerprint(SearchQueryFile)
+
+        SearchDirection = args.search_direction
+        if SearchDirection == "auto":
+            ForwardCost = BlastPlus.search_cost(len(QueryLengths), sum(QueryLengths), sum(SubsetTargetLengths),
+                                                not BlastPlus.is_cached_database(SubsetDatabaseName, SubsetFingerprint))
+            ReverseCost = BlastPlus.search_cost(len(SubsetTargetLengths), sum(SubsetTargetLengths), sum(QueryLengths),
+                                                not BlastPlus.is_cached_database(QueryDatabaseName, QueryFingerprint))
+            SearchDirection = "reverse" if ReverseCost < ForwardCost else "forward"
+            logger.info("Estimated costs of the search on the used families: %s for the queries on the targets, %s for the targets on the queries",
+                        ForwardCost, ReverseCost)
+            RunMetrics.set("search_costs", {"forward": ForwardCost, "reverse": ReverseCost})
+        RunMetrics.set("search_direction", SearchDirection)
+
+        SubsetBlastnProcess = copy.copy(BlastnProcess)
+        SubsetBlastOutputFile = "%s/Queries_Subset.blast" %(TmpDirName)
+        if SearchDirection == "forward":
+            logger.info("Search the queries on the targets of the used families")
+            if not BlastPlus.cached_database(SubsetTargetFile, SubsetDatabaseName, SubsetFingerprint):
+                end(1)
+            # The e-values are smaller on the subset database, no query with a hit on
+            # a target of the subset in the whole database is missed
+            SubsetBlastnProcess.Database = SubsetDatabaseName
+            SubsetBlastnProcess.QueryFile = SearchQueryFile
+            QueryColumn = 0
         else:
-            Family = TmpFamily[0]
-            for Target in BestTarget:
-
-                HitDic.setdefault(Family, {})
-                HitDic[Family].setdefault(Target, {"Query":[], "Score":[], "Reverse":[], "Retained":[]})
-
-                HitDic[Family][Target]["Query"].append(Query)
-                HitDic[Family][Target]["Score"].append(TmpBestScore)
-                HitDic[Family][Target]["Reverse"].append(BestTargetTable.reverse[BestTargetTable.tid == Target].values[0])
-
-
+            logger.warning("Search the targets of the used families on the queries: the queries with a hit are approximate")
+            if not BlastPlus.cached_database(SearchQueryFile, QueryDatabaseName, QueryFingerprint):
+                end(1)
+            SubsetBlastnProcess.Database = QueryDatabaseName
+            SubsetBlastnProcess.QueryFile = SubsetTargetFile
+            # No limit: all the queries with a hit of a target are kept
+            SubsetBlastnProcess.max_target_seqs = 1000000000
+            # With this database size, the e-value of a target on a query is at most the
+            # e-value of the query on the whole ref transcriptome, up to the length
+            # corrections of the effective search space: only a bound, not the forward
+            # e-values
+            DatabaseLength = sum([BlastPlus.Blastdbcmd(DatabaseName, "", "").get_length() for DatabaseName in Databases])
+            SubsetBlastnProcess.DbSize = max(1, DatabaseLength * min(QueryLengths) // max(SubsetTargetLengths))
+            QueryColumn = 1
+        (out, err) = SubsetBlastnProcess.launch(SubsetBlastOutputFile)
+        if err:
+            end(1)
+        with open(SubsetBlastOutputFile) as SubsetBlastOutput:
+            for Line in SubsetBlastOutput:
+                SubsetQueries.add(Line.split("\t", 2)[QueryColumn])
+
+    Fasta.extract_sequences(SearchQueryFile, SubsetQueries, SubsetQueryFile)
+    SubsetQueryNb = len(SubsetQueries)
+    if QueryCollapser:
+        SubsetQueryNb += QueryCollapser.member_nb(SubsetQueries)
+    logger.info("%s queries with a hit on the targets of the used families, %s queries without hit discarded",
+                SubsetQueryNb, SearchedNb - SubsetQueryNb)
+    RunMetrics.set("subset_no_hit", SearchedNb - SubsetQueryNb)
+    SearchedNb = SubsetQueryNb
+    del SubsetQueries
+    SearchQueryFile = SubsetQueryFile
+    BlastnProcess.QueryFile = SearchQueryFile
+
+StreamBlast = args.stream_blast and args.blast_shards <= 1 and args.db_volumes <= 1 and not args.blast_cache and args.search_backend == "blastn"
+if args.stream_blast and not StreamBlast:
+    logger.warning("--stream_blast is only compatible with blastn without -blast_shards > 1, -db_volumes > 1 or -blast_cache, the blast output will be written in %s", BlastOutputFile)
+
+SpillHits = args.max_memory > 0
+if SpillHits:
+    # A quarter of the memory budget for the hits parsed at once (about 500 bytes by hit in pandas tables)
+    BlastChunkSize = max(10000, args.max_memory * 1024 * 1024 / 4 / 500)
+    logger.info("Memory budget: %s MB, hits parsed by chunks of %s", args.max_memory, BlastChunkSize)
+    Assigner = HitAssignment.SpilledFamilyAssigner(QueryIndex, TargetCodes, "%s/Spilled_hits" %(TmpDirName))
+    Assigner.MaxMemory = args.max_memory
+    Assigner.GroupStarts = SampleStarts
+    Assigner.ChunkSize = BlastChunkSize
+else:
+    BlastChunkSize = args.blast_chunksize
+    Assigner = HitAssignment.FamilyAssigner(QueryIndex, TargetCodes)
+Assigner.Collapser = QueryCollapser
+
+RunMetrics.set("searched", SearchedNb)
+RunMetrics.set("search_backend", "blastn" if StreamBlast else args.search_backend)
+
+def count_hits():
+    """Update the counters of the search and of the first step"""
+    RunMetrics.set("hits", Assigner.HitNb)
+    RunMetrics.set("queries_with_hits", Assigner.HitQueryNb)
+    RunMetrics.set("no_hit", SearchedNb - Assigner.HitQueryNb)
+    RunMetrics.set("ambiguous", dict([("%s" %(Threshold), Nb) for (Threshold, Nb) in Assigner.AmbiguousNb.items()]))
+    RunMetrics.set("assigned", Assigner.AssignedNb + DirectHits.query_nb())
+
+if not os.stat(SearchQueryFile).st_size:
+    logger.info("No sequence to search")
+    RunMetrics.set("searched", 0)
+
+elif StreamBlast:
+    ### Parse blast results while the blast is running
+    # First: Find the best hit for each Query sequences and create a hit table
+    logger.info("First Step (streamed blast output)")
+    RunMetrics.start("search_and_assignment")
+    BlastnPipe = BlastnProcess.launch_pipe()
+    if BlastnPipe is None:
+        end(1)
+    BlastChunks = HitAssignment.read_blast_table(BlastnPipe.stdout, chunksize=BlastChunkSize)
+    for BlastTable in HitAssignment.iter_query_blocks(BlastChunks):
+        Assigner.add_hits(BlastTable)
+    err = BlastnProcess.wait(BlastnPipe)
+    if err:
+        end(1)
+    count_hits()
 
-#if NoHitList:
-#    logger.debug("Queries wihout blast hit:\n\t- %s", "\n\t- ".join(NoHitList))
+    if not Assigner.HitNb:
+        logger.info("Blast found no hit")
+        if not len(DirectHits):
+            end(0)
 
-# Second: For each family, for each target with an hit we kept hits with a score >=0.9 of the best hit
-logger.info("Second Step")
-Threshold = 0.9
-ConfirmedHitDic = {}
-for Family in HitDic.keys():
-    ConfirmedHitDic.setdefault(Family, {"Retained":[], "To_be_reverse":[]})
-    for Target in HitDic[Family]:
-        ConfirmedHitDic[Family].setdefault(Target, {"Retained":[]})
-        BestScore = max(HitDic[Family][Target]["Score"])
-        L = len(HitDic[Family][Target]["Score"])
-        for i in range(L):
-            if HitDic[Family][Target]["Score"][i] >= (Threshold * BestScore):
-                ConfirmedHitDic[Family][Target]["Retained"].append(HitDic[Family][Target]["Query"][i])
-                if HitDic[Family][Target]["Reverse"][i]:
-                    ConfirmedHitDic[Family]["To_be_reverse"].append(HitDic[Family][Target]["Query"][i])
-
-### Write output file
-# usefull functions:
-def read_fasta(fasta_string):
-    if fasta_string:
-        Fasta = fasta_string.strip().split("\n")
-    else:
-        Fasta = []
-    name = ""
-    sequence_list = []
-    fasta_dict = {}
-
-    for line in Fasta + [">"]:
-        if re.match(">", line):
-            # This is a new sequence write the previous sequence if it exists
-            if sequence_list:
-                fasta_dict.setdefault(name, "")
-                sequence = "".join(sequence_list)
-                sequence_list = []
-                fasta_dict[name] = sequence
-            name = line.replace(">lcl|", "").strip().split()[0] # remove the ">lcl|"
-            name = name.replace(">","")
-        elif name != "":
-            sequence_list.append(line)
-        else:
-            pass
-    return fasta_dict
-
-def rev_complement(Sequence_str):
-    intab = "ABCDGHMNRSTUVWXYabcdghmnrstuvwxy"
-    outtab = "TVGHCDKNYSAABWXRtvghcdknysaabwxr"
-    trantab = string.maketrans(intab, outtab)
-    # Reverse
-    Reverse = Sequence_str.replace("\n", "")[::-1]
-    # Complement
-    Complement = Reverse.translate(trantab)
-    return Complement
-
-def write_fasta(fasta_dict, outfile):
-    String = []
-    Output = open(outfile, "w")
-    for (n, s) in fasta_dict.items():
-        formated_sequence = ">" + n + "\n" + '\n'.join(s[i:i+60] for i in range(0, len(s), 60)) + "\n"
-        String.append(formated_sequence)
-    Output.write("".join(String))
-    Output.close()
-
-
-def rename_fasta(fasta_dict, Family):
-    for o_k in fasta_dict.keys():
-        SeqName = "%s%s%s" %(SeqId_dic["SeqPrefix"],
-                                 string.zfill(SeqId_dic["SeqNb"],
-                                              SeqId_dic["NbFigures"]
-                                              ),
-                                 "_%s" %(Family))
-        SeqId_dic["SeqNb"] += 1
-
-        if o_k in ConfirmedHitDic[Family]["To_be_reverse"]:
-            fasta_dict[SeqName] = rev_complement(fasta_dict.pop(o_k))
-            logger.info(SeqName + ": Reversed sequence")
-        else:
-            fasta_dict[SeqName] = fasta_dict.pop(o_k)
-
-        Target = TmpDic[o_k]
-        if args.tab_out_one_file:
-            # Write in the output table query target family
-            OutputTableString.append("%s\t%s\t%s\n" %(SeqName, Target, Family))
-        if args.sp2seq_tab_out_by_family:
-            TabByFamilyString.append("%s:%s\n" %(SpeciesQuery, SeqName))
-
-## Build a query database
-logger.info("Build a query database")
-QueryDatabaseName = "%s/Query_DB" %TmpDirName
-if not os.path.isfile(QueryFile):
-    logger.error("The query fasta file (-q) does not exist.")
-    end(1)
-# database building
-logger.info(QueryDatabaseName + " database building")
-MakeblastdbProcess = BlastPlus.Makeblastdb(QueryFile, QueryDatabaseName)
-ExitCode = MakeblastdbProcess.launch()
-
-CheckDatabase_BlastdbcmdProcess = BlastPlus.Blastdbcmd(QueryDatabaseName, "", "")
-if not CheckDatabase_BlastdbcmdProcess.is_database():
-    logger.error("Problem in the database building")
-    logger.info("Database %s does not exist", QueryDatabaseName)
-    end(1)
 else:
-    logger.info("Database %s exists", QueryDatabaseName)
-
-## Third step: For each family, write a fasta which contained all retained family
-logger.info("Write output files")
-OutputTableString = []
-SeqId_dic = {"SeqPrefix" : "TR%s0" %(SpeciesID),
-             "SeqNb" : 1, "NbFigures" : 10}
-
-for Family in ConfirmedHitDic.keys():
-    logger.debug("for %s", Family)
-    TmpRetainedNames = []
-    TmpDic = {}
-    for Target in HitDic[Family]:
-        TmpRetainedNames.extend(ConfirmedHitDic[Family][Target]["Retained"])
-        for Query in ConfirmedHitDic[Family][Target]["Retained"]:
-            TmpDic[Query] = Target
-    ## Write outputs
-    #Get retained sequences names
-    start_blastdbcmd_time = time.time()
-    TmpFilename = "%s/%s_sequences_names.txt" %(TmpDirName, Family)
-    TmpFile = open(TmpFilename, "w")
-    TmpFile.write("\n".join(TmpRetainedNames))
-    TmpFile.close()
-    #Get retained sequences
-    FamilyOutputName = "%s.%s.fa" %(OutPrefixName, Family)
-    TabFamilyOutputName = "%s.%s.sp2seq.txt" %(OutPrefixName, Family)
-    TabByFamilyString = []
-
-    BlastdbcmdProcess = BlastPlus.Blastdbcmd(QueryDatabaseName, TmpFilename, "")
-    (FastaString, err) = BlastdbcmdProcess.launch()
+    RunMetrics.start("search")
+    if args.search_backend == "mmseqs":
+        SearchProcess = FastSearch.Mmseqs(SearchQueryFile, TargetFile)
+        SearchProcess.TmpDirName = TmpDirName
+        SearchProcess.Evalue = Evalue
+        SearchProcess.max_target_seqs = BlastnProcess.max_target_seqs
+        SearchProcess.Threads = Threads
+        (out, err) = SearchProcess.launch(BlastOutputFile)
+    elif args.search_backend == "minimap2":
+        SearchProcess = FastSearch.Minimap2(SearchQueryFile, TargetFile)
+        SearchProcess.max_target_seqs = BlastnProcess.max_target_seqs
+        SearchProcess.Threads = Threads
+        (out, err) = SearchProcess.launch(BlastOutputFile)
+    elif args.blast_shards > 1:
+        (out, err) = BlastnProcess.launch_sharded(BlastOutputFile, args.blast_shards, TmpDirName)
+    elif args.db_volumes > 1:
+        (out, err) = BlastnProcess.launch_volumes(BlastOutputFile, TmpDirName)
+    else:
+        (out, err) = BlastnProcess.launch(BlastOutputFile)
     if err:
         end(1)
-    logger.debug("blastdbcmd --- %s seconds ---", time.time() - start_blastdbcmd_time)
 
-    #Read fasta
-    family_fasta_dict = read_fasta(FastaString)
-    #Rename sequences:
-    rename_fasta(family_fasta_dict, Family)
-
-    write_fasta(family_fasta_dict, FamilyOutputName)
+    if not os.stat(BlastOutputFile).st_size:
+        logger.info("Blast found no hit")
+        if not len(DirectHits):
+            count_hits()
+            end(0)
+
+    if SpillHits:
+        ### Parse blast results by chunks of complete queries
+        logger.info("First Step (hits parsed by chunks)")
+        RunMetrics.start("parsing_and_assignment")
+        BlastChunks = HitAssignment.read_blast_table(BlastOutputFile, chunksize=BlastChunkSize)
+        for BlastTable in HitAssignment.iter_query_blocks(BlastChunks):
+            Assigner.add_hits(BlastTable)
+        count_hits()
+        if args.search_backend != "blastn" and args.backend_check_sample > 0:
+            logger.warning("The agreement between %s and blastn is not computed with -max_memory", args.search_backend)
+    else:
+        ### Parse blast results
+        RunMetrics.start("parsing")
+        BlastTable = HitAssignment.read_blast_table(BlastOutputFile)
+
+        # First: Find the best hit for each Query sequences and create a hit table
+        logger.info("First Step")
+        RunMetrics.start("assignment")
+        Assigner.add_hits(BlastTable)
+        Hits = Assigner.HitTables[-1]
+        del BlastTable
+        count_hits()
+
+        if args.search_backend != "blastn" and args.backend_check_sample > 0:
+            ### Compare the assignment of a sample of queries with blastn
+            RunMetrics.start("backend_check")
+            logger.info("Compare %s and blastn on a sample of %s queries", args.search_backend, args.backend_check_sample)
+            random.seed(0)
+            AllQueries = [Query for (Query, _) in Fasta.iter_fasta(SearchQueryFile)]
+            SampleQueries = set(random.sample(AllQueries, min(args.backend_check_sample, len(AllQueries))))
+            SampleFilename = "%s/Sample_queries.fa" %(TmpDirName)
+            with open(SampleFilename, "w") as SampleFile:
+                for (Query, Sequence) in Fasta.iter_fasta(SearchQueryFile):
+                    if Query in SampleQueries:
+                        SampleFile.write(Fasta.format_fasta(Query, Sequence))
+            SampleBlastOutputFile = "%s/Sample_queries.blast" %(TmpDirName)
+            SampleBlastnProcess = copy.copy(BlastnProcess)
+            SampleBlastnProcess.QueryFile = SampleFilename
+            (out, err) = SampleBlastnProcess.launch(SampleBlastOutputFile)
+            if err:
+                end(1)
+            SampleBlastTable = HitAssignment.read_blast_table(SampleBlastOutputFile)
+            SampleBlastTable = TargetCodes.add_families(SampleBlastTable)
+            (SampleHits, _) = HitAssignment.assign_families(SampleBlastTable, QueryIndex)
+            (SampleNb, SameFamily, SameOrientation) = HitAssignment.compare_assignments(Hits, SampleHits, QueryIndex.get(list(SampleQueries)))
+            logger.info("Agreement %s/blastn on %s queries: %s same family (%.1f%%), %s same family and orientation (%.1f%%)",
+                        args.search_backend, SampleNb,
+                        SameFamily, 100.0 * SameFamily / max(1, SampleNb),
+                        SameOrientation, 100.0 * SameOrientation / max(1, SampleNb))
+            RunMetrics.set("backend_check", {"queries": SampleNb, "same_family": SameFamily, "same_orientation": SameOrientation})
+
+Assigner.add_hit_table(DirectHits)
+if SpillHits and Assigner.Spilling:
+    logger.info("%s best hits kept on disk", Assigner.SpilledNb)
+count_hits()
+
+def dispatch_sample(RankedRetainedQueries, QueryFile, SpeciesQuery, SpeciesID, OutPrefixName):
+    ## Third step: For each family, write a fasta which contained all retained family
+    # The retained queries (rank, family, target, reverse) arrive sorted by rank
+    logger.info("Write output files")
+    start_demultiplexing_time = time.time()
+    FamilyDemultiplexer = Demultiplexer.FamilyDemultiplexer(OutPrefixName, SpeciesQuery, SpeciesID)
+    FamilyDemultiplexer.Sp2SeqByFamily = args.sp2seq_tab_out_by_family
+    FamilyDemultiplexer.TableOneFile = args.tab_out_one_file
+    if SpillHits:
+        FamilyDemultiplexer.BufferSize = min(FamilyDemultiplexer.BufferSize, args.max_memory * 1024 * 1024 / 8)
+    WrittenNb = FamilyDemultiplexer.dispatch_ranked(QueryFile, RankedRetainedQueries)
+    logger.info("%s sequences written in %s families", WrittenNb, len(FamilyDemultiplexer.Buffers))
+    logger.debug("demultiplexing --- %s seconds ---", time.time() - start_demultiplexing_time)
+    return WrittenNb
+
+def subset_retained(RetainedQueries, Families):
+    """Discard the queries retained in other families than the used families"""
+    for Retained in RetainedQueries:
+        if Retained[1] in Families:
+            yield Retained
+        else:
+            RunMetrics.add("other_families")
 
-    if args.sp2seq_tab_out_by_family:
-        TabFamilyOutput = open(TabFamilyOutputName, "w")
-        TabFamilyOutput.write("".join(TabByFamilyString))
-        TabFamilyOutput.close()
+def count_retained(RankedRetainedQueries, SampleCounters):
+    """Count the retained queries by family and the reversed ones while they are dispatched"""
+    for (Rank, Family, Target, Reverse) in RankedRetainedQueries:
+        SampleCounters["retained"] += 1
+        SampleCounters["reversed"] += int(Reverse)
+        SampleCounters["retained_by_family"][Family] = SampleCounters["retained_by_family"].get(Family, 0) + 1
+        yield (Rank, Family, Target, Reverse)
 
-if args.tab_out_one_file:
-    OutputTableFilename = "%s_table.tsv" %(OutPrefixName)
-    OutputTableFile = open(OutputTableFilename, "w")
-    OutputTableFile.write("".join(OutputTableString))
-    OutputTableFile.close()
+# Second: For each family, for each target with an hit we kept hits with a score >=0.9 of the best hit
+RunMetrics.start("retention_and_output")
+if SpillHits:
+    logger.info("Second Step (hits kept %s)", "on disk" if Assigner.Spilling else "in memory")
+    RetainedQueries = Assigner.iter_named()
+else:
+    logger.info("Second Step")
+    RetainedQueries = Assigner.get_hits().retained(Threshold=0.9, GroupStarts=SampleStarts).iter_named(TargetCodes)
+
+if SubsetFamilies is not None:
+    RunMetrics.set("other_families", 0)
+    RetainedQueries = subset_retained(RetainedQueries, SubsetFamilies)
+
+# The retained queries of each sample are consecutive
+SampleRetained = itertools.groupby(RetainedQueries,
+                                   key=lambda Retained: bisect.bisect_right(SampleStarts, Retained[0]) - 1)
+(Group, GroupRetained) = next(SampleRetained, (None, None))
+SampleEnds = SampleStarts[1:] + [QueryNb]
+SamplesCounters = []
+for (SampleIndex, (SampleQueryFile, SpeciesQuery, SpeciesID, SampleOutPrefixName)) in enumerate(Samples):
+    logger.info("Sample %s (%s)", SpeciesID, SpeciesQuery)
+    SampleCounters = collections.OrderedDict([("id", SpeciesID), ("species", SpeciesQuery),
+                                              ("queries", SampleEnds[SampleIndex] - SampleStarts[SampleIndex]),
+                                              ("retained", 0), ("reversed", 0), ("retained_by_family", {})])
+    RankedRetainedQueries = []
+    if Group == SampleIndex:
+        RankedRetainedQueries = ((Rank - SampleStarts[SampleIndex], Family, Target, Reverse)
+                                 for (Rank, Family, Target, Reverse) in GroupRetained)
+    SampleCounters["written"] = dispatch_sample(count_retained(RankedRetainedQueries, SampleCounters),
+                                                SampleQueryFile, SpeciesQuery, SpeciesID, SampleOutPrefixName)
+    SamplesCounters.append(SampleCounters)
+    if Group == SampleIndex:
+        (Group, GroupRetained) = next(SampleRetained, (None, None))
+RunMetrics.set("retained", sum([SampleCounters["retained"] for SampleCounters in SamplesCounters]))
+RunMetrics.set("reversed", sum([SampleCounters["reversed"] for SampleCounters in SamplesCounters]))
+RunMetrics.set("samples", SamplesCounters)
+if SubsetFamilies is not None:
+    logger.info("%s queries attributed to other families than the used families are not written", RunMetrics.Counters["other_families"])
+
+if SpillHits:
+    PeakMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logger.info("Peak resident memory of the process: %s MB", PeakMemory)
+    if PeakMemory > args.max_memory:
+        logger.warning("The peak resident memory of the process (%s MB) is above the memory budget (%s MB)", PeakMemory, args.max_memory)
 
 logger.info("--- %s seconds ---", str(time.time() - start_time))
 
@@ -80,6 +80,12 @@ Options.add_argument('--resolve_polytomy', action='store_true', default=False,
                     help="resolve polytomy. (default: False)")
 Options.add_argument('--filter_threshold', type=float, default=0,
                     help="Sequence with a percentage of alignement with its sister sequence is discarded (default: 0)")
+Options.add_argument('-threads', type=int, default=1,
+                    help="Number of threads of mafft. (default: 1)")
+Options.add_argument('-large_aligner', type=str, choices = ["famsa", "muscle5"], default="",
+                    help="Aligner of the families larger than -large_family_size, instead of mafft. MUSCLE 5 (Super5) is launched as muscle5. Mafft is used if the aligner is missing or too old. (default: mafft for all families)")
+Options.add_argument('-large_family_size', type=int, default=5000,
+                    help="Number of sequences above which -large_aligner is used. (default: 5000)")
 Options.add_argument('-tmp', type=str,
                     help="Directory to stock all intermediary files for the job. (default: a directory in /tmp which will be removed at the end)",
                     default="")
@@ -153,6 +159,7 @@ def end(ReturnCode):
         #Remove the temporary directory :
         if "tmp_SeqIntegrator" in TmpDirName:
             shutil.rmtree(TmpDirName)
+    Aligner.log_backend_times(logger)
     logger.debug("--- %s seconds ---", str(time.time() - start_time))
     sys.exit(ReturnCode)
 
@@ -180,7 +187,6 @@ StartingAli = StartingAlignment
 StartingTree = TreeFilename
 StartingSp2Seq = Sp2SeqFilename
 
-TmpAli = "%s/tmp.fa" %TmpDirName
 
 FinalAli = "%s.fa" %OutPrefixName
 FinalTree = "%s.tree" %OutPrefixName
@@ -406,22 +412,20 @@ if args.filter_threshold >= 0:
         if not args.realign_ali:
             filteredfasta.write_fasta(FinalAli)
         else:
-            AfterfilteringFasta = TmpAli
-            filteredfasta.write_fasta(AfterfilteringFasta)
-            ### Realign the final alignment
-            MafftProcess = Aligner.Mafft(TmpAli)
-            #MafftProcess.Maxiterate = 2 # too long
-            MafftProcess.AutoOption = True
+            ### Realign the final alignment, the filtered sequences are given to the aligner in memory
+            FilteredSequences = [(s.Name, s.Sequence) for s in filteredfasta.d.values()]
+            MafftProcess = Aligner.get_aligner("", len(FilteredSequences),
+                                               args.large_aligner, args.large_family_size)
+            MafftProcess.Threads = args.threads
             MafftProcess.QuietOption = True
-            MafftProcess.OutputFile = FinalAli
 
-            if os.path.isfile(TmpAli):
-                logger.info("Realign the filtered alignment")
-                _ = MafftProcess.launch()
-                StartingAlignment = MafftProcess.OutputFile
-            else:
-                logger.error("%s is not a file.", TmpAli)
+            logger.info("Realign the filtered alignment")
+            (FinalAlignment, _) = MafftProcess.align(FilteredSequences)
+            if not len(FinalAlignment):
+                logger.error("The realignment of the filtered alignment failed.")
                 end(1)
+            FinalAlignment.write(FinalAli)
+            StartingAlignment = FinalAli
 
         ### Built a tree with the final alignment
         logger.info("Built a tree with the final alignment")
@@ -45,6 +45,7 @@ import subprocess
 
 import PhyloPrograms
 import Aligner
+import Fasta
 
 from ete3 import Tree
 
@@ -79,10 +80,20 @@ Options.add_argument('--no_merge', action='store_true', default=False,
 Options.add_argument('--merge_criterion', type=str, choices = ["merge","length", "length.complete"],
                     help="""choice.criterion=“length" or “length.complete” or “merge”. “length” means the longest sequence is selected. “length.complete” : means the largest number of complete sites (no gaps). “merge” means that the set of monophyletic sequences is used to build one long “chimera” sequence corresponding to the merging of them.""",
                     default="merge")
+Options.add_argument('--add_mode', type=str, choices = ["realign", "fragments"], default="realign",
+                    help="""How sequences are added to the alignment. "realign": they are added with mafft --add and the whole alignment is realigned, after each merge too. "fragments": they are added as fragments of the existing alignment with mafft --addfragments, without realignment, and after each merge only the merged sequences are added again. (default: realign)""")
+Options.add_argument('--keeplength', action='store_true', default=False,
+                    help="With --add_mode fragments, keep the length of the alignment: the insertions of the added sequences are removed. (default: False)")
 Options.add_argument('--realign_ali', action='store_true', default=False,
                     help="Realign the ali even if no sequences to add. (default: False)")
 Options.add_argument('--resolve_polytomy', action='store_true', default=False,
                     help="resolve polytomy. (default: False)")
+Options.add_argument('-threads', type=int, default=1,
+                    help="Number of threads of mafft. (default: 1)")
+Options.add_argument('-large_aligner', type=str, choices = ["famsa", "muscle5"], default="",
+                    help="Aligner of the families larger than -large_family_size, instead of mafft. FAMSA can add sequences to an alignment (profile alignment), MUSCLE 5 (Super5, launched as muscle5) can only realign them. Mafft is used if the aligner is missing or too old. (default: mafft for all families)")
+Options.add_argument('-large_family_size', type=int, default=5000,
+                    help="Number of sequences above which -large_aligner is used. (default: 5000)")
 Options.add_argument('-tmp', type=str,
                     help="Directory to stock all intermediary files for the job. (default: a directory in /tmp which will be removed at the end)",
                     default="")
@@ -170,6 +181,7 @@ def end(ReturnCode):
         #Remove the temporary directory :
         if "tmp_SeqIntegrator" in TmpDirName:
             shutil.rmtree(TmpDirName)
+    Aligner.log_backend_times(logger)
     sys.exit(ReturnCode)
 
 ### Set up the output directory
@@ -288,10 +300,56 @@ def check_isfile_and_notempty(f_l, msg_ps=True):
 
     return itsok
 
+def split_merged_sequences(MergedAli, Previous, FragmentFasta):
+    """Return the sequences of the Previous alignment which are unchanged in
+    MergedAli, as aligned in Previous, and write in FragmentFasta the other
+    sequences of MergedAli without gaps. Return (Base alignment, number of
+    sequences of FragmentFasta)."""
+    PreviousSequences = dict(Previous)
+    Base = Aligner.Alignment()
+    FragmentNb = 0
+    with open(FragmentFasta, "w") as Fragments:
+        for (Name, Sequence) in Fasta.iter_fasta(MergedAli):
+            Ungapped = Sequence.replace("-", "")
+            if Name in PreviousSequences and PreviousSequences[Name].replace("-", "").upper() == Ungapped.upper():
+                Base.append(Name, PreviousSequences[Name])
+            else:
+                Fragments.write(Fasta.format_fasta(Name, Ungapped))
+                FragmentNb += 1
+    return (Base, FragmentNb)
+
+def add_merged_sequences(MergedAli, Previous, i):
+    """Add the sequences of MergedAli changed since the Previous alignment as
+    fragments to the unchanged ones, which are given to mafft in memory.
+    Return the new alignment or None if no sequence is unchanged or if mafft
+    failed, the merged alignment is then fully realigned."""
+    MergedFasta = "%s/Merged.%s.fa" %(TmpDirName, i)
+    (Base, MergedNb) = split_merged_sequences(MergedAli, Previous, MergedFasta)
+    logger.info("Add the %s merged sequences to the %s unchanged sequences (%s)", MergedNb, len(Base), i)
+    if not len(Base):
+        return None
+
+    if MergedNb:
+        MafftProcess = Aligner.Mafft("")
+        MafftProcess.AddFragmentsOption = MergedFasta
+        MafftProcess.KeepLengthOption = args.keeplength
+        MafftProcess.InputType = "nuc"
+        MafftProcess.Threads = args.threads
+        MafftProcess.QuietOption = True
+        (Aligned, err) = MafftProcess.align(Base)
+        if err or len(Aligned) != len(Base) + MergedNb:
+            logger.error("Mafft failed to add the merged sequences (%s), %s sequences out of %s: %s",
+                         i, len(Aligned), len(Base) + MergedNb, err)
+            return None
+        Base = Aligned
+    return Base
+
 if args.realign_ali:
     ### Realign the input alignment
-    InitialMafftProcess = Aligner.Mafft(StartingAlignment)
-    InitialMafftProcess.Maxiterate = 2
+    # The first sp2seq file is the one of the alignment
+    InitialMafftProcess = Aligner.get_aligner(StartingAlignment, count_lines(Sp2SeqFiles[0]),
+                                              args.large_aligner, args.large_family_size)
+    InitialMafftProcess.Threads = args.threads
     InitialMafftProcess.InputType = "nuc"
     InitialMafftProcess.QuietOption = True
     InitialMafftProcess.OutputFile = "%s/%s.fa" %(TmpDirName, "RealignAli")
@@ -329,37 +387,50 @@ if StartingFastaFiles and Sp2SeqFiles:
 
 
     ### Add the fasta file to the existing alignment
-    logger.info("Add the fasta file to the existing alignment")
-    MafftProcessAdd = Aligner.Mafft(StartingAlignment)
-    MafftProcessAdd.AddOption = StartingFasta
-    MafftProcessAdd.AdjustdirectionOption = False
+    logger.info("Add the fasta file to the existing alignment (add mode: %s)", args.add_mode)
+    if args.add_mode == "fragments":
+        MafftProcessAdd = Aligner.Mafft(StartingAlignment)
+        MafftProcessAdd.AddFragmentsOption = StartingFasta
+        MafftProcessAdd.KeepLengthOption = args.keeplength
+        MafftProcessAdd.AdjustdirectionOption = False
+    else:
+        MafftProcessAdd = Aligner.get_aligner(StartingAlignment, len(sp_list), args.large_aligner,
+                                              args.large_family_size, AddFile=StartingFasta)
     MafftProcessAdd.InputType = "nuc"
     MafftProcessAdd.QuietOption = True
+    MafftProcessAdd.Threads = args.threads
     MafftProcessAdd.OutputFile = "%s/StartMafft.fa" %TmpDirName
     if check_isfile_and_notempty([StartingAlignment,StartingFasta]):
         (out, err) = MafftProcessAdd.launch()
 
     ### Realign the combined alignment
-    logger.info("Realign the combined alignment")
-    MafftProcess = Aligner.Mafft(MafftProcessAdd.OutputFile)
-    MafftProcess.AdjustdirectionOption = False
-    MafftProcess.InputType = "nuc"
-    #MafftProcess.Maxiterate = 2 # too long
-    MafftProcess.AutoOption = True
-    MafftProcess.QuietOption = True
-    MafftProcess.OutputFile = "%s/StartMafftRealign.0.fa" %TmpDirName
-    if check_isfile_and_notempty(MafftProcessAdd.OutputFile):
-        (out, err) = MafftProcess.launch()
+    if args.add_mode == "fragments":
+        logger.info("The sequences were added as fragments, the combined alignment is not realigned")
+        CombinedAli = MafftProcessAdd.OutputFile
+        check_isfile_and_notempty(CombinedAli)
+    else:
+        logger.info("Realign the combined alignment")
+        MafftProcess = Aligner.get_aligner(MafftProcessAdd.OutputFile, len(sp_list),
+                                           args.large_aligner, args.large_family_size)
+        MafftProcess.InputType = "nuc"
+        MafftProcess.Threads = args.threads
+        MafftProcess.QuietOption = True
+        MafftProcess.OutputFile = "%s/StartMafftRealign.0.fa" %TmpDirName
+        if check_isfile_and_notempty(MafftProcessAdd.OutputFile):
+            (out, err) = MafftProcess.launch()
+        CombinedAli = MafftProcess.OutputFile
 
     if args.no_merge:
         logger.info("no_merge=True, sequences will not be merged.")
         LastAli = "%s.fa" %OutPrefixName
         FinalSp2Seq = "%s.sp2seq.txt" %OutPrefixName
         (out, err) = mv(Sp2Seq, FinalSp2Seq)
-        (out, err) = mv(MafftProcess.OutputFile, LastAli)
+        (out, err) = mv(CombinedAli, LastAli)
 
     else:
-        ali = MafftProcess.OutputFile
+        ali = CombinedAli
+        # the current alignment in memory, if it is known
+        Current = None
         sp2seq = Sp2Seq
         NbSeq_previous_iter = 0
         NbSeq_current_iter = count_lines(sp2seq)
@@ -412,22 +483,34 @@ if StartingFastaFiles and Sp2SeqFiles:
             if check_isfile_and_notempty([ali, StartTreeFilename, \
                                     PhylomergeProcess.TaxonToSequence]):
                 PhylomergeProcess.launch()
+            NbSeq_current_iter = count_lines(Int1Sp2Seq)
+
+            ### Add the merged sequences to the unchanged part of the alignment
+            MergedAli = ""
+            if args.add_mode == "fragments" and check_isfile_and_notempty(PhylomergeProcess.OutputSequenceFile):
+                if Current is None:
+                    Current = Aligner.Alignment().read(ali)
+                Current = add_merged_sequences(PhylomergeProcess.OutputSequenceFile, Current, i)
+                if Current is not None:
+                    # fasttree and phylomerge read the alignment from a file
+                    MergedAli = "%s/StartMafftRealign.%s.fa" %(TmpDirName, i)
+                    Current.write(MergedAli)
 
             ### Realign the merged alignment
-            logger.info("Realign the merged alignment (%s)", i)
-            MafftProcess = Aligner.Mafft(PhylomergeProcess.OutputSequenceFile)
-            MafftProcess.AdjustdirectionOption = False
-            MafftProcess.InputType = "nuc"
-            #MafftProcess.Maxiterate = 2 # too long
-            MafftProcess.AutoOption = True
-            MafftProcess.QuietOption = True
-            MafftProcess.OutputFile = "%s/StartMafftRealign.%s.fa" %(TmpDirName,i)
-            if check_isfile_and_notempty(PhylomergeProcess.OutputSequenceFile):
-                (out, err) = MafftProcess.launch()
-
-            ali = MafftProcess.OutputFile
+            if not MergedAli:
+                logger.info("Realign the merged alignment (%s)", i)
+                MafftProcess = Aligner.get_aligner(PhylomergeProcess.OutputSequenceFile, NbSeq_current_iter,
+                                                   args.large_aligner, args.large_family_size)
+                MafftProcess.InputType = "nuc"
+                MafftProcess.Threads = args.threads
+                MafftProcess.QuietOption = True
+                MafftProcess.OutputFile = "%s/StartMafftRealign.%s.fa" %(TmpDirName,i)
+                if check_isfile_and_notempty(PhylomergeProcess.OutputSequenceFile):
+                    (out, err) = MafftProcess.launch()
+                MergedAli = MafftProcess.OutputFile
+
+            ali = MergedAli
             sp2seq = Int1Sp2Seq
-            NbSeq_current_iter = count_lines(sp2seq)
 
         logger.warning("%s merge process iterations", i)
         LastAli = "%s.fa" %OutPrefixName
@@ -2,32 +2,67 @@ open Core_kernel
 open Bistro
 open Wutils
     
-let seq_dispatcher
+(* Link file between the reference transcriptome and the families,
+   compiled once and shared by the SeqDispatcher.py and
+   CheckFamily.py runs using the same references *)
+let target_index ~ref_transcriptome ~seq2fam : [`target_index] directory =
+  let open Shell_dsl in
+  Workflow.shell ~descr:"build_target_index.py" [
+    cmd "python" ~img:caars_img [
+      file_dump (string Scripts.build_target_index);
+      opt "-t" dep ref_transcriptome ;
+      opt "-t2f" dep seq2fam;
+      opt "-o" ident dest ;
+    ]
+  ]
+
+(* One SeqDispatcher.py run for several samples sharing the same
+   references. The fasta files of each sample are named as by
+   [fasta_file_name]. The samples share one log, SeqDispatcher.log, and
+   one metrics file, SeqDispatcher.metrics.json, which replace the
+   SeqDispatcher.<id>.<species>.log of the former run by sample. With
+   [family_subset], only the queries with a hit on the targets of these
+   families are searched on the whole references and only these
+   families are written. With [collapse_queries], only one
+   representative of the identical (or contained) queries is
+   searched. *)
+let collapse_option = function
+  | Defs.Collapse_duplicates -> "--collapse_duplicates"
+  | Defs.Collapse_contained -> "--collapse_contained"
+
+let seq_dispatcher_samples
     ?s2s_tab_by_family
+    ?family_subset
+    ?collapse_queries
     ~ref_db
-    ~query
-    ~query_species
-    ~query_id
+    ~queries
     ~ref_transcriptome
     ~threads
-    ~seq2fam : [`seq_dispatcher] directory =
+    ~seq2fam
+    ~target_index : [`seq_dispatcher] directory =
   let open Shell_dsl in
-  Workflow.shell ~np:threads ~version:9 ~descr:("SeqDispatcher.py:" ^ query_id ^ "_" ^ query_species) [
+  let query_ids = List.map queries ~f:(fun ((s : Rna_sample.t), _) -> s.id ^ "_" ^ s.species) in
+  let samples = List.map queries ~f:(fun ((s : Rna_sample.t), query) ->
+      seq ~sep:" " [ string "-sample" ; dep query ; string s.species ; string s.id ]
+    )
+  in
+  Workflow.shell ~np:threads ~version:9 ~descr:("SeqDispatcher.py:" ^ String.concat ~sep:"," query_ids) [
     mkdir_p tmp;
-    cmd "python" ~img:caars_img [
+    cmd "python" ~img:caars_img ([
       file_dump (string Scripts.seq_dispatcher);
       option (flag string "--sp2seq_tab_out_by_family" ) s2s_tab_by_family;
+      option (opt "-family_subset" (fun families -> file_dump (seq ~sep:"\n" (List.map families ~f:string)))) family_subset;
+      option (fun c -> string (collapse_option c)) collapse_queries;
       opt "-d" ident (seq ~sep:"," (List.map ref_db ~f:(fun blast_db -> seq [dep blast_db ; string "/db"]) ));
       opt "-tmp" ident tmp ;
-      opt "-log" seq [ dest ; string ("/SeqDispatcher." ^ query_id ^ "." ^ query_species ^ ".log" )] ;
-      opt "-q" dep query ;
-      opt "-qs" string query_species ;
-      opt "-qid" string query_id ;
+      opt "-log" seq [ dest ; string "/SeqDispatcher.log" ] ;
+      opt "--metrics-json" seq [ dest ; string "/SeqDispatcher.metrics.json" ] ;
       opt "-threads" ident np ;
       opt "-t" dep ref_transcriptome ;
       opt "-t2f" dep seq2fam;
-      opt "-out" seq [ dest ; string ("/Trinity." ^ query_id ^ "." ^ query_species )] ;
-    ]
+      opt "-t2f_index" dep target_index;
+      opt "-out" seq [ dest ; string "/Trinity" ] ;
+    ] @ samples)
   ]
 
 let fasta_file_name (sample : Rna_sample.t) family =
@@ -1,14 +1,20 @@
 open Bistro
 
-val seq_dispatcher :
+val target_index :
+  ref_transcriptome:fasta file ->
+  seq2fam:'d Bistro.path Bistro.workflow ->
+  [ `target_index ] Bistro.directory
+
+val seq_dispatcher_samples :
   ?s2s_tab_by_family:bool ->
+  ?family_subset:string list ->
+  ?collapse_queries:Defs.query_collapse ->
   ref_db:'a Bistro.path Bistro.workflow list ->
-  query:fasta file ->
-  query_species:string ->
-  query_id:string ->
+  queries:(Rna_sample.t * fasta file) list ->
   ref_transcriptome:fasta file ->
   threads:int ->
   seq2fam:'d Bistro.path Bistro.workflow ->
+  target_index:[ `target_index ] Bistro.directory ->
   [ `seq_dispatcher ] Bistro.directory
 
 val fasta_file_name : Rna_sample.t -> string -> string
@@ -7,12 +7,25 @@ open Wutils
 let transform_species_list l =
   list ~sep:"," string l
 
+let large_aligner_string = function
+  | Famsa -> "famsa"
+  | Muscle5 -> "muscle5"
+
+let add_mode_string = function
+  | Add_realign -> "realign"
+  | Add_fragments
+  | Add_fragments_keeplength -> "fragments"
+
 let seq_integrator
     ?realign_ali
     ?resolve_polytomy
     ?species_to_refine_list
     ?no_merge
     ?merge_criterion
+    ?(threads = 1)
+    ?large_aligner
+    ?large_family_size
+    ?add_mode
     ~family
     ~trinity_fam_results_dirs
     ~apytram_results_dir
@@ -47,7 +60,7 @@ let seq_integrator
 
   let tmp_merge = tmp // "tmp" in
 
-  Workflow.shell ~version:12 ~descr:("SeqIntegrator.py:" ^ family) [
+  Workflow.shell ~version:12 ~descr:("SeqIntegrator.py:" ^ family) ~np:threads [
     mkdir_p tmp_merge ;
     cmd "python" ~img:caars_img [
       file_dump (string Scripts.seq_integrator);
@@ -59,6 +72,11 @@ let seq_integrator
       option (opt "--merge_criterion" string) merge_criterion_string;
       option (flag string "--no_merge") no_merge;
       option (flag string "--resolve_polytomy") resolve_polytomy;
+      opt "-threads" ident np;
+      option (opt "-large_aligner" string) (Option.map large_aligner ~f:large_aligner_string);
+      option (opt "-large_family_size" int) large_family_size;
+      option (opt "--add_mode" string) (Option.map add_mode ~f:add_mode_string);
+      option (flag string "--keeplength") (Option.map add_mode ~f:(Poly.equal Add_fragments_keeplength));
       opt "-sp2seq" (seq ~sep:"") sp2seq  ; (* list de sp2seq delimited by comas *)
       opt "-out" seq [ dest ; string "/" ; string family] ;
       option (opt "-sptorefine" transform_species_list) species_to_refine_list;
@@ -69,6 +87,9 @@ let seq_filter
     ?realign_ali
     ?resolve_polytomy
     ?species_to_refine_list
+    ?(threads = 1)
+    ?large_aligner
+    ?large_family_size
     ~filter_threshold
     ~family
     ~alignment
@@ -79,7 +100,7 @@ let seq_filter
   let open Bistro.Shell_dsl in
   let tmp_merge = tmp // "tmp" in
 
-  Workflow.shell ~version:8 ~descr:("SeqFilter.py:" ^ family) [
+  Workflow.shell ~version:8 ~descr:("SeqFilter.py:" ^ family) ~np:threads [
     mkdir_p tmp_merge ;
     cmd "python" ~img:caars_img [
       file_dump (string Scripts.seq_filter);
@@ -90,6 +111,9 @@ let seq_filter
       opt "--filter_threshold" float filter_threshold;
       option (flag string "--realign_ali") realign_ali;
       option (flag string "--resolve_polytomy") resolve_polytomy;
+      opt "-threads" ident np;
+      option (opt "-large_aligner" string) (Option.map large_aligner ~f:large_aligner_string);
+      option (opt "-large_family_size" int) large_family_size;
       opt "-sp2seq" dep sp2seq  ;
       opt "-out" seq [ dest ; string "/" ; string family] ;
       option (opt "-sptorefine" transform_species_list) species_to_refine_list;
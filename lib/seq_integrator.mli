@@ -7,6 +7,10 @@ val seq_integrator :
   ?species_to_refine_list:string list ->
   ?no_merge:bool ->
   ?merge_criterion:merge_criterion ->
+  ?threads:int ->
+  ?large_aligner:large_aligner ->
+  ?large_family_size:int ->
+  ?add_mode:add_mode ->
   family:string ->
   trinity_fam_results_dirs:(Rna_sample.t * [`seq_dispatcher] directory) list ->
   apytram_results_dir:fasta file ->
@@ -18,6 +22,9 @@ val seq_filter :
   ?realign_ali:bool ->
   ?resolve_polytomy:bool ->
   ?species_to_refine_list:string list ->
+  ?threads:int ->
+  ?large_aligner:large_aligner ->
+  ?large_family_size:int ->
   filter_threshold:float ->
   family:string ->
   alignment:fasta file ->
@@ -32,59 +32,143 @@
 
 
 import os
+import re
+import math
+import time
+import shutil
+import tempfile
+import itertools
 import subprocess
 import logging
+import collections
 
+import Fasta
 
-class Exonerate(object):
-    """Define an object to launch Exonerate"""
-    def __init__(self, TargetFile, QueryFile):
-        self.TargetFile = TargetFile
-        self.QueryFile = QueryFile
-        self.Model = ""
-        self.Ryo = ""
-        self.ShowAlignment = "F"
-        self.ShowVulgar = "F"
-        self.Bestn = 0
-        self.Identity = 0
-        self.Exhaustive = False
-
-    def get_output(self):
-        #Out = "Command line: []\nHostname:\n-- completed exonerate analysis"
-        command = ["exonerate", "-t", self.TargetFile,
-                   "-q", self.QueryFile,
-                   "--showalignment", self.ShowAlignment,
-                   "--showvulgar", self.ShowVulgar]
-
-        if self.Model:
-            command.extend(["--model", str(self.Model)])
-        if self.Bestn > 0:
-            command.extend(["--bestn", str(self.Bestn)])
-        if self.Identity > 0:
-            command.extend(["--percent", str(self.Identity)])
-        if self.Ryo:
-            command.extend(["--ryo", str(self.Ryo)])
-        if self.Exhaustive:
-            command.extend(["--exhaustive", "T"])
-
-        try:
-            Out = subprocess.check_output(command,
-                                         stderr=open("/dev/null", "w"))
-        except:
-            os.system("echo Unexpected error when we launch Exonerate:\n")
-            print " ".join(command)
-
-        # Remove Exonerate default lines
-        #(First, second (which contains Hostname) and last):
-        List = Out.strip().split("\n")
-        Start = 0
-        while not "Hostname" in List[Start]:
-            Start += 1
-
-        Out = "\n".join(List[Start+1:-1])
-
-        return Out
 
+# Mafft strategies by increasing family size: (name, options, maximal number
+# of sequences, maximal sequence length). L-INS-i is the most accurate, the
+# others trade accuracy for speed on large families.
+MafftStrategies = [
+    ("L-INS-i", ["--localpair", "--maxiterate", "1000"], 200, 2000),
+    ("FFT-NS-i", ["--retree", "2", "--maxiterate", "2"], 1000, None),
+    ("FFT-NS-2", ["--retree", "2", "--maxiterate", "0"], 5000, None),
+    ("FFT-NS-1", ["--retree", "1", "--maxiterate", "0"], 20000, None),
+    ("PartTree", ["--retree", "1", "--maxiterate", "0", "--parttree"], None, None),
+]
+
+def plan_mafft(SeqNb, Length):
+    """Return the (name, options) of the fastest accurate enough mafft strategy
+    for SeqNb sequences of at most Length residues"""
+    for (Name, Options, MaxSeqNb, MaxLength) in MafftStrategies:
+        if (MaxSeqNb is None or SeqNb <= MaxSeqNb) and (MaxLength is None or Length <= MaxLength):
+            return (Name, Options)
+
+# Rough cost model of the mafft strategies, in residue comparisons: the guide
+# tree needs the distances of all pairs of sequences (all pairwise alignments
+# for L-INS-i, PartTreeSize partitions for PartTree) and each progressive or
+# refinement pass aligns each sequence to a profile.
+PartTreeSize = 50
+
+def mafft_cost(Strategy, SeqNb, Length):
+    """Return the estimated cost of the alignment of SeqNb sequences of Length
+    residues with a strategy of MafftStrategies"""
+    Distances = SeqNb * SeqNb * Length
+    Pass = SeqNb * Length * Length
+    if Strategy == "L-INS-i":
+        return SeqNb * SeqNb * Length * Length + 2 * Pass
+    elif Strategy == "FFT-NS-i":
+        return 2 * Distances + 3 * Pass
+    elif Strategy == "FFT-NS-2":
+        return 2 * Distances + 2 * Pass
+    elif Strategy == "FFT-NS-1":
+        return Distances + Pass
+    else:
+        return SeqNb * PartTreeSize * Length * max(1, int(math.log(max(SeqNb, 2), 2))) + Pass
+
+# Wall time spent in each alignment backend: name -> [number of runs, seconds]
+BackendTimes = collections.OrderedDict()
+
+def run_aligner(Logger, Backend, command, Sequences=None):
+    """Launch the command of an alignment backend, with Sequences (a list of
+    (name, sequence) or an Alignment) given in fasta on its standard input if
+    any, record its wall time in BackendTimes and return (out, err).
+
+    The aligners write their progress on the standard error: it is logged
+    at the debug level, err is only set if the backend fails (non-zero exit
+    code)"""
+    Logger.debug(" ".join(command))
+    Start = time.time()
+    Input = None
+    if Sequences is not None:
+        Input = "".join([Fasta.format_fasta(Name, Sequence) for (Name, Sequence) in Sequences])
+    try:
+        p = subprocess.Popen(command,
+                             stdin=subprocess.PIPE if Input is not None else None,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        (out, err) = p.communicate(Input)
+        if not p.returncode:
+            if err:
+                Logger.debug(err)
+            err = ""
+        elif not err:
+            err = "%s exited with code %s" %(Backend, p.returncode)
+    except OSError as e:
+        (out, err) = ("", "Unexpected error when we launch %s: %s" %(Backend, e))
+    Times = BackendTimes.setdefault(Backend, [0, 0.0])
+    Times[0] += 1
+    Times[1] += time.time() - Start
+    Logger.info("%s --- %.1f seconds ---", Backend, time.time() - Start)
+    if err:
+        Logger.error(err)
+
+    return (out, err)
+
+def log_backend_times(Logger):
+    """Log the number of runs and the wall time of each alignment backend"""
+    for (Backend, (RunNb, Seconds)) in BackendTimes.items():
+        Logger.info("%s: %s runs --- %.1f seconds ---", Backend, RunNb, Seconds)
+
+class Alignment(object):
+    """Define a compact in-memory store of sequences: their names and their
+    sequences are kept in two lists, in the order of the alignment"""
+    def __init__(self, Records=()):
+        self.Names = []
+        self.Sequences = []
+        for (Name, Sequence) in Records:
+            self.append(Name, Sequence)
+
+    def __len__(self):
+        return len(self.Names)
+
+    def __iter__(self):
+        return itertools.izip(self.Names, self.Sequences)
+
+    def append(self, Name, Sequence):
+        self.Names.append(Name)
+        self.Sequences.append(Sequence)
+
+    def read(self, FastaFilename):
+        for (Name, Sequence) in Fasta.iter_fasta(FastaFilename):
+            self.append(Name, Sequence)
+        return self
+
+    def parse(self, String):
+        """Add the sequences of a fasta formatted string"""
+        for Record in String.split("\n>"):
+            Lines = Record.lstrip(">").split("\n")
+            Header = Lines[0].split()
+            if Header:
+                self.append(Header[0], "".join([line.strip() for line in Lines[1:]]))
+        return self
+
+    def to_fasta(self):
+        return "".join([Fasta.format_fasta(Name, Sequence) for (Name, Sequence) in self])
+
+    def write(self, FastaFilename):
+        with open(FastaFilename, "w") as File:
+            for (Name, Sequence) in self:
+                File.write(Fasta.format_fasta(Name, Sequence))
 
 class Mafft(object):
     """Define an object to launch Mafft"""
@@ -94,30 +178,63 @@ class Mafft(object):
         self.InputFile = InputFile
         self.OutputFile = ""
         self.AddOption = False
+        self.AddFragmentsOption = False
+        self.KeepLengthOption = False
         self.AdjustdirectionOption = False
         self.AutoOption = False
         self.Maxiterate = 0
         self.QuietOption = False
         self.InputType=""
+        self.Threads = 1
+        self.PlanStrategy = False
 
-    def launch(self, output=""):
+    def plan(self, Sequences=None):
+        """Return the options of the strategy planned from the number and the
+        length of the input sequences (or of Sequences), and log its estimated cost"""
+        SeqNb = 0
+        Length = 0
+        if Sequences is None:
+            Sequences = Fasta.iter_fasta(self.InputFile)
+        for (_, Sequence) in Sequences:
+            SeqNb += 1
+            Length = max(Length, len(Sequence.replace("-", "")))
+        (Strategy, Options) = plan_mafft(SeqNb, Length)
+        self.logger.info("Mafft strategy for %s sequences of at most %s residues: %s (estimated cost: %.3g, %s threads)",
+                         SeqNb, Length, Strategy, mafft_cost(Strategy, SeqNb, Length), self.Threads)
+        return Options
+
+    def get_command(self, Sequences=None):
         command = ["mafft"]
 
         if self.AdjustdirectionOption:
             command.append("--adjustdirection")
-        if self.AutoOption:
-            command.append("--auto")
-        if self.Maxiterate:
-            command.extend(["--maxiterate", str(self.Maxiterate)])
+        if self.PlanStrategy and not (self.AddOption or self.AddFragmentsOption):
+            command.extend(self.plan(Sequences))
+        else:
+            if self.AutoOption:
+                command.append("--auto")
+            if self.Maxiterate:
+                command.extend(["--maxiterate", str(self.Maxiterate)])
+        if self.Threads > 1:
+            command.extend(["--thread", str(self.Threads)])
         if self.AddOption:
             if os.path.isfile(self.AddOption):
                 command.extend(["--add", self.AddOption])
+        if self.AddFragmentsOption:
+            if os.path.isfile(self.AddFragmentsOption):
+                command.extend(["--addfragments", self.AddFragmentsOption])
+        if self.KeepLengthOption:
+            command.append("--keeplength")
         if self.QuietOption:
             command.append("--quiet")
         if self.InputType=="nuc":
             command.append("--nuc")
         elif self.InputType=="amino":
             command.append("--amino")
+        return command
+
+    def launch(self, output=""):
+        command = self.get_command()
 
         if output or self.OutputFile:
             if output:
@@ -125,13 +242,164 @@ class Mafft(object):
             command.extend(["--out", self.OutputFile])
 
         command.append(self.InputFile)
-        self.logger.debug(" ".join(command))
 
+        return run_aligner(self.logger, "mafft", command)
+
+    def align(self, Sequences):
+        """Align Sequences, a list of (name, sequence) or an Alignment, given
+        to mafft on its standard input, and return (Alignment, err): the
+        alignment is read from the standard output, without temporary files"""
+        command = self.get_command(Sequences)
+        command.append("-")
+
+        (out, err) = run_aligner(self.logger, "mafft", command, Sequences)
+        return (Alignment().parse(out), err)
+
+def check_version(Binary, command, Pattern, MinMajor):
+    """Return an error message if Binary can not be launched or if the major
+    version read by Pattern in the output of command is lower than MinMajor,
+    an empty string otherwise"""
+    try:
         p = subprocess.Popen(command,
                              stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        (out, err) = p.communicate()
-        if err:
-            self.logger.error(err)
+                             stderr=subprocess.STDOUT)
+        (out, _) = p.communicate()
+    except OSError as e:
+        return "%s can not be launched: %s" %(Binary, e)
+    Version = re.search(Pattern, out, re.IGNORECASE)
+    if Version is None or int(Version.group(1)) < MinMajor:
+        return "%s is not version %s or later: %s" %(Binary, MinMajor, out.strip().split("\n")[0])
+    return ""
+
+class Famsa(object):
+    """Define an object to launch FAMSA, a fast aligner for very large
+    families. With AddOption, the sequences of this fasta file are aligned
+    and then added to the input alignment by a profile-profile alignment"""
+    SupportsAdd = True
+    def __init__(self, InputFile):
+        self.logger = logging.getLogger("main.lib.famsa")
+        self.logger.info('creating an instance of Famsa')
+        self.Binary = "famsa"
+        self.InputFile = InputFile
+        self.OutputFile = ""
+        self.AddOption = False
+        self.InputType = ""
+        self.QuietOption = False
+        self.Threads = 1
+
+    def check(self):
+        """Return an error message if FAMSA 2 (stdin/stdout support) is missing"""
+        return check_version(self.Binary, [self.Binary], r"ver\. (\d+)", 2)
+
+    def get_command(self):
+        command = [self.Binary]
+        if self.Threads > 1:
+            command.extend(["-t", str(self.Threads)])
+        return command
+
+    def launch(self, output=""):
+        if output:
+            self.OutputFile = output
+        OutputFile = self.OutputFile or "STDOUT"
+
+        if self.AddOption and os.path.isfile(self.AddOption):
+            # Align the sequences to add in a temporary directory, then
+            # align the two profiles
+            AddDirName = tempfile.mkdtemp(prefix='tmp_Famsa')
+            try:
+                AddAli = os.path.join(AddDirName, "add.fa")
+                command = self.get_command()
+                command.extend([self.AddOption, AddAli])
+                (out, err) = run_aligner(self.logger, "famsa", command)
+                if err or not os.path.isfile(AddAli):
+                    return (out, err)
+                command = self.get_command()
+                command.extend(["-profile", self.InputFile, AddAli, OutputFile])
+                return run_aligner(self.logger, "famsa", command)
+            finally:
+                shutil.rmtree(AddDirName, ignore_errors=True)
+
+        command = self.get_command()
+        command.extend([self.InputFile, OutputFile])
+        return run_aligner(self.logger, "famsa", command)
+
+    def align(self, Sequences):
+        """Align Sequences, given to famsa on its standard input, and return
+        (Alignment, err)"""
+        command = self.get_command()
+        command.extend(["STDIN", "STDOUT"])
+
+        (out, err) = run_aligner(self.logger, "famsa", command, Sequences)
+        return (Alignment().parse(out), err)
+
+class Muscle5(object):
+    """Define an object to launch the Super5 algorithm of MUSCLE 5 for very
+    large families. MUSCLE 5 can not add sequences to an alignment. It is
+    launched as muscle5 (Binary), muscle being MUSCLE 3 in caars_env"""
+    SupportsAdd = False
+    def __init__(self, InputFile):
+        self.logger = logging.getLogger("main.lib.muscle5")
+        self.logger.info('creating an instance of Muscle5')
+        self.Binary = "muscle5"
+        self.InputFile = InputFile
+        self.OutputFile = ""
+        self.InputType = ""
+        self.QuietOption = False
+        self.Threads = 1
+
+    def check(self):
+        """Return an error message if Binary is not MUSCLE 5 (-super5)"""
+        return check_version(self.Binary, [self.Binary, "-version"], r"muscle v?(\d+)\.", 5)
+
+    def get_command(self, InputFile, OutputFile):
+        command = [self.Binary, "-super5", InputFile, "-output", OutputFile]
+        if self.Threads > 1:
+            command.extend(["-threads", str(self.Threads)])
+        if self.QuietOption:
+            command.append("-quiet")
+        return command
+
+    def launch(self, output=""):
+        if output:
+            self.OutputFile = output
+        command = self.get_command(self.InputFile, self.OutputFile or "/dev/stdout")
+
+        return run_aligner(self.logger, "muscle5", command)
+
+    def align(self, Sequences):
+        """Align Sequences, given to muscle on its standard input, and return
+        (Alignment, err)"""
+        command = self.get_command("/dev/stdin", "/dev/stdout")
+
+        (out, err) = run_aligner(self.logger, "muscle5", command, Sequences)
+        return (Alignment().parse(out), err)
+
+# Alignment backends for the families larger than LargeFamilySize
+LargeAligners = {"famsa": Famsa, "muscle5": Muscle5}
 
-        return (out, err)
+def get_aligner(InputFile, SeqNb, LargeAligner="", LargeFamilySize=5000, AddFile=""):
+    """Return the aligner of a family of SeqNb sequences (counting the ones
+    of AddFile), known by the caller: a Mafft planning its strategy, or an
+    instance of the LargeAligner backend if the family has more than
+    LargeFamilySize sequences. When sequences are added, only the backends
+    able to add them are used, and mafft is used if the backend is missing
+    or too old. The caller sets the other options (Threads, OutputFile...)"""
+    Backend = LargeAligners.get(LargeAligner)
+    if Backend is not None and AddFile and not Backend.SupportsAdd:
+        logging.getLogger("main.lib.Aligner").info("%s can not add sequences, use mafft", LargeAligner)
+        Backend = None
+    if Backend is not None:
+        if SeqNb > LargeFamilySize:
+            logging.getLogger("main.lib.Aligner").info("%s sequences (> %s), use %s", SeqNb, LargeFamilySize, LargeAligner)
+            Process = Backend(InputFile)
+            err = Process.check()
+            if not err:
+                if AddFile:
+                    Process.AddOption = AddFile
+                return Process
+            logging.getLogger("main.lib.Aligner").warning("%s, use mafft", err)
+    Process = Mafft(InputFile)
+    Process.PlanStrategy = True
+    if AddFile:
+        Process.AddOption = AddFile
+    return Process
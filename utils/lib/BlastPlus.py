@@ -32,8 +32,29 @@
 
 
 import os
+import copy
+import glob
+import heapq
+import fcntl
+import time
+import shutil
+import sqlite3
+import hashlib
 import logging
+import tempfile
+import itertools
+import contextlib
 import subprocess
+import collections
+
+import Fasta
+import Runner
+
+# Fields of the tabular output (outfmt 6): query id, subject id, % identity, alignment length, mismatches,
+# gap opens, q. start, q. end, s. start, s. end, evalue, bit score
+HspFields = ["qid", "tid", "id", "alilen", "mis", "gap", "qstart", "qend", "tstart", "tend", "evalue", "score"]
+HspTypes = [str, str, float, int, int, int, int, int, int, int, float, float]
+Hsp = collections.namedtuple("Hsp", HspFields)
 
 
 class Makeblastdb(object):
@@ -46,8 +67,13 @@ class Makeblastdb(object):
         self.LogFile = ""
         self.Dbtype = "nucl"
         self.IndexedDatabase = True
+        self.VolumeNb = 1
+        self.Threads = 1
 
     def launch(self):
+        if self.VolumeNb > 1:
+            return self.launch_volumes()
+
         command = ["makeblastdb", "-in", self.InputFile,
                    "-out", os.path.abspath(self.OutputFiles),
                    "-dbtype", self.Dbtype]
@@ -63,6 +89,39 @@ class Makeblastdb(object):
             self.logger.error(err)
         return (out, err)
 
+    def launch_volumes(self):
+        """Split the fasta file in VolumeNb volumes of similar length, build a
+        database of each volume and an alias database listing them, which
+        can be used as a single database"""
+        VolumeFiles = split_fasta(self.InputFile, self.VolumeNb, self.OutputFiles + ".volume")
+        if len(VolumeFiles) <= 1:
+            Whole = copy.copy(self)
+            Whole.VolumeNb = 1
+            return Whole.launch()
+
+        VolumeRunner = Runner.ConcurrentRunner(self.Threads)
+        Volumes = []
+        for (i, VolumeFile) in enumerate(VolumeFiles):
+            Volume = copy.copy(self)
+            Volume.VolumeNb = 1
+            Volume.InputFile = VolumeFile
+            Volume.OutputFiles = "%s.%02d" %(self.OutputFiles, i)
+            VolumeRunner.add(Volume.launch)
+            Volumes.append(Volume.OutputFiles)
+        self.logger.info("Build %s volumes of %s", len(Volumes), self.OutputFiles)
+        Results = VolumeRunner.run()
+        for VolumeFile in VolumeFiles:
+            os.remove(VolumeFile)
+
+        out = "".join([o for (o, e) in Results if o])
+        err = "".join([e for (o, e) in Results if e])
+        if not err:
+            AliasFilename = "%s.%s" %(self.OutputFiles, "nal" if self.Dbtype == "nucl" else "pal")
+            with open(AliasFilename, "w") as AliasFile:
+                AliasFile.write("TITLE %s\n" %(os.path.basename(self.OutputFiles)))
+                AliasFile.write("DBLIST %s\n" %(" ".join(['"%s"' %(os.path.basename(Volume)) for Volume in Volumes])))
+        return (out, err)
+
 class Blast(object):
     """Define a object to lauch a blast on a local database"""
     def __init__(self, Program, QueryFile, db_prefix="", db_list=[]):
@@ -84,30 +143,48 @@ class Blast(object):
         self.perc_identity = 0
         self.Task = ""
         self.Strand = ""
+        self.DbSize = 0
+        self.SearchSpace = 0
+        self.Cache = None
+        self.Error = ""
+
+    def get_command(self, OutputFile=""):
+        command = [self.Program, "-db", self.Database,
+                  "-query", self.QueryFile,
+                  "-evalue", str(self.Evalue),
+                  "-outfmt", str(self.OutFormat),
+                  "-max_target_seqs", str(self.max_target_seqs),
+                  "-num_threads", str(self.Threads)]
+
+        if OutputFile:
+            command.extend(["-out", OutputFile])
+        if self.perc_identity:
+            command.extend(
+            ["-perc_identity", str(self.perc_identity)]
+            )
+        if self.max_hsps_per_subject:
+            command.extend(
+            ["-max_hsps", str(self.max_hsps_per_subject)]
+            )
+        if self.Task:
+            command.extend(["-task", self.Task])
+
+        if self.Strand in ["both", "plus", "minus"]:
+            command.extend(["-strand", self.Strand])
+
+        if self.DbSize:
+            command.extend(["-dbsize", str(self.DbSize)])
+        if self.SearchSpace:
+            command.extend(["-searchsp", str(self.SearchSpace)])
+
+        return command
 
     def launch(self, OutputFile):
         if self.Program in ["blastn", "blastx", "tblastn", "tblastx"]:
-            command = [self.Program, "-db", self.Database,
-                      "-query", self.QueryFile,
-                      "-evalue", str(self.Evalue),
-                      "-outfmt", str(self.OutFormat),
-                      "-out", OutputFile,
-                      "-max_target_seqs", str(self.max_target_seqs),
-                      "-num_threads", str(self.Threads)]
-
-            if self.perc_identity:
-                command.extend(
-                ["-perc_identity", str(self.perc_identity)]
-                )
-            if self.max_hsps_per_subject:
-                command.extend(
-                ["-max_hsps", str(self.max_hsps_per_subject)]
-                )
-            if self.Task:
-                command.extend(["-task", self.Task])
-
-            if self.Strand in ["both", "plus", "minus"]:
-                command.extend(["-strand", self.Strand])
+            if self.Cache and str(self.OutFormat) == "6":
+                return self.launch_cached(OutputFile)
+
+            command = self.get_command(OutputFile)
 
             self.logger.debug(" ".join(command))
             p = subprocess.Popen(command,
@@ -125,6 +202,651 @@ class Blast(object):
             )
             return ("", "%s not in [blastn,blastx,tblastn,tblastx]" %self.Program)
 
+    def launch_pipe(self):
+        """Launch the blast and return the process, hits are written on its stdout.
+        Call wait() once stdout has been read."""
+        if not self.Program in ["blastn", "blastx", "tblastn", "tblastx"]:
+            self.logger.error(
+            "%s not in [blastn,blastx,tblastn,tblastx]",
+            self.Program
+            )
+            return None
+
+        command = self.get_command()
+        self.logger.debug(" ".join(command))
+        # stderr goes to a file to never block blast while stdout is read
+        self.ErrFile = tempfile.TemporaryFile()
+        p = subprocess.Popen(command,
+                             stdout=subprocess.PIPE,
+                             stderr=self.ErrFile)
+        return p
+
+    def wait(self, p):
+        """Wait the end of a process started by launch_pipe and return its errors"""
+        p.stdout.close()
+        ReturnCode = p.wait()
+        self.ErrFile.seek(0)
+        err = self.ErrFile.read()
+        self.ErrFile.close()
+        if ReturnCode and not err:
+            err = "%s exited with code %s" %(self.Program, ReturnCode)
+        if err:
+            self.logger.error(err)
+        return err
+
+    def iter_lines(self):
+        """Launch the blast and yield the lines of its output while it is running.
+
+        Blast is paused when its output is not read (the pipe is full) and it is
+        killed if the iteration is stopped before the end. Errors are logged and
+        kept in self.Error at the end of the iteration."""
+        self.Error = ""
+        p = self.launch_pipe()
+        if p is None:
+            self.Error = "%s not in [blastn,blastx,tblastn,tblastx]" %self.Program
+            return
+        Complete = False
+        try:
+            # readline does not wait for a full read-ahead buffer
+            for line in iter(p.stdout.readline, ""):
+                yield line
+            Complete = True
+        finally:
+            if Complete:
+                self.Error = self.wait(p)
+            else:
+                p.kill()
+                p.stdout.close()
+                p.wait()
+                self.ErrFile.close()
+
+    def iter_hits(self, ByQuery=False):
+        """Launch the blast and yield its hits as Hsp tuples while it is running,
+        or a (query, list of Hsp) tuple for each query with hits if ByQuery.
+
+        The output format must be 6 (tabular without comments). As for iter_lines,
+        check self.Error at the end of the iteration."""
+        if str(self.OutFormat) != "6":
+            self.Error = "Streamed hits need the tabular output format 6, not %s" %self.OutFormat
+            self.logger.error(self.Error)
+            return
+        Hits = (parse_hsp(line) for line in self.iter_lines())
+        if ByQuery:
+            for (Query, QueryHits) in itertools.groupby(Hits, key=lambda Hit: Hit.qid):
+                yield (Query, list(QueryHits))
+        else:
+            for Hit in Hits:
+                yield Hit
+
+    def launch_sharded(self, OutputFile, ShardNb, TmpDirName):
+        """Split the queries in ShardNb shards of similar length, blast them
+        concurrently (sharing self.Threads) and concatenate their outputs in the
+        query order.
+
+        The database size of the shards is fixed with -dbsize so evalues are
+        the same as with a single blast. self is not modified."""
+        QueryFiles = split_fasta(self.QueryFile, ShardNb,
+                                 "%s/%s_shard" %(TmpDirName, os.path.basename(self.QueryFile)))
+        if len(QueryFiles) <= 1:
+            return self.launch(OutputFile)
+
+        DbSize = self.DbSize
+        if not DbSize:
+            DbSize = sum([Blastdbcmd(Database, "", "").get_length() for Database in self.Database.split()])
+
+        Shards = []
+        for (i, QueryFile) in enumerate(QueryFiles):
+            Shard = copy.copy(self)
+            Shard.DbSize = DbSize
+            Shard.QueryFile = QueryFile
+            Shard.Threads = max(1, self.Threads // len(QueryFiles))
+            Shards.append((Shard, "%s.%s" %(QueryFile, "blast")))
+
+        self.logger.info("Blast %s shards of %s", len(Shards), self.QueryFile)
+        ShardRunner = Runner.ConcurrentRunner(max(self.Threads, len(Shards)))
+        for (Shard, ShardOutputFile) in Shards:
+            ShardRunner.add(Shard.launch, [ShardOutputFile], Cores=Shard.Threads)
+        Results = ShardRunner.run()
+
+        out = "".join([o for (o, e) in Results if o])
+        err = "".join([e for (o, e) in Results if e])
+        if err:
+            return (out, err)
+
+        with open(OutputFile, "w") as Output:
+            for (_, ShardOutputFile) in Shards:
+                with open(ShardOutputFile, "r") as ShardOutput:
+                    shutil.copyfileobj(ShardOutput, Output)
+        return (out, err)
+
+    def search_spaces(self, TmpDirName):
+        """Return ({query: effective search space}, err) of the queries on the
+        whole databases, as computed by blast: the queries are searched on a
+        database of as many one residue sequences as the databases, with their
+        length as -dbsize. self is not modified."""
+        Dbtype = "prot" if self.Program in ["blastp", "blastx"] else "nucl"
+        (SequenceNb, Length) = (0, 0)
+        for Database in self.Database.split():
+            (DatabaseSequenceNb, DatabaseLength) = Blastdbcmd(Database, "", "").get_info()
+            SequenceNb += DatabaseSequenceNb
+            Length += DatabaseLength
+
+        Prefix = "%s/%s.stats" %(TmpDirName, os.path.basename(self.QueryFile))
+        with open(Prefix + ".fa", "w") as StatsFasta:
+            for i in range(SequenceNb):
+                StatsFasta.write(">s%s\nA\n" %(i))
+        StatsDatabase = Makeblastdb(Prefix + ".fa", Prefix)
+        StatsDatabase.Dbtype = Dbtype
+        StatsDatabase.IndexedDatabase = False
+        (out, err) = StatsDatabase.launch()
+        os.remove(Prefix + ".fa")
+        if err:
+            return ({}, err)
+
+        Stats = copy.copy(self)
+        Stats.Database = Prefix
+        Stats.DbSize = self.DbSize or Length
+        Stats.OutFormat = 0
+        Stats.Cache = None
+        (out, err) = Stats.launch(Prefix + ".out")
+        if err:
+            return ({}, err)
+        # Pairwise output: "Query= <name> ..." and "Effective search space used: <size>" by query
+        SearchSpaces = {}
+        with open(Prefix + ".out", "r") as StatsOutput:
+            for line in StatsOutput:
+                if line.startswith("Query="):
+                    Query = line.split()[1]
+                elif line.startswith("Effective search space used:"):
+                    SearchSpaces[Query] = int(line.split(":")[1])
+        for Filename in glob.glob(Prefix + ".*"):
+            os.remove(Filename)
+        return (SearchSpaces, "")
+
+    def launch_volumes(self, OutputFile, TmpDirName):
+        """Blast the queries on each volume of the databases concurrently (sharing
+        self.Threads) and keep, for each query, the hits of the max_target_seqs
+        best targets of all volumes.
+
+        The effective search space of each query on the whole databases is given
+        to the blasts of the volumes with -searchsp, so the evalues and the best
+        targets are the same as with a single blast. -searchsp is the same for
+        all the queries of a blast: the queries are searched by groups of
+        queries with the same search space (the same length), each volume is
+        scanned once by group. self is not modified."""
+        Volumes = database_volumes(self.Database, "prot" if self.Program in ["blastp", "blastx"] else "nucl")
+        if len(Volumes) <= 1:
+            return self.launch(OutputFile)
+        if str(self.OutFormat) != "6":
+            self.logger.warning("The hits of the volumes can only be merged with the output format 6, blast the whole database")
+            return self.launch(OutputFile)
+
+        (SearchSpaces, err) = self.search_spaces(TmpDirName)
+        if err:
+            return ("", err)
+        Groups = split_by_search_space(self.QueryFile, SearchSpaces,
+                                       "%s/%s_searchsp" %(TmpDirName, os.path.basename(self.QueryFile)))
+
+        VolumeRunner = Runner.ConcurrentRunner(self.Threads)
+        VolumeOutputFiles = [[] for Volume in Volumes]
+        for (SearchSpace, GroupFile, _) in Groups:
+            for (i, Volume) in enumerate(Volumes):
+                Search = copy.copy(self)
+                Search.Database = Volume
+                Search.QueryFile = GroupFile
+                Search.DbSize = 0
+                Search.SearchSpace = SearchSpace
+                Search.Cache = None
+                Search.Threads = max(1, self.Threads // len(Volumes))
+                VolumeOutputFiles[i].append("%s.volume.%s.blast" %(GroupFile, i))
+                VolumeRunner.add(Search.launch, [VolumeOutputFiles[i][-1]], Cores=Search.Threads)
+
+        self.logger.info("Blast %s on %s volumes by %s groups of queries with the same search space",
+                         self.QueryFile, len(Volumes), len(Groups))
+        Results = VolumeRunner.run()
+        out = "".join([o for (o, e) in Results if o])
+        err = "".join([e for (o, e) in Results if e])
+        if not err:
+            # The hits are merged in the group order, then written in the query order
+            GroupedOutputFile = "%s/%s.volumes.blast" %(TmpDirName, os.path.basename(self.QueryFile))
+            merge_volume_hits([Name for (_, _, Names) in Groups for Name in Names],
+                              [iter_files(Files) for Files in VolumeOutputFiles], GroupedOutputFile, self.max_target_seqs)
+            reorder_query_hits(GroupedOutputFile, self.QueryFile, OutputFile)
+            os.remove(GroupedOutputFile)
+        for Filename in [GroupFile for (_, GroupFile, _) in Groups] + [Filename for Files in VolumeOutputFiles for Filename in Files]:
+            if os.path.isfile(Filename):
+                os.remove(Filename)
+        return (out, err)
+
+    def cache_prefix(self):
+        """Return a string identifying the database and the blast options"""
+        Options = [self.Program, self.Task, self.Evalue, self.OutFormat,
+                   self.max_target_seqs, self.max_hsps_per_subject,
+                   self.perc_identity, self.Strand, self.DbSize,
+                   database_fingerprint(self.Database)]
+        return "|".join([str(Option) for Option in Options]) + "|"
+
+    def launch_cached(self, OutputFile):
+        """Replay the cached hits of the query sequences already blasted on
+        the same database with the same options and blast only the others"""
+        Prefix = self.cache_prefix()
+        TmpDirName = tempfile.mkdtemp(prefix="tmp_BlastCache")
+        MissFilename = os.path.join(TmpDirName, "queries.fa")
+
+        Queries = []
+        for (Name, Sequence) in Fasta.iter_fasta(self.QueryFile):
+            Key = hashlib.sha1(Prefix + Sequence.upper()).hexdigest()
+            Queries.append((Name, Key))
+        Connection = self.Cache.connect()
+        CachedKeys = self.Cache.find(Connection, [Key for (_, Key) in Queries])
+        MissNb = 0
+        with open(MissFilename, "w") as MissFile:
+            for ((Name, Sequence), (_, Key)) in zip(Fasta.iter_fasta(self.QueryFile), Queries):
+                if not Key in CachedKeys:
+                    MissFile.write(Fasta.format_fasta(Name, Sequence))
+                    MissNb += 1
+        self.Cache.Hits += len(Queries) - MissNb
+        self.Cache.Misses += MissNb
+        self.logger.info("Blast cache: %s hits, %s misses", len(Queries) - MissNb, MissNb)
+
+        # The hits of the missing queries are merged while the blast is running,
+        # both outputs are in the query order
+        MissBlast = copy.copy(self)
+        MissBlast.Cache = None
+        MissBlast.QueryFile = MissFilename
+        MissBlast.Error = ""
+        NewHits = []
+        with open(OutputFile, "w") as Output:
+            MissGroups = iter_query_groups(MissBlast.iter_lines() if MissNb else [])
+            Group = next(MissGroups, None)
+            for (Name, Key) in Queries:
+                if Key in CachedKeys:
+                    Hits = self.Cache.get(Connection, Key)
+                else:
+                    Hits = ""
+                    if Group is not None and Group[0] == Name:
+                        Hits = "".join([line.split("\t", 1)[1] for line in Group[1]])
+                        Group = next(MissGroups, None)
+                    NewHits.append((Key, Hits))
+                Output.write("".join([Name + "\t" + line + "\n" for line in Hits.split("\n") if line]))
+            # Read the end of the output to get the blast errors
+            for Group in MissGroups:
+                pass
+        if not MissBlast.Error:
+            self.Cache.put(Connection, NewHits)
+        Connection.close()
+
+        shutil.rmtree(TmpDirName)
+        return ("", MissBlast.Error)
+
+def iter_query_groups(BlastOutput):
+    """Yield (query, lines) for each query of a tabular blast output"""
+    Query = None
+    Lines = []
+    for line in BlastOutput:
+        Name = line.split("\t", 1)[0]
+        if Name != Query:
+            if Lines:
+                yield (Query, Lines)
+            (Query, Lines) = (Name, [])
+        Lines.append(line)
+    if Lines:
+        yield (Query, Lines)
+
+def iter_target_groups(Lines, VolumeIndex):
+    """Yield (evalue, -score, VolumeIndex, rank, lines) for each target of the
+    lines of a query in a tabular blast output, in the blast order"""
+    for (Rank, (_, TargetLines)) in enumerate(itertools.groupby(Lines, key=lambda line: line.split("\t", 2)[1])):
+        TargetLines = list(TargetLines)
+        Fields = TargetLines[0].rstrip("\n").split("\t")
+        yield (float(Fields[10]), -float(Fields[11]), VolumeIndex, Rank, TargetLines)
+
+def merge_volume_hits(QueryNames, VolumeOutputs, OutputFile, MaxTargetNb):
+    """Merge the tabular outputs (outfmt 6, iterables of lines) of the blasts
+    of the queries QueryNames on the volumes of a database: the targets of each
+    query are merged by evalue and score and only the MaxTargetNb best targets
+    are kept, in the QueryNames order"""
+    VolumeGroups = [iter_query_groups(VolumeOutput) for VolumeOutput in VolumeOutputs]
+    Groups = [next(QueryGroups, None) for QueryGroups in VolumeGroups]
+    with open(OutputFile, "w") as Output:
+        for Query in QueryNames:
+            Targets = []
+            for (VolumeIndex, Group) in enumerate(Groups):
+                if Group is not None and Group[0] == Query:
+                    Targets.append(iter_target_groups(Group[1], VolumeIndex))
+                    Groups[VolumeIndex] = next(VolumeGroups[VolumeIndex], None)
+            for Target in itertools.islice(heapq.merge(*Targets), MaxTargetNb):
+                Output.write("".join(Target[4]))
+
+def reorder_query_hits(BlastOutputFile, QueryFile, OutputFile):
+    """Write the hits of a tabular blast output (outfmt 6) in the order of the
+    queries of QueryFile, reading them from their offsets"""
+    Offsets = {}
+    Offset = 0
+    with open(BlastOutputFile, "r") as BlastOutput:
+        for (Query, Lines) in iter_query_groups(BlastOutput):
+            Size = sum([len(line) for line in Lines])
+            Offsets[Query] = (Offset, Size)
+            Offset += Size
+    with open(BlastOutputFile, "r") as BlastOutput:
+        with open(OutputFile, "w") as Output:
+            for (Query, _) in Fasta.iter_fasta(QueryFile):
+                if Query in Offsets:
+                    BlastOutput.seek(Offsets[Query][0])
+                    Output.write(BlastOutput.read(Offsets[Query][1]))
+
+def iter_files(Filenames):
+    """Yield the lines of the files one after the other"""
+    for Filename in Filenames:
+        with open(Filename, "r") as File:
+            for line in File:
+                yield line
+
+def database_volumes(Database, Dbtype="nucl"):
+    """Return the volumes of one or several blast databases, listed by their
+    alias file (.nal or .pal), or the databases themselves"""
+    Volumes = []
+    for DatabaseName in Database.split():
+        AliasFilename = "%s.%s" %(DatabaseName, "nal" if Dbtype == "nucl" else "pal")
+        DatabaseVolumes = []
+        if os.path.isfile(AliasFilename):
+            with open(AliasFilename, "r") as AliasFile:
+                for line in AliasFile:
+                    if line.startswith("DBLIST"):
+                        DatabaseVolumes = [os.path.join(os.path.dirname(DatabaseName), Volume.strip('"'))
+                                           for Volume in line.split()[1:]]
+        Volumes.extend(DatabaseVolumes or [DatabaseName])
+    return Volumes
+
+def parse_hsp(line):
+    """Return the Hsp of a line of a tabular blast output (outfmt 6)"""
+    return Hsp._make([Type(Value) for (Type, Value) in zip(HspTypes, line.rstrip("\n").split("\t"))])
+
+def file_fingerprint(Filenames):
+    """Return a fingerprint of files (names, sizes and modification times),
+    independent of the directory where the files are mounted"""
+    return ";".join(["%s:%s:%s" %(os.path.basename(Filename), os.path.getsize(Filename), int(os.path.getmtime(Filename)))
+                     for Filename in Filenames])
+
+def database_fingerprint(Database):
+    """Return a fingerprint of the files of one or several blast databases
+    (names, sizes and modification times)"""
+    Fingerprint = hashlib.sha1()
+    for DatabaseName in Database.split():
+        for Filename in sorted(glob.glob(DatabaseName + ".*")):
+            Stat = os.stat(Filename)
+            Fingerprint.update("%s %s %s\n" %(os.path.basename(Filename), Stat.st_size, int(Stat.st_mtime)))
+    return Fingerprint.hexdigest()
+
+def content_fingerprint(Filename):
+    """Return a fingerprint of the content of a file"""
+    Fingerprint = hashlib.sha1()
+    with open(Filename, "rb") as File:
+        for Block in iter(lambda: File.read(1 << 20), b""):
+            Fingerprint.update(Block)
+    return Fingerprint.hexdigest()
+
+@contextlib.contextmanager
+def locked(LockFilename):
+    """Hold an exclusive lock on LockFilename, concurrent jobs wait for it"""
+    with open(LockFilename, "a") as LockFile:
+        fcntl.flock(LockFile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(LockFile, fcntl.LOCK_UN)
+
+def is_cached_database(DatabaseName, Fingerprint):
+    """Return True if DatabaseName was built by cached_database with the same fingerprint"""
+    FingerprintFilename = DatabaseName + ".fingerprint"
+    if not os.path.isfile(FingerprintFilename):
+        return False
+    with open(FingerprintFilename) as FingerprintFile:
+        if FingerprintFile.read() != Fingerprint:
+            return False
+    return Blastdbcmd(DatabaseName, "", "").is_database()
+
+def cached_database(FastaFile, DatabaseName, Fingerprint):
+    """Build a database of FastaFile, unless DatabaseName was already built
+    with the same fingerprint. Return False if the database can not be built."""
+    logger = logging.getLogger('main.lib.BlastPlus')
+    if os.path.dirname(DatabaseName) and not os.path.isdir(os.path.dirname(DatabaseName)):
+        os.makedirs(os.path.dirname(DatabaseName))
+    # A job building the same database makes the others wait
+    with locked(DatabaseName + ".lock"):
+        if is_cached_database(DatabaseName, Fingerprint):
+            logger.info("Database %s exists", DatabaseName)
+            return True
+        FingerprintFilename = DatabaseName + ".fingerprint"
+        if os.path.isfile(FingerprintFilename):
+            os.remove(FingerprintFilename)
+        logger.info("%s database building", DatabaseName)
+        (out, err) = Makeblastdb(FastaFile, DatabaseName).launch()
+        if err:
+            return False
+        with open(FingerprintFilename, "w") as FingerprintFile:
+            FingerprintFile.write(Fingerprint)
+    return True
+
+class DatabaseRegistry(object):
+    """Registry of blast databases in RegistryDir.
+
+    The databases built from a fasta file are shared by the jobs using the same
+    registry: they are found by the content of the fasta file and the
+    makeblastdb options. Once checked with blastdbcmd, a database is only
+    validated by the sizes and modification times of its files."""
+    def __init__(self, RegistryDir):
+        self.logger = logging.getLogger('main.lib.BlastPlus.DatabaseRegistry')
+        self.RegistryDir = RegistryDir
+        self.Dbtype = "nucl"
+        self.IndexedDatabase = True
+        self.VolumeNb = 1
+
+    def key(self, FastaFile):
+        """Return the key of the database of FastaFile"""
+        Options = [content_fingerprint(FastaFile), self.Dbtype, self.IndexedDatabase]
+        if self.VolumeNb > 1:
+            Options.append(self.VolumeNb)
+        return hashlib.sha1("|".join([str(Option) for Option in Options])).hexdigest()
+
+    def record_filename(self, DatabaseName):
+        RecordDirName = os.path.join(self.RegistryDir, "checked")
+        if not os.path.isdir(RecordDirName):
+            try:
+                os.makedirs(RecordDirName)
+            except OSError:
+                # created by a concurrent job
+                pass
+        return os.path.join(RecordDirName, hashlib.sha1(os.path.abspath(DatabaseName)).hexdigest())
+
+    def is_database(self, DatabaseName):
+        """Return True if DatabaseName is a blast database. blastdbcmd is only
+        launched if the files of the database changed since the last check"""
+        RecordFilename = self.record_filename(DatabaseName)
+        Fingerprint = database_fingerprint(DatabaseName)
+        if os.path.isfile(RecordFilename):
+            with open(RecordFilename) as RecordFile:
+                if RecordFile.read() == Fingerprint:
+                    return True
+        if not Blastdbcmd(DatabaseName, "", "").is_database():
+            return False
+        if not glob.glob(DatabaseName + ".*"):
+            # found elsewhere by blastdbcmd (BLASTDB), nothing to fingerprint
+            return True
+        (TmpFileDescriptor, TmpFilename) = tempfile.mkstemp(dir=os.path.dirname(RecordFilename))
+        with os.fdopen(TmpFileDescriptor, "w") as TmpFile:
+            TmpFile.write(Fingerprint)
+        os.rename(TmpFilename, RecordFilename)
+        return True
+
+    def database(self, FastaFile):
+        """Return the name of the database of FastaFile, build it if it is not
+        in the registry. Return an empty string if it can not be built."""
+        Key = self.key(FastaFile)
+        DatabaseDirName = os.path.join(self.RegistryDir, Key)
+        DatabaseName = os.path.join(DatabaseDirName, "db")
+        if not os.path.isdir(DatabaseDirName):
+            try:
+                os.makedirs(DatabaseDirName)
+            except OSError:
+                pass
+        # A job building the same database makes the others wait
+        with locked(DatabaseDirName + ".lock"):
+            if os.path.isfile(DatabaseDirName + ".done") and self.is_database(DatabaseName):
+                self.logger.info("Database %s of %s exists", DatabaseName, FastaFile)
+                return DatabaseName
+            self.logger.info("%s database building from %s", DatabaseName, FastaFile)
+            for Filename in glob.glob(DatabaseName + ".*"):
+                os.remove(Filename)
+            MakeblastdbProcess = Makeblastdb(FastaFile, DatabaseName)
+            MakeblastdbProcess.Dbtype = self.Dbtype
+            MakeblastdbProcess.IndexedDatabase = self.IndexedDatabase
+            MakeblastdbProcess.VolumeNb = self.VolumeNb
+            (out, err) = MakeblastdbProcess.launch()
+            if err or not self.is_database(DatabaseName):
+                self.logger.error("Problem in the database building")
+                return ""
+            open(DatabaseDirName + ".done", "w").close()
+        return DatabaseName
+
+# Rough cost model of a blastn search, in database residues scanned: the queries
+# are searched by batches of QueryBatchLength residues, each batch scanning the
+# whole database, each query costs QueryCost and building the database costs
+# DatabaseBuildCost by residue.
+QueryBatchLength = 100000
+QueryCost = 20000
+DatabaseBuildCost = 2
+
+def search_cost(QueryNb, QueryLength, DatabaseLength, BuildDatabase=True):
+    """Return the estimated cost of the search of QueryNb queries of QueryLength
+    residues in total on a database of DatabaseLength residues"""
+    BatchNb = max(1, (QueryLength + QueryBatchLength - 1) // QueryBatchLength)
+    Cost = BatchNb * DatabaseLength + QueryNb * QueryCost
+    if BuildDatabase:
+        Cost += DatabaseBuildCost * DatabaseLength
+    return Cost
+
+class BlastCache(object):
+    """Define an on-disk cache of the tabular blast hits of query sequences,
+    the least recently used hits are removed above MaxSize bytes"""
+    def __init__(self, CacheDir):
+        self.logger = logging.getLogger('main.lib.BlastPlus.BlastCache')
+        self.CacheDir = CacheDir
+        self.MaxSize = 2000 * 1024 * 1024
+        self.Hits = 0
+        self.Misses = 0
+
+    def connect(self):
+        if not os.path.isdir(self.CacheDir):
+            try:
+                os.makedirs(self.CacheDir)
+            except OSError:
+                # Already created by a concurrent job
+                pass
+        Connection = sqlite3.connect(os.path.join(self.CacheDir, "blast_cache.sqlite"), timeout=600)
+        Connection.text_factory = str
+        Connection.execute("CREATE TABLE IF NOT EXISTS hits (key TEXT PRIMARY KEY, hits TEXT, size INTEGER, last_used REAL)")
+        Connection.execute("CREATE INDEX IF NOT EXISTS hits_last_used ON hits (last_used)")
+        return Connection
+
+    def find(self, Connection, Keys):
+        """Return the set of keys present in the cache and mark them as used"""
+        Found = set()
+        Now = time.time()
+        with Connection:
+            for i in range(0, len(Keys), 500):
+                Batch = Keys[i:i+500]
+                Marks = ",".join(["?"] * len(Batch))
+                Found.update([Key for (Key,) in Connection.execute("SELECT key FROM hits WHERE key IN (%s)" %Marks, Batch)])
+                Connection.execute("UPDATE hits SET last_used = ? WHERE key IN (%s)" %Marks, [Now] + Batch)
+        return Found
+
+    def get(self, Connection, Key):
+        Row = Connection.execute("SELECT hits FROM hits WHERE key = ?", (Key,)).fetchone()
+        if Row is None:
+            return ""
+        return Row[0]
+
+    def put(self, Connection, Items):
+        """Add (key, hits) in the cache and evict the least recently used hits"""
+        Now = time.time()
+        with Connection:
+            Connection.executemany("INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?)",
+                                   [(Key, Hits, len(Hits) + len(Key), Now) for (Key, Hits) in Items])
+            Size = Connection.execute("SELECT COALESCE(SUM(size), 0) FROM hits").fetchone()[0]
+            if Size > self.MaxSize:
+                Evicted = []
+                for (Key, KeySize) in Connection.execute("SELECT key, size FROM hits ORDER BY last_used"):
+                    if Size <= self.MaxSize:
+                        break
+                    Evicted.append((Key,))
+                    Size -= KeySize
+                Connection.executemany("DELETE FROM hits WHERE key = ?", Evicted)
+                self.logger.info("Blast cache: %s entries evicted", len(Evicted))
+
+def split_by_search_space(FastaFile, SearchSpaces, OutputPrefix, BufferSize=10000000):
+    """Split a fasta file in files of the sequences with the same search space,
+    the sequences without search space are left out. Return the list of
+    (search space, file name, sequence names) sorted by search space."""
+    Groups = {}
+    Buffers = {}
+    BufferedSize = 0
+    for (Name, Sequence) in Fasta.iter_fasta(FastaFile):
+        if not Name in SearchSpaces:
+            continue
+        SearchSpace = SearchSpaces[Name]
+        if not SearchSpace in Groups:
+            Groups[SearchSpace] = ("%s.%s.fa" %(OutputPrefix, len(Groups)), [])
+            Buffers[SearchSpace] = []
+            open(Groups[SearchSpace][0], "w").close()
+        Groups[SearchSpace][1].append(Name)
+        Buffers[SearchSpace].append(Fasta.format_fasta(Name, Sequence))
+        BufferedSize += len(Sequence)
+        if BufferedSize > BufferSize:
+            flush_buffers(Buffers, Groups)
+            BufferedSize = 0
+    flush_buffers(Buffers, Groups)
+    return [(SearchSpace, Groups[SearchSpace][0], Groups[SearchSpace][1]) for SearchSpace in sorted(Groups)]
+
+def flush_buffers(Buffers, Groups):
+    """Append the buffered records of each group to its file"""
+    for (SearchSpace, Buffer) in Buffers.items():
+        if Buffer:
+            with open(Groups[SearchSpace][0], "a") as GroupFile:
+                GroupFile.write("".join(Buffer))
+            Buffers[SearchSpace] = []
+
+def split_fasta(FastaFile, ChunkNb, OutputPrefix):
+    """Split a fasta file in at most ChunkNb files of consecutive sequences
+    with a similar number of residues. Return the list of file names."""
+    TotalLength = 0
+    with open(FastaFile, "r") as Fasta:
+        for line in Fasta:
+            if not line.startswith(">"):
+                TotalLength += len(line.strip())
+    if ChunkNb <= 1 or not TotalLength:
+        return [FastaFile]
+    ChunkLength = TotalLength / float(ChunkNb)
+
+    ChunkFiles = []
+    Chunk = None
+    Length = 0
+    with open(FastaFile, "r") as Fasta:
+        for line in Fasta:
+            if line.startswith(">") and (Chunk is None or
+                                         (Length >= ChunkLength * len(ChunkFiles) and len(ChunkFiles) < ChunkNb)):
+                if Chunk is not None:
+                    Chunk.close()
+                ChunkFiles.append("%s.%s.fa" %(OutputPrefix, len(ChunkFiles)))
+                Chunk = open(ChunkFiles[-1], "w")
+            elif not line.startswith(">"):
+                Length += len(line.strip())
+            if Chunk is not None:
+                Chunk.write(line)
+    if Chunk is not None:
+        Chunk.close()
+    return ChunkFiles
+
 class Blastdbcmd(object):
     """Define a object to launch blastdbcmd on a local database"""
     def __init__(self, Database, SequenceNamesFile, OutputFile):
@@ -150,6 +872,29 @@ class Blastdbcmd(object):
             self.logger.error(err)
         return (out, err)
 
+    def get_info(self):
+        """Return the number of sequences and the total number of residues of the database"""
+        (SequenceNb, Length) = (0, 0)
+        command = ["blastdbcmd", "-db", self.Database, "-info"]
+        self.logger.debug(" ".join(command))
+        p = subprocess.Popen(command,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        (out, err) = p.communicate()
+        if err:
+            self.logger.error(err)
+        for line in out.split("\n"):
+            # "\t1,234 sequences; 567,890 total bases"
+            if "sequences;" in line:
+                SequenceNb = int(line.split()[0].replace(",", ""))
+                Length = int(line.split(";")[1].split()[0].replace(",", ""))
+                break
+        return (SequenceNb, Length)
+
+    def get_length(self):
+        """Return the total number of residues of the database"""
+        return self.get_info()[1]
+
     def is_database(self):
         Out = False
         command = ["blastdbcmd", "-db", self.Database, "-info"]
@@ -0,0 +1,205 @@
+# File: Collapser.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+import re
+import hashlib
+import logging
+
+import numpy
+import pandas
+
+import Fasta
+
+
+# Trinity isoforms of a gene: TRINITY_DN1000_c0_g1_i1 (or TRINITY_DN1000_c0_g1_i1.p1 for an ORF)
+GenePattern = re.compile(r"^(.*_g\d+)_i\d+")
+
+# Smallest evalue given by blast, smaller ones are written 0
+MinEvalue = 1e-180
+
+def gene_name(Name):
+    """Return the Trinity gene of an isoform, or the name itself"""
+    Match = GenePattern.match(Name)
+    if Match:
+        return Match.group(1)
+    return Name
+
+
+class QueryCollapser(object):
+    """Define an object to search only one representative of the identical
+    query sequences, or of the isoforms of a Trinity gene contained in another
+    isoform, and to give the hits of each representative to its members.
+
+    The hits of identical members are those of their representative. The
+    hits of contained members are estimated from the hits of the longer
+    isoform: they are approximate, a direct search may find other hits for
+    them, which is why Contained is off by default"""
+    def __init__(self):
+        self.logger = logging.getLogger('main.lib.Collapser')
+        self.Contained = False
+        # Evalue threshold of the search, the clipped hits above it are discarded
+        self.Evalue = None
+        # representative -> [(member, offset in the representative, member length)]
+        self.Members = {}
+        # representative -> its length, for the representatives with contained members
+        self.Lengths = {}
+        self.QueryNb = 0
+        self.RepresentativeNb = 0
+
+    def add_member(self, Representative, Member, Offset, Length):
+        self.Members.setdefault(Representative, []).append((Member, Offset, Length))
+
+    def member_nb(self, Representatives):
+        return sum([len(self.Members.get(Representative, [])) for Representative in Representatives])
+
+    def collapse(self, QueryFile, RepresentativeFile):
+        """Write in RepresentativeFile the representatives of the sequences of QueryFile,
+        in the order of QueryFile. Return the number of representatives.
+
+        With Contained, the isoforms of a gene are only compared with the isoforms
+        of the same gene which are just before or after them in QueryFile, as in
+        Trinity outputs."""
+        # sequence digest -> (representative, offset, length)
+        Representatives = {}
+        Run = []
+        with open(RepresentativeFile, "w") as Output:
+            for (Name, Sequence) in Fasta.iter_fasta(QueryFile):
+                self.QueryNb += 1
+                Key = hashlib.sha1(Sequence.upper()).digest()[:12]
+                if Key in Representatives:
+                    (Representative, Offset, Length) = Representatives[Key]
+                    self.add_member(Representative, Name, Offset, Length)
+                elif self.Contained:
+                    if Run and gene_name(Name) != gene_name(Run[0][0]):
+                        self.collapse_run(Run, Representatives, Output)
+                        Run = []
+                    Run.append((Name, Sequence, Key))
+                else:
+                    Representatives[Key] = (Name, 0, len(Sequence))
+                    Output.write(Fasta.format_fasta(Name, Sequence))
+                    self.RepresentativeNb += 1
+            if Run:
+                self.collapse_run(Run, Representatives, Output)
+        self.logger.info("%s queries, %s representatives (%.1f%% of the queries are not searched)",
+                         self.QueryNb, self.RepresentativeNb,
+                         100.0 * (self.QueryNb - self.RepresentativeNb) / max(1, self.QueryNb))
+        return self.RepresentativeNb
+
+    def collapse_run(self, Run, Representatives, Output):
+        """Keep the isoforms of a gene not contained in a longer isoform"""
+        Kept = []
+        KeptNames = set()
+        for (Name, Sequence, Key) in sorted(Run, key=lambda Isoform: -len(Isoform[1])):
+            Sequence = Sequence.upper()
+            if Key in Representatives:
+                (Representative, Offset, Length) = Representatives[Key]
+                self.add_member(Representative, Name, Offset, Length)
+                continue
+            for (KeptName, KeptSequence) in Kept:
+                Offset = KeptSequence.find(Sequence)
+                if Offset >= 0:
+                    Representatives[Key] = (KeptName, Offset, len(Sequence))
+                    self.add_member(KeptName, Name, Offset, len(Sequence))
+                    self.Lengths[KeptName] = len(KeptSequence)
+                    break
+            else:
+                Representatives[Key] = (Name, 0, len(Sequence))
+                Kept.append((Name, Sequence))
+                KeptNames.add(Name)
+        for (Name, Sequence, _) in Run:
+            if Name in KeptNames:
+                Output.write(Fasta.format_fasta(Name, Sequence))
+                self.RepresentativeNb += 1
+
+    def fan_out(self, BlastTable):
+        """Add to a blast table the hits of the members of its queries.
+
+        The hits of a contained member are clipped to its part of the representative,
+        in its own query coordinates, with an alignment length and a score
+        proportional to the kept part of the alignment. Their evalue is
+        recomputed for the clipped score and the member length (E = m n 2^-S)
+        and the hits above the Evalue threshold are discarded."""
+        Queries = [Query for Query in BlastTable.qid.unique() if Query in self.Members]
+        if not Queries:
+            return BlastTable
+        Members = pandas.DataFrame([(Query, Member, Offset, Length) for Query in Queries
+                                    for (Member, Offset, Length) in self.Members[Query]],
+                                   columns=["qid", "member", "offset", "length"])
+        Table = BlastTable.assign(row=numpy.arange(len(BlastTable.index)))
+        Table = pandas.merge(Table, Members, on="qid").sort_values("row", kind="mergesort")
+        # Decreasing query coordinates (reverse strand hits of some search
+        # backends) are swapped with the target ones: the hit keeps its orientation
+        Decreasing = Table.qstart.values > Table.qend.values
+        if Decreasing.any():
+            Table = Table.assign(qstart=numpy.where(Decreasing, Table.qend.values, Table.qstart.values),
+                                 qend=numpy.where(Decreasing, Table.qstart.values, Table.qend.values),
+                                 tstart=numpy.where(Decreasing, Table.tend.values, Table.tstart.values),
+                                 tend=numpy.where(Decreasing, Table.tstart.values, Table.tend.values))
+
+        Start = numpy.maximum(Table.qstart.values, Table.offset.values + 1)
+        End = numpy.minimum(Table.qend.values, Table.offset.values + Table.length.values)
+        Overlap = Start <= End
+        Table = Table[Overlap]
+        (Start, End) = (Start[Overlap], End[Overlap])
+        # The query coordinates are increasing, the orientation is given by the target ones
+        Left = Start - Table.qstart.values
+        Right = Table.qend.values - End
+        Forward = Table.tstart.values <= Table.tend.values
+        KeptPart = (End - Start + 1.0) / (Table.qend.values - Table.qstart.values + 1)
+        Score = Table.score.values * KeptPart
+        RepresentativeLength = numpy.array([self.Lengths.get(Query, Length) for (Query, Length)
+                                            in zip(Table.qid.values, Table.length.values)], dtype="float64")
+        # log2 of the search space E 2^S of the representative. It is the same for
+        # all its hits: for the null evalues (blast gives 0 below MinEvalue), it
+        # is read on another hit of the representative if possible
+        Space = numpy.where(Table.evalue.values > 0,
+                            numpy.log2(numpy.maximum(Table.evalue.values, MinEvalue)) + Table.score.values,
+                            numpy.nan)
+        QuerySpace = pandas.Series(Space, index=Table.index).groupby(Table.qid.values).transform("max").values
+        Space = numpy.where(numpy.isnan(Space), QuerySpace, Space)
+        Space = numpy.where(numpy.isnan(Space), numpy.log2(MinEvalue) + Table.score.values, Space)
+        Evalue = numpy.where(Table.length.values < RepresentativeLength,
+                             numpy.exp2(Space + numpy.log2(Table.length.values / RepresentativeLength) - Score),
+                             Table.evalue.values)
+        Table = Table.assign(qid=Table.member.values,
+                             qstart=Start - Table.offset.values,
+                             qend=End - Table.offset.values,
+                             tstart=numpy.where(Forward, Table.tstart.values + Left, Table.tstart.values - Left),
+                             tend=numpy.where(Forward, Table.tend.values - Right, Table.tend.values + Right),
+                             alilen=numpy.round(Table.alilen.values * KeptPart).astype("int64"),
+                             evalue=Evalue,
+                             score=Score)
+        if self.Evalue is not None:
+            Table = Table[Table.evalue.values <= self.Evalue]
+        return pandas.concat([BlastTable, Table[list(BlastTable.columns)]], ignore_index=True)
@@ -0,0 +1,134 @@
+# File: Demultiplexer.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+import logging
+
+import Fasta
+
+
+class FamilyDemultiplexer(object):
+    """Define an object to write the sequences retained in each family
+    reading the query fasta file only once"""
+    def __init__(self, OutPrefixName, SpeciesQuery, SpeciesID):
+        self.logger = logging.getLogger('main.lib.Demultiplexer')
+        self.OutPrefixName = OutPrefixName
+        self.SpeciesQuery = SpeciesQuery
+        self.SeqPrefix = "TR%s0" %(SpeciesID)
+        self.SeqNb = 1
+        self.NbFigures = 10
+        self.Sp2SeqByFamily = False
+        self.TableOneFile = False
+        # Number of characters kept in memory before writing the family files
+        self.BufferSize = 10000000
+        self.Buffers = {}
+        self.BufferedSize = 0
+
+    def family_files(self, Family):
+        Files = {"fa": "%s.%s.fa" %(self.OutPrefixName, Family)}
+        if self.Sp2SeqByFamily:
+            Files["sp2seq"] = "%s.%s.sp2seq.txt" %(self.OutPrefixName, Family)
+        return Files
+
+    def flush(self):
+        for (Family, Buffer) in self.Buffers.items():
+            for (Key, Filename) in self.family_files(Family).items():
+                if Buffer[Key]:
+                    with open(Filename, "a") as File:
+                        File.write("".join(Buffer[Key]))
+                    Buffer[Key] = []
+        self.BufferedSize = 0
+
+    def add_family(self, Family):
+        if not Family in self.Buffers:
+            self.Buffers[Family] = {"fa": [], "sp2seq": []}
+            # Create all family files, even if empty
+            for Filename in self.family_files(Family).values():
+                open(Filename, "w").close()
+
+    def write_sequence(self, Sequence, Family, Target, Reverse, TableFile):
+        SeqName = "%s%s_%s" %(self.SeqPrefix, str(self.SeqNb).zfill(self.NbFigures), Family)
+        self.SeqNb += 1
+        # Sequences were extracted from a blast database, keep the same case
+        Sequence = Sequence.upper()
+        if Reverse:
+            Sequence = Fasta.rev_complement(Sequence)
+            self.logger.info(SeqName + ": Reversed sequence")
+
+        Record = Fasta.format_fasta(SeqName, Sequence)
+        self.Buffers[Family]["fa"].append(Record)
+        self.BufferedSize += len(Record)
+        if self.Sp2SeqByFamily:
+            self.Buffers[Family]["sp2seq"].append("%s:%s\n" %(self.SpeciesQuery, SeqName))
+        if TableFile:
+            # Write in the output table query target family
+            TableFile.write("%s\t%s\t%s\n" %(SeqName, Target, Family))
+
+        if self.BufferedSize > self.BufferSize:
+            self.flush()
+
+    def open_table(self):
+        if self.TableOneFile:
+            return open("%s_table.tsv" %(self.OutPrefixName), "w")
+        return None
+
+    def dispatch_ranked(self, QueryFile, RankedRetainedQueries):
+        """Write the retained sequences of each family without keeping them in memory.
+
+        RankedRetainedQueries yields (rank, family, target, reverse) sorted by
+        rank, the position of the query in QueryFile.
+        Return the number of written sequences."""
+        self.Buffers = {}
+        TableFile = self.open_table()
+        WrittenNb = 0
+        Retained = iter(RankedRetainedQueries)
+        Next = next(Retained, None)
+        for (Rank, (Query, Sequence)) in enumerate(Fasta.iter_fasta(QueryFile)):
+            if Next is None:
+                break
+            if Next[0] != Rank:
+                continue
+            (_, Family, Target, Reverse) = Next
+            self.add_family(Family)
+            self.write_sequence(Sequence, Family, Target, Reverse, TableFile)
+            WrittenNb += 1
+            Next = next(Retained, None)
+
+        self.flush()
+        if TableFile:
+            TableFile.close()
+
+        MissingNb = len(list(Retained)) + (Next is not None)
+        if MissingNb:
+            self.logger.warning("%s retained sequences are not in %s", MissingNb, QueryFile)
+        return WrittenNb
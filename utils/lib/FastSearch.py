@@ -0,0 +1,144 @@
+# File: FastSearch.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+import os
+import re
+import shutil
+import logging
+import tempfile
+import subprocess
+
+
+class Mmseqs(object):
+    """Define an object to launch a MMseqs2 nucleotide search with a blast
+    tabular output (outfmt 6)"""
+    def __init__(self, QueryFile, TargetFile):
+        self.logger = logging.getLogger('main.lib.FastSearch.Mmseqs')
+        self.QueryFile = QueryFile
+        self.TargetFile = TargetFile
+        self.TmpDirName = ""
+        self.Threads = 1
+        self.Evalue = 10
+        self.max_target_seqs = 500
+        self.Sensitivity = 0
+
+    def launch(self, OutputFile):
+        TmpDirName = tempfile.mkdtemp(prefix="tmp_Mmseqs", dir=self.TmpDirName or None)
+        command = ["mmseqs", "easy-search", self.QueryFile, self.TargetFile,
+                   OutputFile, TmpDirName,
+                   "--search-type", "3",
+                   # both strands: the default only finds forward transcripts
+                   "--strand", "2",
+                   "--format-output", "query,target,pident,alnlen,mismatch,gapopen,qstart,qend,tstart,tend,evalue,bits",
+                   "-e", str(self.Evalue),
+                   "--max-seqs", str(self.max_target_seqs),
+                   "--threads", str(self.Threads)]
+        if self.Sensitivity:
+            command.extend(["-s", str(self.Sensitivity)])
+
+        self.logger.debug(" ".join(command))
+        p = subprocess.Popen(command,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        (out, err) = p.communicate()
+        shutil.rmtree(TmpDirName)
+        # mmseqs writes its progress on stderr
+        if p.returncode:
+            self.logger.error(err)
+        else:
+            err = ""
+        return (out, err)
+
+class Minimap2(object):
+    """Define an object to launch minimap2 and convert its output in a blast
+    tabular output (outfmt 6). The evalue column is 0 and the score column
+    is the minimap2 alignment score (AS)."""
+    def __init__(self, QueryFile, TargetFile):
+        self.logger = logging.getLogger('main.lib.FastSearch.Minimap2')
+        self.QueryFile = QueryFile
+        self.TargetFile = TargetFile
+        self.Threads = 1
+        self.Preset = "asm20"
+        self.max_target_seqs = 500
+
+    def launch(self, OutputFile):
+        command = ["minimap2", "-c", "-x", self.Preset,
+                   "--secondary=yes", "-N", str(self.max_target_seqs),
+                   "-t", str(self.Threads),
+                   self.TargetFile, self.QueryFile]
+
+        self.logger.debug(" ".join(command))
+        ErrFile = tempfile.TemporaryFile()
+        p = subprocess.Popen(command,
+                             stdout=subprocess.PIPE,
+                             stderr=ErrFile)
+        with open(OutputFile, "w") as Output:
+            for line in p.stdout:
+                Output.write(paf2blast(line))
+        p.wait()
+        ErrFile.seek(0)
+        err = ErrFile.read()
+        ErrFile.close()
+        # minimap2 writes its progress on stderr
+        if p.returncode:
+            self.logger.error(err)
+        else:
+            err = ""
+        return ("", err)
+
+def paf2blast(line):
+    """Convert a PAF line (with a cg tag) in a blast tabular line"""
+    Fields = line.rstrip("\n").split("\t")
+    if len(Fields) < 12:
+        return ""
+    (qid, _, qstart, qend, strand, tid, _, tstart, tend, matches, alilen) = Fields[:11]
+    Tags = dict([(Tag[:2], Tag[5:]) for Tag in Fields[12:]])
+    GapLength = 0
+    GapOpen = 0
+    for (Length, Operation) in re.findall(r"(\d+)([MID])", Tags.get("cg", "")):
+        if Operation != "M":
+            GapLength += int(Length)
+            GapOpen += 1
+    Mismatches = max(0, int(Tags.get("NM", 0)) - GapLength)
+    Identity = 100.0 * int(matches) / max(1, int(alilen))
+    # blast coordinates are 1-based and the target ones are reversed on the minus strand
+    if strand == "+":
+        (TargetStart, TargetEnd) = (int(tstart) + 1, int(tend))
+    else:
+        (TargetStart, TargetEnd) = (int(tend), int(tstart) + 1)
+    return "%s\t%s\t%.3f\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" %(qid, tid, Identity, alilen,
+                                                           Mismatches, GapOpen,
+                                                           int(qstart) + 1, qend,
+                                                           TargetStart, TargetEnd,
+                                                           0, Tags.get("AS", matches))
@@ -0,0 +1,92 @@
+# File: Fasta.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+import string
+
+
+def iter_fasta_headers(FastaFilename):
+    """Read a fasta file sequence by sequence and yield (name, header, sequence).
+    The name is the first word of the header, the header is the whole header
+    line without ">"."""
+    with open(FastaFilename, "r") as File:
+        name = ""
+        header = ""
+        sequence_list = []
+        for line in File:
+            if line.startswith(">"):
+                if name:
+                    yield (name, header, "".join(sequence_list))
+                header = line[1:].strip()
+                name = header.split()[0] if header else ""
+                sequence_list = []
+            elif name:
+                sequence_list.append(line.strip())
+        if name:
+            yield (name, header, "".join(sequence_list))
+
+def iter_fasta(FastaFilename):
+    """Read a fasta file sequence by sequence and yield (name, sequence).
+    The name is the first word of the header."""
+    for (name, _, sequence) in iter_fasta_headers(FastaFilename):
+        yield (name, sequence)
+
+def fasta_lengths(FastaFilename):
+    """Return the list of the sequence lengths of a fasta file"""
+    return [len(sequence) for (_, sequence) in iter_fasta(FastaFilename)]
+
+def extract_sequences(FastaFilename, Names, OutputFilename):
+    """Write the sequences of a fasta file whose name is in Names in OutputFilename.
+    Return the list of their lengths."""
+    Names = set(Names)
+    lengths = []
+    with open(OutputFilename, "w") as Output:
+        for (name, sequence) in iter_fasta(FastaFilename):
+            if name in Names:
+                Output.write(format_fasta(name, sequence))
+                lengths.append(len(sequence))
+    return lengths
+
+def rev_complement(Sequence_str):
+    intab = "ABCDGHMNRSTUVWXYabcdghmnrstuvwxy"
+    outtab = "TVGHCDKNYSAABWXRtvghcdknysaabwxr"
+    trantab = string.maketrans(intab, outtab)
+    # Reverse
+    Reverse = Sequence_str.replace("\n", "")[::-1]
+    # Complement
+    Complement = Reverse.translate(trantab)
+    return Complement
+
+def format_fasta(name, sequence, width=60):
+    """Return a fasta record with lines of width characters"""
+    return ">" + name + "\n" + '\n'.join(sequence[i:i+width] for i in range(0, len(sequence), width)) + "\n"
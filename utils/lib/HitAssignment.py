@@ -0,0 +1,479 @@
+# File: HitAssignment.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import os
+import heapq
+import logging
+
+import numpy
+import pandas
+
+import Metrics
+
+logger = logging.getLogger('main.lib.HitAssignment')
+
+# Fields: query id, subject id, % identity, alignment length, mismatches, gap opens, q. start, q. end, s. start, s. end, evalue, bit score
+FieldNames = ["qid", "tid", "id", "alilen", "mis", "gap", "qstart", "qend", "tstart", "tend", "evalue", "score"]
+FieldTypes = {"qid": str, "tid": str, "id": "float64", "alilen": "int64",
+              "mis": "int64", "gap": "int64", "qstart": "int64", "qend": "int64",
+              "tstart": "int64", "tend": "int64", "evalue": "float64", "score": "float64"}
+
+
+def read_blast_table(BlastOutput, chunksize=None):
+    """Read a blast tabular output (outfmt 6) from a file name or a file object.
+
+    If chunksize is given, return an iterator of tables of at most chunksize hits."""
+    try:
+        Table = pandas.read_csv(BlastOutput, sep="\t", header=None,
+                                names=FieldNames, dtype=FieldTypes,
+                                engine="c", chunksize=chunksize)
+    except pandas.errors.EmptyDataError:
+        Table = pandas.DataFrame({Field: pandas.Series([], dtype=FieldTypes[Field]) for Field in FieldNames},
+                                 columns=FieldNames)
+        if chunksize:
+            Table = iter([])
+    return Table
+
+def iter_query_blocks(Chunks):
+    """Regroup chunks of a blast table in tables containing all the hits of their queries.
+
+    Blast writes all the hits of a query together, so only the last query of
+    a chunk can have hits in the next chunk."""
+    Pending = None
+    for Chunk in Chunks:
+        if not len(Chunk.index):
+            continue
+        if Pending is not None:
+            Chunk = pandas.concat([Pending, Chunk], ignore_index=True)
+        IsLastQuery = Chunk.qid.values == Chunk.qid.values[-1]
+        Pending = Chunk[IsLastQuery]
+        if not IsLastQuery.all():
+            yield Chunk[~IsLastQuery]
+    if Pending is not None:
+        yield Pending
+
+
+def query_ranks(QueryNames):
+    """Return a dictionary query id -> position in the query fasta file"""
+    Ranks = {}
+    for Query in QueryNames:
+        if Query:
+            Ranks.setdefault(Query.split()[0], len(Ranks))
+    return Ranks
+
+def add_best_score(BlastTableWithFamilies, Ranks):
+    """Keep the hits of the known queries and add the best score of each query"""
+    Table = BlastTableWithFamilies[BlastTableWithFamilies.qid.isin(list(Ranks))]
+    Table = Table.assign(best_score=Table.groupby("qid")["score"].transform("max"))
+    return Table
+
+def count_families(BestTargetTable):
+    """Return the number of distinct families of the best targets of each query"""
+    QueryFamilies = BestTargetTable.drop_duplicates(["qid", "Family"])
+    return QueryFamilies.qid.value_counts()
+
+def list_families(BestTargetTable, Queries):
+    """Return a dictionary query -> families of its best targets (in hit order)"""
+    QueryFamilies = BestTargetTable[BestTargetTable.qid.isin(Queries)]
+    QueryFamilies = QueryFamilies.drop_duplicates(["qid", "Family"])
+    Families = {}
+    for (Query, Family) in zip(QueryFamilies.qid.values, QueryFamilies.Family.values):
+        Families.setdefault(Query, []).append(Family)
+    return Families
+
+def best_target_table(Table, Ranks, threshold_list, AmbiguousNb=None):
+    """Return the best targets of the queries attributed to a unique family,
+    with their orientation and their rank, in the query file order.
+
+    If AmbiguousNb is a dictionary, add to AmbiguousNb[threshold] the number of
+    queries still attributed to several families with each threshold."""
+    if AmbiguousNb is None:
+        AmbiguousNb = {}
+    Selected = []
+    Pending = Table
+    for (t_i, threshold) in enumerate(threshold_list):
+        BestTargetTable = Pending[Pending.score >= threshold * Pending.best_score]
+        FamilyNb = count_families(BestTargetTable)
+        Ambiguous = FamilyNb[FamilyNb > 1].index
+        if t_i == len(threshold_list) - 1:
+            Selected.append(BestTargetTable)
+        else:
+            AmbiguousNb[threshold] = AmbiguousNb.get(threshold, 0) + len(Ambiguous)
+            for Query in Ambiguous:
+                logger.debug("More than one family can be attributed with the threshold [%s * maxscore] to %s. Try with another threshold.", threshold, Query)
+            Selected.append(BestTargetTable[~BestTargetTable.qid.isin(Ambiguous)])
+            Pending = Pending[Pending.qid.isin(Ambiguous)]
+    BestTargetTable = pandas.concat(Selected)
+
+    FamilyNb = count_families(BestTargetTable)
+    Ambiguous = FamilyNb[FamilyNb > 1].index
+    AmbiguousNb[threshold_list[-1]] = AmbiguousNb.get(threshold_list[-1], 0) + len(Ambiguous)
+    AmbiguousFamilies = list_families(BestTargetTable, Ambiguous)
+    for Query in sorted(AmbiguousFamilies, key=Ranks.get):
+        logger.info("More than one family can be attributed to %s:\n\t- %s\nIt will be discarded.", Query, "\n\t- ".join(AmbiguousFamilies[Query]))
+
+    BestTargetTable = BestTargetTable[~BestTargetTable.qid.isin(Ambiguous)]
+    Reverse = (BestTargetTable["qend"] - BestTargetTable["qstart"]) * (BestTargetTable["tend"] - BestTargetTable["tstart"]) < 0
+    BestTargetTable = BestTargetTable.assign(reverse=Reverse)
+    # Keep the orientation of the first hit of a query on a target
+    BestTargetTable = BestTargetTable.assign(reverse=BestTargetTable.groupby(["qid", "tid"])["reverse"].transform("first"),
+                                             rank=BestTargetTable.qid.map(Ranks))
+    BestTargetTable = BestTargetTable.sort_values("rank", kind="mergesort")
+    return BestTargetTable
+
+class QueryIndex(object):
+    """Compact index query id -> position in the query fasta file, stored in
+    sorted numpy arrays instead of a dictionary"""
+    def __init__(self, QueryNames):
+        Names = numpy.array([Query.split()[0] for Query in QueryNames if Query], dtype=str)
+        # numpy.unique keeps the first position of duplicated names
+        (self.Names, self.Ranks) = numpy.unique(Names, return_index=True)
+
+    def __len__(self):
+        return len(self.Names)
+
+    def get(self, Queries):
+        """Return the ranks of Queries (a numpy array), -1 for unknown queries"""
+        if not len(self.Names):
+            return numpy.full(len(Queries), -1, dtype="int64")
+        # One more character so that a longer query can not match a truncated name
+        Queries = numpy.asarray(Queries).astype("S%s" %(self.Names.dtype.itemsize + 1))
+        Positions = numpy.searchsorted(self.Names, Queries).clip(0, len(self.Names) - 1)
+        return numpy.where(self.Names[Positions] == Queries, self.Ranks[Positions], -1)
+
+    def names_by_rank(self, Ranks):
+        """Return the names of the queries of the given ranks, sorted by rank"""
+        Order = numpy.argsort(self.Ranks)
+        Known = numpy.isin(self.Ranks[Order], Ranks)
+        return list(self.Names[Order][Known])
+
+
+class HitTable(object):
+    """Best hits of queries stored as integer-coded numpy arrays: query rank,
+    target code, family code, score, orientation and approximation of the
+    score (about 26 bytes by hit)"""
+    def __init__(self, Query=(), Target=(), Family=(), Score=(), Reverse=(), Approximate=None):
+        self.Query = numpy.asarray(Query, dtype="int64")
+        self.Target = numpy.asarray(Target, dtype="int32")
+        self.Family = numpy.asarray(Family, dtype="int32")
+        self.Score = numpy.asarray(Score, dtype="float64")
+        self.Reverse = numpy.asarray(Reverse, dtype="bool")
+        # True for the scores estimated without alignment (KmerIndex.prefilter)
+        if Approximate is None:
+            Approximate = numpy.zeros(len(self.Query), dtype="bool")
+        self.Approximate = numpy.asarray(Approximate, dtype="bool")
+
+    def __len__(self):
+        return len(self.Query)
+
+    def take(self, Selection):
+        return HitTable(self.Query[Selection], self.Target[Selection], self.Family[Selection],
+                        self.Score[Selection], self.Reverse[Selection], self.Approximate[Selection])
+
+    def query_nb(self):
+        return len(numpy.unique(self.Query))
+
+    def first_hits(self):
+        """Return the first hit of each query, sorted by rank"""
+        (_, First) = numpy.unique(self.Query, return_index=True)
+        return self.take(First)
+
+    def retained(self, Threshold=0.9, GroupStarts=[0]):
+        """Keep the hits with a score >= Threshold * best score of their target,
+        the queries of each group (consecutive ranks from GroupStarts) being
+        compared separately. The approximate scores are only compared with
+        approximate scores.
+
+        Return the HitTable of the retained queries sorted by rank, a query retained
+        with several targets keeps the first one and is reversed if one of its
+        retained hits is reversed."""
+        if not len(self):
+            return self
+        Group = numpy.searchsorted(GroupStarts, self.Query, side="right") - 1
+        Key = (2 * Group + self.Approximate) * (self.Target.max() + 1) + self.Target
+        (_, KeyCode) = numpy.unique(Key, return_inverse=True)
+        BestScore = numpy.full(KeyCode.max() + 1, -numpy.inf)
+        numpy.maximum.at(BestScore, KeyCode, self.Score)
+        Retained = self.take(self.Score >= Threshold * BestScore[KeyCode])
+
+        Order = numpy.argsort(Retained.Query, kind="mergesort")
+        Retained = Retained.take(Order)
+        (_, First, QueryCode) = numpy.unique(Retained.Query, return_index=True, return_inverse=True)
+        Reverse = numpy.zeros(len(First), dtype="bool")
+        numpy.logical_or.at(Reverse, QueryCode, Retained.Reverse)
+        Retained = Retained.take(First)
+        Retained.Reverse = Reverse
+        return Retained
+
+    def iter_named(self, Codes):
+        """Yield (rank, family, target, reverse) with the names of families and targets"""
+        for (Query, Target, Family, Reverse) in zip(self.Query, self.Target, self.Family, self.Reverse):
+            yield (Query, Codes.Families[Family], Codes.Targets[Target], bool(Reverse))
+
+def concat_hit_tables(HitTables):
+    return HitTable(numpy.concatenate([Hits.Query for Hits in HitTables]),
+                    numpy.concatenate([Hits.Target for Hits in HitTables]),
+                    numpy.concatenate([Hits.Family for Hits in HitTables]),
+                    numpy.concatenate([Hits.Score for Hits in HitTables]),
+                    numpy.concatenate([Hits.Reverse for Hits in HitTables]),
+                    numpy.concatenate([Hits.Approximate for Hits in HitTables]))
+
+def hit_table(BestTargetTable, Index, Approximate=False):
+    """Return the HitTable of a table of best targets with their codes
+    (qid, target, family, best_score, reverse), Approximate if the scores
+    are not blast bit scores"""
+    Unknown = BestTargetTable.target.values < 0
+    if Unknown.any():
+        logger.warning("%s hits on targets absent of the target2family link file are ignored", Unknown.sum())
+    BestTargetTable = BestTargetTable[~Unknown]
+    return HitTable(Index.get(BestTargetTable.qid.values),
+                    BestTargetTable.target.values,
+                    BestTargetTable.family.values,
+                    BestTargetTable.best_score.values,
+                    BestTargetTable.reverse.values,
+                    numpy.full(len(BestTargetTable.index), Approximate, dtype="bool"))
+
+def index_ranks(Table, Index):
+    """Return a dictionary query id -> rank for the known queries of a table"""
+    Queries = pandas.unique(Table.qid.values)
+    return dict([(Query, Rank) for (Query, Rank) in zip(Queries, Index.get(Queries)) if Rank >= 0])
+
+def assign_families(BlastTableWithFamilies, Index, threshold_list=[1]):
+    """Find the best hits of each query and attribute a family to each query.
+
+    The best targets of a query are its targets with a score >= threshold * best score.
+    A query whose best targets belong to several families is tested again with
+    the next threshold and is discarded if it is still ambiguous with the last one.
+
+    BlastTableWithFamilies must contain the target and family codes
+    (TargetIndex.TargetFamilyIndex.add_families). Return (HitTable, NoHitList)."""
+    Ranks = index_ranks(BlastTableWithFamilies, Index)
+    Table = add_best_score(BlastTableWithFamilies, Ranks)
+    Hits = hit_table(best_target_table(Table, Ranks, threshold_list), Index)
+
+    NoHitList = [Query for Query in Index.names_by_rank(Index.Ranks) if not Query in Ranks]
+    return (Hits, NoHitList)
+
+
+def compare_assignments(Hits, ReferenceHits, QueryRanks):
+    """Compare the family and the orientation attributed to each query by two HitTable.
+    Return (number of queries, same family, same family and orientation)."""
+    QueryRanks = numpy.asarray(QueryRanks, dtype="int64")
+    Assignments = []
+    for AssignedHits in (Hits, ReferenceHits):
+        First = AssignedHits.first_hits()
+        Position = numpy.searchsorted(First.Query, QueryRanks).clip(0, max(0, len(First) - 1))
+        Found = (First.Query[Position] == QueryRanks) if len(First) else numpy.zeros(len(QueryRanks), dtype="bool")
+        Family = numpy.where(Found, First.Family[Position] if len(First) else -1, -1)
+        Reverse = numpy.where(Found, First.Reverse[Position] if len(First) else False, False)
+        Assignments.append((Family, Reverse))
+    ((Family, Reverse), (ReferenceFamily, ReferenceReverse)) = Assignments
+    SameFamily = Family == ReferenceFamily
+    SameOrientation = SameFamily & (Reverse == ReferenceReverse)
+    return (len(QueryRanks), int(SameFamily.sum()), int(SameOrientation.sum()))
+
+
+class FamilyAssigner(object):
+    """Attribute a family to queries whose blast hits arrive by blocks of complete queries"""
+    def __init__(self, Index, Codes):
+        self.Index = Index
+        self.Codes = Codes
+        self.threshold_list = [1]
+        # Collapser.QueryCollapser giving the hits of the searched queries to their members
+        self.Collapser = None
+        self.HitTables = []
+        # Counters: blast hits, queries with a hit, queries attributed to a
+        # unique family and queries attributed to several families by threshold
+        self.HitNb = 0
+        self.HitQueryNb = 0
+        self.AssignedNb = 0
+        self.AmbiguousNb = {}
+
+    def add_hits(self, BlastTable):
+        """Assign the queries of a table containing all their hits"""
+        self.HitNb += len(BlastTable.index)
+        if self.Collapser:
+            BlastTable = self.Collapser.fan_out(BlastTable)
+        BlastTableWithFamilies = self.Codes.add_families(BlastTable)
+        Ranks = index_ranks(BlastTableWithFamilies, self.Index)
+        self.HitQueryNb += len(Ranks)
+        Table = add_best_score(BlastTableWithFamilies, Ranks)
+        Hits = hit_table(best_target_table(Table, Ranks, self.threshold_list, self.AmbiguousNb), self.Index)
+        self.AssignedNb += Hits.query_nb()
+        self.add_hit_table(Hits)
+
+    def add_hit_table(self, Hits):
+        """Add a HitTable of assigned queries"""
+        self.HitTables.append(Hits)
+
+    def get_hits(self):
+        return concat_hit_tables([HitTable()] + self.HitTables)
+
+
+class SpilledFamilyAssigner(FamilyAssigner):
+    """Attribute a family to queries whose blast hits arrive by blocks of complete
+    queries. The best hits are kept in memory until the resident memory of the
+    process crosses MaxMemory MB, then all of them are kept on disk in buckets
+    of families.
+
+    The queries may belong to several groups (samples) of consecutive ranks
+    starting at GroupStarts, the hits of each group are confirmed separately,
+    as the hits with an approximate score."""
+    def __init__(self, Index, Codes, SpillDirName):
+        FamilyAssigner.__init__(self, Index, Codes)
+        self.SpillDirName = SpillDirName
+        self.BucketNb = 64
+        self.ChunkSize = 1000000
+        self.GroupStarts = [0]
+        self.Threshold = 0.9
+        # Memory budget in MB, 0: the hits are kept on disk from the start
+        self.MaxMemory = 0
+        self.Spilling = False
+        self.SpilledNb = 0
+
+    def bucket_filename(self, Bucket, Kind):
+        return "%s/%s.%s.tsv" %(self.SpillDirName, Kind, Bucket)
+
+    def add_hit_table(self, Hits):
+        """Keep hits in memory, or on disk with the hits kept in memory once the
+        resident memory is above the budget"""
+        FamilyAssigner.add_hit_table(self, Hits)
+        if not self.Spilling:
+            Memory = Metrics.rss_mb()
+            if Memory <= self.MaxMemory:
+                return
+            logger.info("Resident memory (%s MB) above the memory budget (%s MB), the best hits are kept on disk",
+                        Memory, self.MaxMemory)
+            self.Spilling = True
+            if not os.path.isdir(self.SpillDirName):
+                os.makedirs(self.SpillDirName)
+        for Hits in self.HitTables:
+            self.spill(Hits)
+        self.HitTables = []
+
+    def spill(self, Hits):
+        """Append hits (rank, target, family, score, reverse, group) to the bucket of their family,
+        the hits with an approximate score being in their own groups"""
+        if not len(Hits):
+            return
+        Table = pandas.DataFrame({"rank": Hits.Query, "target": Hits.Target, "family": Hits.Family,
+                                  "score": Hits.Score, "reverse": Hits.Reverse.astype("int8"),
+                                  "group": 2 * (numpy.searchsorted(self.GroupStarts, Hits.Query, side="right") - 1) + Hits.Approximate},
+                                 columns=["rank", "target", "family", "score", "reverse", "group"])
+        for (Bucket, BucketTable) in Table.groupby(Hits.Family % self.BucketNb):
+            BucketTable.to_csv(self.bucket_filename(Bucket, "hits"), mode="a", sep="\t",
+                               header=False, index=False)
+        self.SpilledNb += len(Hits)
+
+    def read_bucket(self, Bucket):
+        return pandas.read_csv(self.bucket_filename(Bucket, "hits"), sep="\t", header=None,
+                               names=["rank", "target", "family", "score", "reverse", "group"],
+                               dtype={"rank": "int64", "target": "int32", "family": "int32",
+                                      "score": "float64", "reverse": "int8", "group": "int64"},
+                               engine="c", chunksize=self.ChunkSize)
+
+    def confirm_bucket(self, Bucket):
+        """Keep the hits with a score >= Threshold * best score of their target
+        and write the retained queries (rank, target, family, reverse) sorted by rank"""
+        Keys = ["group", "target"]
+        BestScores = None
+        for Chunk in self.read_bucket(Bucket):
+            ChunkBestScores = Chunk.groupby(Keys)["score"].max()
+            if BestScores is not None:
+                ChunkBestScores = pandas.concat([BestScores, ChunkBestScores]).groupby(level=[0, 1]).max()
+            BestScores = ChunkBestScores
+        BestScores = BestScores.rename("target_best_score").reset_index()
+
+        Retained = []
+        for Chunk in self.read_bucket(Bucket):
+            Chunk = pandas.merge(Chunk, BestScores, how="left", on=Keys)
+            Chunk = Chunk[Chunk.score >= self.Threshold * Chunk.target_best_score]
+            Retained.append(HitTable(Chunk["rank"].values, Chunk.target.values, Chunk.family.values,
+                                     Chunk.score.values, Chunk.reverse.values))
+        # All the hits are retained at this point, only the queries are merged
+        Retained = concat_hit_tables(Retained).retained(Threshold=0)
+        pandas.DataFrame({"rank": Retained.Query, "target": Retained.Target, "family": Retained.Family,
+                          "reverse": Retained.Reverse.astype("int8")},
+                         columns=["rank", "target", "family", "reverse"]).to_csv(
+            self.bucket_filename(Bucket, "retained"), sep="\t", header=False, index=False)
+        os.remove(self.bucket_filename(Bucket, "hits"))
+
+    def iter_named(self):
+        """Return an iterator of (rank, family, target, reverse) for each retained query sorted by rank"""
+        if not self.Spilling:
+            return self.get_hits().retained(Threshold=self.Threshold, GroupStarts=self.GroupStarts).iter_named(self.Codes)
+        return self.iter_spilled()
+
+    def iter_spilled(self):
+        """Yield (rank, family, target, reverse) for each retained query of the buckets sorted by rank"""
+        Buckets = [Bucket for Bucket in range(self.BucketNb) if os.path.isfile(self.bucket_filename(Bucket, "hits"))]
+        for Bucket in Buckets:
+            self.confirm_bucket(Bucket)
+        Files = [open(self.bucket_filename(Bucket, "retained")) for Bucket in Buckets]
+        try:
+            Readers = [((int(Rank), int(Target), int(Family), Reverse == "1") for (Rank, Target, Family, Reverse) in
+                        (Line.rstrip("\n").split("\t") for Line in File)) for File in Files]
+            for (Rank, Target, Family, Reverse) in heapq.merge(*Readers):
+                yield (Rank, self.Codes.Families[Family], self.Codes.Targets[Target], Reverse)
+        finally:
+            for File in Files:
+                File.close()
+
+
+def check_families(BlastTableWithFamilies, QueryNames, ExpectedFamily):
+    """Check that the best hits of each query belong to a unique expected family.
+
+    Return (RetainedQuery, DiscardedQuery) in the query file order, each
+    discarded query being reported as "query\\tfamily1,family2"."""
+    Ranks = query_ranks(QueryNames)
+    Table = add_best_score(BlastTableWithFamilies, Ranks)
+
+    BestTargetTable = Table[Table.score == Table.best_score]
+    Families = list_families(BestTargetTable, list(Ranks))
+
+    RetainedQuery = []
+    DiscardedQuery = []
+    for Query in sorted(Families, key=Ranks.get):
+        TmpFamily = Families[Query]
+        Family = TmpFamily[0]
+        logger.debug("Query: %s, Family: %s", Query, " ".join(TmpFamily))
+        if len(TmpFamily) > 1:
+            logger.info("More than one family can be attributed to %s:\n\t- %s\nIt will be discarded.", Query, "\n\t- ".join(TmpFamily))
+            DiscardedQuery.append(Query + "\t" + ",".join(TmpFamily))
+        elif Family != ExpectedFamily:
+            logger.info("Observed family (%s) is different of the expected family (%s). %s will be discarded.", Family, ExpectedFamily, Query)
+            DiscardedQuery.append(Query + "\t" + Family)
+        else:
+            RetainedQuery.append(Query)
+
+    return (RetainedQuery, DiscardedQuery)
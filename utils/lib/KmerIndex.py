@@ -0,0 +1,214 @@
+# File: KmerIndex.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+import os
+import logging
+
+import numpy
+import pandas
+
+import Fasta
+
+logger = logging.getLogger('main.lib.KmerIndex')
+
+# Code of each nucleotide, 4 for the others
+NucleotideCodes = numpy.full(256, 4, dtype=numpy.uint64)
+for (i, Nucleotides) in enumerate(["Aa", "Cc", "Gg", "Tt"]):
+    for Nucleotide in Nucleotides:
+        NucleotideCodes[ord(Nucleotide)] = i
+
+# Bits of a blastn (reward 2, penalty -3) bit score by identical nucleotide
+BitsPerBase = 1.8
+
+
+def minimizers(Sequence, K, W):
+    """Return the canonical codes of the (K, W) minimizers of a sequence and
+    a boolean array, True if the minimizer is on the forward strand"""
+    Codes = NucleotideCodes[numpy.frombuffer(Sequence, dtype=numpy.uint8)]
+    KmerNb = len(Codes) - K + 1
+    if KmerNb < 1:
+        return (numpy.zeros(0, dtype=numpy.uint64), numpy.zeros(0, dtype=bool))
+
+    Invalid = numpy.concatenate([[0], numpy.cumsum(Codes == 4)])
+    Valid = (Invalid[K:] - Invalid[:-K]) == 0
+    Codes[Codes == 4] = 0
+    Forward = numpy.zeros(KmerNb, dtype=numpy.uint64)
+    Reverse = numpy.zeros(KmerNb, dtype=numpy.uint64)
+    Two = numpy.uint64(2)
+    for i in range(K):
+        Forward = (Forward << Two) | Codes[i:i + KmerNb]
+        Reverse = (Reverse << Two) | (numpy.uint64(3) - Codes[K - 1 - i:K - 1 - i + KmerNb])
+    IsForward = Forward <= Reverse
+    Canonical = numpy.where(IsForward, Forward, Reverse)
+
+    # Hash the k-mers to not select preferentially poly-A k-mers
+    Hashes = Canonical * numpy.uint64(0x9E3779B97F4A7C15)
+    Hashes[~Valid] = numpy.iinfo(numpy.uint64).max
+    if KmerNb <= W:
+        Positions = numpy.array([numpy.argmin(Hashes)])
+    else:
+        Windows = numpy.lib.stride_tricks.as_strided(Hashes, shape=(KmerNb - W + 1, W),
+                                                     strides=(Hashes.strides[0], Hashes.strides[0]))
+        Positions = numpy.unique(numpy.argmin(Windows, axis=1) + numpy.arange(KmerNb - W + 1))
+    Positions = Positions[Valid[Positions]]
+    return (Canonical[Positions], IsForward[Positions])
+
+
+class MinimizerIndex(object):
+    """Define an index of the minimizers of the reference transcriptome
+    pointing to their targets and families"""
+    def __init__(self, K=15, W=10):
+        self.K = K
+        self.W = W
+        # Minimizers present in more targets are not indexed
+        self.MaxOccurrence = 200
+        # Fraction of the query minimizers which must be in the index to assign directly a query
+        self.MinSharedFraction = 0.5
+        self.Codes = numpy.zeros(0, dtype=numpy.uint64)
+        self.Targets = numpy.zeros(0, dtype=numpy.int32)
+        self.Forward = numpy.zeros(0, dtype=bool)
+        self.TargetNames = numpy.zeros(0, dtype="S")
+        self.TargetFamilies = numpy.zeros(0, dtype=numpy.int32)
+        self.FamilyNames = numpy.zeros(0, dtype="S")
+        self.Fingerprint = ""
+
+    def build(self, TargetFile, Target2FamilyDic):
+        """Index the minimizers of the sequences of TargetFile.
+        Target2FamilyDic is a dictionary target -> family."""
+        (Codes, Targets, Forward, TargetNames) = ([], [], [], [])
+        for (Name, Sequence) in Fasta.iter_fasta(TargetFile):
+            (TargetCodes, TargetForward) = minimizers(Sequence, self.K, self.W)
+            # A minimizer is counted once per target
+            (TargetCodes, First) = numpy.unique(TargetCodes, return_index=True)
+            Codes.append(TargetCodes)
+            Forward.append(TargetForward[First])
+            Targets.append(numpy.full(len(TargetCodes), len(TargetNames), dtype=numpy.int32))
+            TargetNames.append(Name)
+        if not TargetNames:
+            return
+        Codes = numpy.concatenate(Codes)
+        Targets = numpy.concatenate(Targets)
+        Forward = numpy.concatenate(Forward)
+
+        (UniqueCodes, Counts) = numpy.unique(Codes, return_counts=True)
+        Kept = numpy.in1d(Codes, UniqueCodes[Counts <= self.MaxOccurrence])
+        Order = numpy.argsort(Codes[Kept], kind="mergesort")
+        self.Codes = Codes[Kept][Order]
+        self.Targets = Targets[Kept][Order]
+        self.Forward = Forward[Kept][Order]
+        logger.info("%s minimizers of %s targets indexed (%s too frequent minimizers removed)",
+                    len(self.Codes), len(TargetNames), numpy.sum(Counts > self.MaxOccurrence))
+
+        Families = [Target2FamilyDic.get(Name, Name) for Name in TargetNames]
+        FamilyNames = sorted(set(Families))
+        FamilyIds = dict([(Family, i) for (i, Family) in enumerate(FamilyNames)])
+        self.TargetNames = numpy.array(TargetNames, dtype="S")
+        self.FamilyNames = numpy.array(FamilyNames, dtype="S")
+        self.TargetFamilies = numpy.array([FamilyIds[Family] for Family in Families], dtype=numpy.int32)
+
+    def save(self, Filename):
+        with open(Filename, "wb") as File:
+            numpy.savez(File, K=self.K, W=self.W, MaxOccurrence=self.MaxOccurrence,
+                        Codes=self.Codes, Targets=self.Targets, Forward=self.Forward,
+                        TargetNames=self.TargetNames, TargetFamilies=self.TargetFamilies,
+                        FamilyNames=self.FamilyNames,
+                        Fingerprint=numpy.array(self.Fingerprint, dtype="S"))
+
+    def load(self, Filename):
+        """Load an index saved with the same parameters and fingerprint,
+        return False if there is no such index"""
+        if not os.path.isfile(Filename):
+            return False
+        Index = numpy.load(Filename)
+        if (int(Index["K"]), int(Index["W"]), int(Index["MaxOccurrence"])) != (self.K, self.W, self.MaxOccurrence) or \
+           str(Index["Fingerprint"]) != self.Fingerprint:
+            return False
+        self.Codes = Index["Codes"]
+        self.Targets = Index["Targets"]
+        self.Forward = Index["Forward"]
+        self.TargetNames = Index["TargetNames"]
+        self.TargetFamilies = Index["TargetFamilies"]
+        self.FamilyNames = Index["FamilyNames"]
+        return True
+
+    def classify(self, Sequence):
+        """Return (status, best targets, family, reverse, score) for a query sequence.
+        status is "assigned" if the indexed minimizers shared with the query point
+        to a unique family and orientation, "no_support" if no minimizer is shared
+        and "ambiguous" otherwise."""
+        (Codes, Forward) = minimizers(Sequence, self.K, self.W)
+        Left = numpy.searchsorted(self.Codes, Codes, side="left")
+        Right = numpy.searchsorted(self.Codes, Codes, side="right")
+        Counts = Right - Left
+        if not Counts.sum():
+            return ("no_support", [], None, None, 0)
+
+        Minimizers = numpy.repeat(numpy.arange(len(Codes)), Counts)
+        Offsets = numpy.arange(Counts.sum()) - numpy.repeat(numpy.cumsum(Counts) - Counts, Counts)
+        Positions = Left[Minimizers] + Offsets
+        Targets = self.Targets[Positions]
+        SameStrand = self.Forward[Positions] == Forward[Minimizers]
+
+        Families = numpy.unique(self.TargetFamilies[Targets])
+        SharedFraction = numpy.count_nonzero(Counts) / float(len(Codes))
+        if len(Families) > 1 or SharedFraction < self.MinSharedFraction or \
+           0 < numpy.count_nonzero(SameStrand) < len(SameStrand):
+            return ("ambiguous", [], None, None, 0)
+
+        TargetCounts = numpy.bincount(Targets)
+        BestTargets = [str(Name) for Name in self.TargetNames[numpy.flatnonzero(TargetCounts == TargetCounts.max())]]
+        # Approximation of the blastn bit score of the query on its best targets
+        Score = BitsPerBase * SharedFraction * len(Sequence)
+        return ("assigned", BestTargets, str(self.FamilyNames[Families[0]]), not SameStrand[0], Score)
+
+def prefilter(QueryFile, Index, OutputFasta):
+    """Assign the queries with an unambiguous minimizer support and write
+    the ambiguous ones in OutputFasta.
+    Return (table of the best targets (qid, tid, best_score, reverse) of the
+    assigned queries, number of queries without support, number of ambiguous queries)."""
+    Rows = []
+    (NoSupportNb, AmbiguousNb) = (0, 0)
+    with open(OutputFasta, "w") as Output:
+        for (Query, Sequence) in Fasta.iter_fasta(QueryFile):
+            (Status, Targets, Family, Reverse, Score) = Index.classify(Sequence)
+            if Status == "no_support":
+                NoSupportNb += 1
+            elif Status == "ambiguous":
+                AmbiguousNb += 1
+                Output.write(Fasta.format_fasta(Query, Sequence))
+            else:
+                for Target in Targets:
+                    Rows.append((Query, Target, Score, Reverse))
+    Assigned = pandas.DataFrame(Rows, columns=["qid", "tid", "best_score", "reverse"])
+    return (Assigned, NoSupportNb, AmbiguousNb)
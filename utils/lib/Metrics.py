@@ -0,0 +1,129 @@
+# File: Metrics.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import os
+import json
+import time
+import logging
+import resource
+import collections
+
+
+def peak_rss_mb(Who):
+    """Peak resident memory in MB of the process (RUSAGE_SELF) or of its
+    largest waited child process (RUSAGE_CHILDREN)"""
+    # ru_maxrss is given in kilobytes on Linux
+    return round(resource.getrusage(Who).ru_maxrss / 1024.0, 1)
+
+
+def rss_mb():
+    """Current resident memory in MB of the process, read in /proc/self/statm
+    (the peak resident memory where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as Statm:
+            Pages = int(Statm.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return peak_rss_mb(resource.RUSAGE_SELF)
+    return round(Pages * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024), 1)
+
+
+def elapsed(Start, End, Fields):
+    """Time elapsed in seconds between two os.times() in the given fields"""
+    return round(max(0.0, sum([End[Field] - Start[Field] for Field in Fields])), 3)
+
+
+class StageMetrics(object):
+    """Define an object to record the wall time, the CPU time and the memory
+    of the successive stages of a run, and the counters of the run, written
+    in a JSON file. The memory of a stage is the resident memory of the
+    process at its end; the peak resident memory of the process (and of its
+    largest child) is a high-water mark since the start of the run, not a
+    peak of the stage."""
+    def __init__(self, Program):
+        self.logger = logging.getLogger('main.lib.Metrics')
+        self.Program = Program
+        self.Stages = []
+        self.Counters = collections.OrderedDict()
+        self.Current = None
+        self.StartTimes = os.times()
+
+    def start(self, Name):
+        """Stop the current stage and start the stage Name"""
+        self.stop()
+        self.Current = (Name, os.times())
+
+    def stop(self):
+        """Record the current stage, if any"""
+        if self.Current is None:
+            return
+        (Name, Start) = self.Current
+        End = os.times()
+        Stage = collections.OrderedDict()
+        Stage["name"] = Name
+        Stage["wall_time_s"] = elapsed(Start, End, [4])
+        Stage["cpu_time_s"] = elapsed(Start, End, [0, 1])
+        # The children are only accounted once they have been waited for
+        Stage["children_cpu_time_s"] = elapsed(Start, End, [2, 3])
+        Stage["rss_mb"] = rss_mb()
+        # High-water marks since the start of the run
+        Stage["process_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_SELF)
+        Stage["children_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        self.Stages.append(Stage)
+        self.logger.debug("%s --- %s seconds ---", Name, Stage["wall_time_s"])
+        self.Current = None
+
+    def set(self, Name, Value):
+        self.Counters[Name] = Value
+
+    def add(self, Name, Value=1):
+        self.Counters[Name] = self.Counters.get(Name, 0) + Value
+
+    def write(self, Filename, ExitCode=0):
+        """Stop the current stage and write the metrics in Filename"""
+        self.stop()
+        End = os.times()
+        Metrics = collections.OrderedDict()
+        Metrics["program"] = self.Program
+        Metrics["exit_code"] = ExitCode
+        Metrics["wall_time_s"] = elapsed(self.StartTimes, End, [4])
+        Metrics["cpu_time_s"] = elapsed(self.StartTimes, End, [0, 1])
+        Metrics["children_cpu_time_s"] = elapsed(self.StartTimes, End, [2, 3])
+        Metrics["process_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_SELF)
+        Metrics["children_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        Metrics["stages"] = self.Stages
+        Metrics["counters"] = self.Counters
+        TmpFilename = "%s.tmp" %(Filename)
+        with open(TmpFilename, "w") as MetricsFile:
+            json.dump(Metrics, MetricsFile, indent=2, separators=(",", ": "))
+            MetricsFile.write("\n")
+        os.rename(TmpFilename, Filename)
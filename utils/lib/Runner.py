@@ -0,0 +1,97 @@
+# File: Runner.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+import logging
+import threading
+
+
+class ConcurrentRunner(object):
+    """Launch external programs concurrently without using more than Threads
+    cores (and Memory MB if Memory is set).
+
+    Each job is a launch method of a wrapper (BlastPlus, Aligner, ...) with its
+    arguments, which returns (out, err). Jobs start in the order they were
+    added, as soon as their cores are available. If StopOnError, the jobs not
+    started yet are cancelled after the first error, the running ones end."""
+    def __init__(self, Threads):
+        self.logger = logging.getLogger('main.lib.Runner.ConcurrentRunner')
+        self.Threads = max(1, Threads)
+        self.Memory = 0
+        self.StopOnError = True
+        self.Jobs = []
+
+    def add(self, Launch, Args=(), Cores=1, Memory=0):
+        """Add a job, Cores and Memory are what it uses"""
+        Cores = min(max(1, Cores), self.Threads)
+        if self.Memory:
+            Memory = min(Memory, self.Memory)
+        self.Jobs.append((Launch, tuple(Args), Cores, Memory))
+
+    def run(self):
+        """Run all the jobs and return their (out, err) in the order they were added"""
+        Results = [("", "Cancelled after a previous error")] * len(self.Jobs)
+        State = {"Cores": self.Threads, "Memory": self.Memory, "Failed": False}
+        Condition = threading.Condition()
+
+        def run_job(i, Launch, Args, Cores, Memory):
+            try:
+                Results[i] = Launch(*Args)
+            except Exception as e:
+                Results[i] = ("", "%s: %s" %(type(e).__name__, e))
+            with Condition:
+                if Results[i][1]:
+                    State["Failed"] = True
+                State["Cores"] += Cores
+                State["Memory"] += Memory
+                Condition.notify_all()
+
+        Running = []
+        for (i, (Launch, Args, Cores, Memory)) in enumerate(self.Jobs):
+            with Condition:
+                while not (State["Failed"] and self.StopOnError) and \
+                      (State["Cores"] < Cores or (self.Memory and State["Memory"] < Memory)):
+                    Condition.wait()
+                if State["Failed"] and self.StopOnError:
+                    self.logger.info("Cancel %s jobs after an error", len(self.Jobs) - i)
+                    break
+                State["Cores"] -= Cores
+                State["Memory"] -= Memory
+            Job = threading.Thread(target=run_job, args=(i, Launch, Args, Cores, Memory))
+            Job.start()
+            Running.append(Job)
+
+        for Job in Running:
+            Job.join()
+        self.Jobs = []
+        return Results
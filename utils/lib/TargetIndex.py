@@ -0,0 +1,247 @@
+# File: TargetIndex.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+import os
+import json
+import shutil
+import logging
+
+import numpy
+import pandas
+
+logger = logging.getLogger('main.lib.TargetIndex')
+
+FNVOffset = numpy.uint64(14695981039346656037)
+FNVPrime = numpy.uint64(1099511628211)
+# Second hash used to check the names found with the first one
+CheckOffset = numpy.uint64(11400714819323198485)
+CheckPrime = numpy.uint64(6364136223846793005)
+
+
+def name_hashes(Names, Offset=FNVOffset, Prime=FNVPrime):
+    """Return the 64 bits FNV-1a hashes of a list of names, computed column by column"""
+    Names = numpy.asarray(Names, dtype=str)
+    Hashes = numpy.full(len(Names), Offset, dtype=numpy.uint64)
+    if not len(Names):
+        return Hashes
+    Bytes = Names.view(numpy.uint8).reshape(len(Names), Names.dtype.itemsize)
+    for Column in range(Names.dtype.itemsize):
+        Byte = Bytes[:, Column].astype(numpy.uint64)
+        # Names are padded with null bytes
+        Hashes = numpy.where(Byte != 0, (Hashes ^ Byte) * Prime, Hashes)
+    return Hashes
+
+
+class PackedStrings(object):
+    """Strings stored in one byte array with their offsets"""
+    def __init__(self, Bytes, Offsets):
+        self.Bytes = Bytes
+        self.Offsets = Offsets
+
+    @classmethod
+    def pack(cls, Strings):
+        Lengths = numpy.array([len(String) for String in Strings], dtype=numpy.int64)
+        Offsets = numpy.concatenate([[0], numpy.cumsum(Lengths)]).astype(numpy.int64)
+        Bytes = numpy.frombuffer("".join(Strings), dtype=numpy.uint8)
+        return cls(Bytes, Offsets)
+
+    def __len__(self):
+        return len(self.Offsets) - 1
+
+    def __getitem__(self, Index):
+        if numpy.ndim(Index):
+            (Uniques, Inverse) = numpy.unique(Index, return_inverse=True)
+            return numpy.array([self[Unique] for Unique in Uniques] or [], dtype=object)[Inverse]
+        return self.Bytes[self.Offsets[Index]:self.Offsets[Index + 1]].tostring()
+
+    def tolist(self):
+        return [self[Index] for Index in range(len(self))]
+
+
+class TargetFamilyIndex(object):
+    """Define an index target name -> target code -> family code, stored in numpy
+    files memory-mapped at loading. Targets are found by their sorted hashes and
+    checked with a second hash."""
+    def __init__(self):
+        self.Fingerprint = ""
+        self.Targets = PackedStrings.pack([])
+        self.Families = numpy.array([], dtype=object)
+        self.TargetFamily = numpy.array([], dtype=numpy.int32)
+        self.Hashes = numpy.array([], dtype=numpy.uint64)
+        self.HashTargets = numpy.array([], dtype=numpy.int32)
+        self.CheckHashes = numpy.array([], dtype=numpy.uint64)
+        self.Missing = []
+
+    def build(self, TargetFile, Target2FamilyFilename):
+        """Index the targets of the link file and of the target fasta file, a
+        target absent of the link file is its own family.
+        Return (missing targets, duplicated targets of the link file and of the
+        fasta targets absent of the link file)."""
+        Target2FamilyTable = pandas.read_csv(Target2FamilyFilename, delim_whitespace=True,
+                                             header=None, dtype=str, engine="c",
+                                             names=["Target", "Family"])
+
+        with open(TargetFile) as File:
+            TargetNames = [Line[1:].split()[0] for Line in File if Line.startswith(">") and Line[1:].strip()]
+        Known = set(Target2FamilyTable.Target.values)
+        Missing = [Target for Target in TargetNames if not Target in Known]
+        if Missing:
+            Target2FamilyTable = pandas.concat([Target2FamilyTable,
+                                                pandas.DataFrame({"Target": Missing, "Family": Missing},
+                                                                 columns=["Target", "Family"])],
+                                               ignore_index=True)
+        self.Missing = Missing
+        Duplicated = Target2FamilyTable.Target[Target2FamilyTable.Target.duplicated()].tolist()
+
+        Targets = Target2FamilyTable.Target.values.astype(str)
+        (self.Families, TargetFamily) = numpy.unique(Target2FamilyTable.Family.values.astype(str), return_inverse=True)
+        self.Families = self.Families.astype(object)
+        self.TargetFamily = TargetFamily.astype(numpy.int32)
+        self.Targets = PackedStrings.pack(list(Targets))
+        Hashes = name_hashes(Targets)
+        Order = numpy.argsort(Hashes, kind="mergesort")
+        self.Hashes = Hashes[Order]
+        self.HashTargets = Order.astype(numpy.int32)
+        self.CheckHashes = name_hashes(Targets, CheckOffset, CheckPrime)
+        return (Missing, Duplicated)
+
+    def save(self, IndexDirName):
+        """Write the index in IndexDirName, replaced at once if it already exists"""
+        TmpDirName = "%s.%s.tmp" %(IndexDirName, os.getpid())
+        if os.path.isdir(TmpDirName):
+            shutil.rmtree(TmpDirName)
+        os.makedirs(TmpDirName)
+        Families = PackedStrings.pack(list(self.Families))
+        for (Name, Array) in [("target_bytes", self.Targets.Bytes), ("target_offsets", self.Targets.Offsets),
+                              ("family_bytes", Families.Bytes), ("family_offsets", Families.Offsets),
+                              ("target_family", self.TargetFamily),
+                              ("hashes", self.Hashes), ("hash_targets", self.HashTargets),
+                              ("check_hashes", self.CheckHashes)]:
+            numpy.save("%s/%s.npy" %(TmpDirName, Name), Array)
+        with open("%s/index.json" %(TmpDirName), "w") as File:
+            json.dump({"fingerprint": self.Fingerprint, "missing": self.Missing}, File)
+        if os.path.isdir(IndexDirName):
+            shutil.rmtree(IndexDirName, ignore_errors=True)
+        try:
+            os.rename(TmpDirName, IndexDirName)
+        except OSError:
+            # Another process has just written the same index
+            shutil.rmtree(TmpDirName, ignore_errors=True)
+
+    def load(self, IndexDirName):
+        """Memory-map an index built with the same fingerprint,
+        return False if there is no such index"""
+        MetaFilename = "%s/index.json" %(IndexDirName)
+        if not os.path.isfile(MetaFilename):
+            return False
+        with open(MetaFilename) as File:
+            Meta = json.load(File)
+        if Meta["fingerprint"] != self.Fingerprint:
+            return False
+        Arrays = dict([(Name, numpy.load("%s/%s.npy" %(IndexDirName, Name), mmap_mode="r"))
+                       for Name in ["target_bytes", "target_offsets", "family_bytes", "family_offsets",
+                                    "target_family", "hashes", "hash_targets", "check_hashes"]])
+        self.Targets = PackedStrings(Arrays["target_bytes"], Arrays["target_offsets"])
+        self.Families = numpy.array(PackedStrings(Arrays["family_bytes"], Arrays["family_offsets"]).tolist(), dtype=object)
+        self.TargetFamily = Arrays["target_family"]
+        self.Hashes = Arrays["hashes"]
+        self.HashTargets = Arrays["hash_targets"]
+        self.CheckHashes = Arrays["check_hashes"]
+        self.Missing = [str(Target) for Target in Meta["missing"]]
+        return True
+
+    def codes(self, TargetNames):
+        """Return the codes of TargetNames, -1 for unknown targets"""
+        Names = numpy.asarray(TargetNames, dtype=str)
+        Codes = numpy.full(len(Names), -1, dtype=numpy.int32)
+        if not len(self.Hashes) or not len(Names):
+            return Codes
+        Hashes = name_hashes(Names)
+        CheckHashes = name_hashes(Names, CheckOffset, CheckPrime)
+        Starts = numpy.searchsorted(self.Hashes, Hashes, side="left").clip(0, len(self.Hashes) - 1)
+        Candidates = self.HashTargets[Starts]
+        Found = (self.Hashes[Starts] == Hashes) & (self.CheckHashes[Candidates] == CheckHashes)
+        Codes[Found] = Candidates[Found]
+        # Several targets may have the same first hash
+        Ends = numpy.searchsorted(self.Hashes, Hashes, side="right")
+        for i in numpy.nonzero(~Found & (Ends - Starts > 1))[0]:
+            for Position in range(Starts[i] + 1, Ends[i]):
+                if self.CheckHashes[self.HashTargets[Position]] == CheckHashes[i]:
+                    Codes[i] = self.HashTargets[Position]
+                    break
+        return Codes
+
+    def family_targets(self, FamilyNames):
+        """Return the names of the targets of the families FamilyNames
+        and the families without target"""
+        FamilyNames = set(FamilyNames)
+        FamilyCodes = [Code for (Code, Family) in enumerate(self.Families) if Family in FamilyNames]
+        Unknown = sorted(FamilyNames.difference([self.Families[Code] for Code in FamilyCodes]))
+        Targets = numpy.nonzero(numpy.in1d(self.TargetFamily, FamilyCodes))[0]
+        return (list(self.Targets[Targets]), Unknown)
+
+    def target2family_dic(self):
+        return dict(zip(self.Targets.tolist(), self.Families[self.TargetFamily].tolist()))
+
+    def add_families(self, BlastTable):
+        """Add the target code, the family code and the family name of each hit"""
+        (TargetIds, TargetNames) = pandas.factorize(BlastTable.tid.values)
+        Target = self.codes(TargetNames)[TargetIds] if len(TargetNames) else numpy.array([], dtype=numpy.int32)
+        Known = Target >= 0
+        Family = numpy.full(len(Target), -1, dtype=numpy.int32)
+        Family[Known] = self.TargetFamily[Target[Known]]
+        # An unknown target is its own family, as the targets missing in the link file
+        FamilyName = BlastTable.tid.values.astype(object)
+        FamilyName[Known] = self.Families[Family[Known]]
+        return BlastTable.assign(target=Target, family=Family, Family=FamilyName)
+
+
+def load_or_build(IndexDirName, TargetFile, Target2FamilyFilename, Fingerprint, BuildDirName=""):
+    """Load the index of IndexDirName if it was built with the same fingerprint,
+    otherwise build it and save it in BuildDirName (default: IndexDirName),
+    IndexDirName being left as it is if it is read-only.
+    Return (index, missing targets, duplicated targets)."""
+    Index = TargetFamilyIndex()
+    Index.Fingerprint = Fingerprint
+    if Index.load(IndexDirName):
+        logger.info("Target index %s loaded (%s targets without family in the link file)", IndexDirName, len(Index.Missing))
+        return (Index, Index.Missing, [])
+    BuildDirName = BuildDirName or IndexDirName
+    if os.path.isdir(IndexDirName) and BuildDirName != IndexDirName:
+        logger.warning("Target index %s is outdated, rebuild it in %s", IndexDirName, BuildDirName)
+    logger.info("Build the target index %s", BuildDirName)
+    (Missing, Duplicated) = Index.build(TargetFile, Target2FamilyFilename)
+    if not Duplicated:
+        Index.save(BuildDirName)
+    return (Index, Missing, Duplicated)
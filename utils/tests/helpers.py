@@ -0,0 +1,97 @@
+# File: helpers.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import os
+import sys
+import stat
+import shutil
+import random
+import logging
+import tempfile
+import unittest
+
+LibDir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+if LibDir not in sys.path:
+    sys.path.insert(0, LibDir)
+
+# The warnings of the tested modules are expected
+logging.getLogger("main").addHandler(logging.NullHandler())
+
+ScriptsDir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "lib", "scripts")
+
+
+def random_sequence(Length, Random=random):
+    return "".join([Random.choice("ACGT") for _ in range(Length)])
+
+
+def write_fasta(Filename, Records):
+    with open(Filename, "w") as File:
+        for (Name, Sequence) in Records:
+            File.write(">%s\n%s\n" %(Name, Sequence))
+    return Filename
+
+
+def which(Program):
+    for Dir in os.environ.get("PATH", "").split(os.pathsep):
+        if os.access(os.path.join(Dir, Program), os.X_OK):
+            return os.path.join(Dir, Program)
+    return None
+
+
+class TmpDirTestCase(unittest.TestCase):
+    """Test case with a temporary directory and a directory of fake programs
+    put first in the PATH"""
+    def setUp(self):
+        self.TmpDir = tempfile.mkdtemp(prefix="tmp_caars_test")
+        self.BinDir = os.path.join(self.TmpDir, "bin")
+        os.mkdir(self.BinDir)
+        self.Path = os.environ.get("PATH", "")
+        os.environ["PATH"] = self.BinDir + os.pathsep + self.Path
+
+    def tearDown(self):
+        os.environ["PATH"] = self.Path
+        shutil.rmtree(self.TmpDir)
+
+    def path(self, Name):
+        return os.path.join(self.TmpDir, Name)
+
+    def fake_program(self, Name, Source):
+        """Write a python program Name in the fake program directory"""
+        Filename = os.path.join(self.BinDir, Name)
+        with open(Filename, "w") as File:
+            File.write("#!%s\n" %(sys.executable))
+            File.write(Source)
+        os.chmod(Filename, os.stat(Filename).st_mode | stat.S_IEXEC)
+        return Filename
@@ -0,0 +1,303 @@
+# File: test_Aligner.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import os
+import json
+import unittest
+
+from helpers import TmpDirTestCase, write_fasta
+
+import Aligner
+
+
+# Fake aligners (mafft, famsa, muscle5): the sequences are padded with gaps
+# to the longest one, the calls are logged in the calls file and the
+# progress is written on the standard error. A sequence named "fail" makes
+# them fail, a sequence named "crash" makes them exit without message.
+FakeAligner = """import os, sys, json
+Args = sys.argv[1:]
+Program = os.path.basename(sys.argv[0])
+if Program == "famsa" and not Args:
+    print("FAMSA (Fast and Accurate Multiple Sequence Alignment) ver. %(famsa)s")
+    sys.exit(0)
+if Program == "muscle5" and Args == ["-version"]:
+    print("%(muscle5)s")
+    sys.exit(0)
+with open(%(calls)r, "a") as Calls:
+    Calls.write(json.dumps([Program] + Args) + "\\n")
+def read_fasta(String):
+    Records = []
+    for line in String.split("\\n"):
+        if line.startswith(">"):
+            Records.append([line[1:].split()[0], ""])
+        elif line.strip():
+            Records[-1][1] += line.strip().replace("-", "")
+    return Records
+def read(Filename):
+    return sys.stdin.read() if Filename in ["-", "STDIN", "/dev/stdin"] else open(Filename).read()
+if Program == "mafft":
+    Inputs = [Args[-1]] + [Args[Args.index(Option) + 1] for Option in ["--add", "--addfragments"] if Option in Args]
+    Output = Args[Args.index("--out") + 1] if "--out" in Args else "-"
+elif Program == "famsa":
+    Files = [Arg for Arg in Args if not Arg.startswith("-") and not Arg.isdigit()]
+    (Inputs, Output) = (Files[:-1], Files[-1])
+else:
+    (Inputs, Output) = ([Args[Args.index("-super5") + 1]], Args[Args.index("-output") + 1])
+Records = sum([read_fasta(read(Input)) for Input in Inputs], [])
+if "crash" in [Name for (Name, _) in Records]:
+    sys.exit(2)
+sys.stderr.write("%%s: %%s sequences\\n" %%(Program, len(Records)))
+if "fail" in [Name for (Name, _) in Records]:
+    sys.stderr.write("%%s: can not align the sequences\\n" %%(Program))
+    sys.exit(1)
+Length = max([len(Sequence) for (_, Sequence) in Records])
+Result = "".join([">%%s\\n%%s\\n" %%(Name, Sequence.lower() + "-" * (Length - len(Sequence))) for (Name, Sequence) in Records])
+if Output in ["-", "STDOUT", "/dev/stdout"]:
+    sys.stdout.write(Result)
+else:
+    open(Output, "w").write(Result)
+"""
+
+
+class AlignerTestCase(TmpDirTestCase):
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        self.fake_aligners()
+        self.Sequences = [("s1", "ACGTACGT"), ("s2", "ACGT"), ("s3", "ACGTAC")]
+        self.InputFile = write_fasta(self.path("input.fa"), self.Sequences)
+
+    def fake_aligners(self, FamsaVersion="2.2.2", Muscle5Version="muscle 5.1.linux64 [12f0e2]"):
+        for Program in ["mafft", "famsa", "muscle5"]:
+            self.fake_program(Program, FakeAligner %{"famsa": FamsaVersion, "muscle5": Muscle5Version,
+                                                     "calls": self.path("calls.log")})
+
+    def calls(self):
+        if not os.path.isfile(self.path("calls.log")):
+            return []
+        with open(self.path("calls.log")) as Calls:
+            Calls = [json.loads(line) for line in Calls]
+        os.remove(self.path("calls.log"))
+        return Calls
+
+    def check_alignment(self, Alignment, Names):
+        self.assertEqual(Alignment.Names, Names)
+        self.assertEqual(len(set([len(Sequence) for Sequence in Alignment.Sequences])), 1)
+
+
+class TestMafft(AlignerTestCase):
+    def test_align_on_stdin(self):
+        MafftProcess = Aligner.Mafft("")
+        MafftProcess.PlanStrategy = True
+        MafftProcess.QuietOption = True
+        (Alignment, err) = MafftProcess.align(Aligner.Alignment(self.Sequences))
+        self.assertEqual(err, "")
+        self.check_alignment(Alignment, ["s1", "s2", "s3"])
+        self.assertEqual(Alignment.Sequences[1], "acgt----")
+        # The strategy is planned from the given sequences, no file is used
+        [Call] = self.calls()
+        self.assertEqual(Call[-1], "-")
+        self.assertIn("--localpair", Call)
+        self.assertEqual([Arg for Arg in Call if os.path.exists(Arg)], [])
+        # The alignment can be aligned again
+        (Alignment, err) = MafftProcess.align(Alignment)
+        self.check_alignment(Alignment, ["s1", "s2", "s3"])
+
+    def test_launch(self):
+        MafftProcess = Aligner.Mafft(self.InputFile)
+        MafftProcess.AddOption = write_fasta(self.path("add.fa"), [("s4", "ACGTACGTAC")])
+        (out, err) = MafftProcess.launch(self.path("output.fa"))
+        self.assertEqual(err, "")
+        self.check_alignment(Aligner.Alignment().read(self.path("output.fa")), ["s1", "s2", "s3", "s4"])
+
+    def test_planned_launch(self):
+        MafftProcess = Aligner.Mafft(self.InputFile)
+        MafftProcess.PlanStrategy = True
+        MafftProcess.Threads = 2
+        (out, err) = MafftProcess.launch(self.path("output.fa"))
+        self.assertEqual(err, "")
+        self.check_alignment(Aligner.Alignment().read(self.path("output.fa")), ["s1", "s2", "s3"])
+        [Call] = self.calls()
+        self.assertEqual(Call[Call.index("--thread") + 1], "2")
+        self.assertIn("--localpair", Call)
+        # The --add alignments are not planned
+        MafftProcess.AddOption = write_fasta(self.path("add.fa"), [("s4", "ACGTACGTAC")])
+        (out, err) = MafftProcess.launch(self.path("output.fa"))
+        self.check_alignment(Aligner.Alignment().read(self.path("output.fa")), ["s1", "s2", "s3", "s4"])
+        [Call] = self.calls()
+        self.assertNotIn("--localpair", Call)
+
+    def test_add_fragments(self):
+        MafftProcess = Aligner.Mafft(self.InputFile)
+        MafftProcess.PlanStrategy = True
+        MafftProcess.AddFragmentsOption = write_fasta(self.path("fragments.fa"), [("c1", "ACG"), ("c2", "GTAC")])
+        MafftProcess.KeepLengthOption = True
+        (out, err) = MafftProcess.launch(self.path("output.fa"))
+        self.assertEqual(err, "")
+        self.check_alignment(Aligner.Alignment().read(self.path("output.fa")), ["s1", "s2", "s3", "c1", "c2"])
+        [Call] = self.calls()
+        self.assertEqual(Call[Call.index("--addfragments") + 1], self.path("fragments.fa"))
+        self.assertIn("--keeplength", Call)
+        self.assertNotIn("--localpair", Call)
+
+    def test_failure(self):
+        (Alignment, err) = Aligner.Mafft("").align(self.Sequences + [("fail", "ACGT")])
+        self.assertIn("can not align", err)
+        self.assertEqual(len(Alignment), 0)
+        (Alignment, err) = Aligner.Mafft("").align(self.Sequences + [("crash", "ACGT")])
+        self.assertEqual(err, "mafft exited with code 2")
+
+    def test_progress(self):
+        # The progress written on the standard error is not an error
+        (Alignment, err) = Aligner.Mafft("").align(self.Sequences)
+        self.assertEqual(err, "")
+        self.assertEqual(len(Alignment), len(self.Sequences))
+
+    def test_missing_program(self):
+        os.remove(os.path.join(self.BinDir, "mafft"))
+        os.environ["PATH"] = self.BinDir
+        (Alignment, err) = Aligner.Mafft("").align(self.Sequences)
+        self.assertTrue(err.startswith("Unexpected error when we launch mafft"))
+        (out, err) = Aligner.Mafft(self.InputFile).launch(self.path("output.fa"))
+        self.assertTrue(err.startswith("Unexpected error when we launch mafft"))
+
+    def test_backend_times(self):
+        (RunNb, _) = Aligner.BackendTimes.get("mafft", [0, 0.0])
+        Aligner.Mafft("").align(self.Sequences)
+        self.assertEqual(Aligner.BackendTimes["mafft"][0], RunNb + 1)
+
+    def test_plan(self):
+        self.assertEqual(Aligner.plan_mafft(50, 1000)[0], "L-INS-i")
+        self.assertEqual(Aligner.plan_mafft(50, 5000)[0], "FFT-NS-i")
+        self.assertEqual(Aligner.plan_mafft(3000, 1000)[0], "FFT-NS-2")
+        self.assertEqual(Aligner.plan_mafft(10000, 1000)[0], "FFT-NS-1")
+        self.assertEqual(Aligner.plan_mafft(100000, 1000)[0], "PartTree")
+
+    def test_cost(self):
+        # The faster strategies are cheaper on a large family
+        Costs = [Aligner.mafft_cost(Strategy, 20000, 1000) for (Strategy, _, _, _) in Aligner.MafftStrategies]
+        self.assertEqual(Costs, sorted(Costs, reverse=True))
+
+
+class TestLargeAligners(AlignerTestCase):
+    def test_famsa(self):
+        FamsaProcess = Aligner.Famsa(self.InputFile)
+        FamsaProcess.Threads = 4
+        (Alignment, err) = FamsaProcess.align(self.Sequences)
+        self.assertEqual(err, "")
+        self.check_alignment(Alignment, ["s1", "s2", "s3"])
+        self.assertEqual(self.calls(), [["famsa", "-t", "4", "STDIN", "STDOUT"]])
+        (out, err) = FamsaProcess.launch(self.path("output.fa"))
+        self.check_alignment(Aligner.Alignment().read(self.path("output.fa")), ["s1", "s2", "s3"])
+
+    def test_famsa_add(self):
+        # The added sequences are aligned, then the two profiles
+        FamsaProcess = Aligner.Famsa(self.InputFile)
+        FamsaProcess.AddOption = write_fasta(self.path("add.fa"), [("s4", "ACGTACGTAC"), ("s5", "AC")])
+        (out, err) = FamsaProcess.launch(self.path("output.fa"))
+        self.assertEqual(err, "")
+        Calls = self.calls()
+        AddAli = Calls[0][2]
+        self.assertEqual(Calls, [["famsa", self.path("add.fa"), AddAli],
+                                        ["famsa", "-profile", self.InputFile, AddAli, self.path("output.fa")]])
+        self.check_alignment(Aligner.Alignment().read(self.path("output.fa")), ["s1", "s2", "s3", "s4", "s5"])
+        # The alignment of the added sequences is removed with its directory
+        self.assertFalse(os.path.exists(os.path.dirname(AddAli)))
+        # No profile alignment if the added sequences can not be aligned
+        FamsaProcess.AddOption = write_fasta(self.path("add.fa"), [("fail", "ACGT")])
+        (out, err) = FamsaProcess.launch(self.path("output2.fa"))
+        self.assertIn("can not align", err)
+        Calls = self.calls()
+        self.assertEqual(len(Calls), 1)
+        self.assertFalse(os.path.exists(os.path.dirname(Calls[0][2])))
+
+    def test_muscle5(self):
+        MuscleProcess = Aligner.Muscle5(self.InputFile)
+        MuscleProcess.Threads = 2
+        MuscleProcess.QuietOption = True
+        (Alignment, err) = MuscleProcess.align(self.Sequences)
+        self.assertEqual(err, "")
+        self.check_alignment(Alignment, ["s1", "s2", "s3"])
+        self.assertEqual(self.calls(), [["muscle5", "-super5", "/dev/stdin", "-output", "/dev/stdout",
+                                         "-threads", "2", "-quiet"]])
+        (out, err) = MuscleProcess.launch(self.path("output.fa"))
+        self.check_alignment(Aligner.Alignment().read(self.path("output.fa")), ["s1", "s2", "s3"])
+        (Alignment, err) = MuscleProcess.align(self.Sequences + [("fail", "ACGT")])
+        self.assertIn("can not align", err)
+
+    def test_check(self):
+        self.assertEqual(Aligner.Famsa("").check(), "")
+        self.assertEqual(Aligner.Muscle5("").check(), "")
+        self.fake_aligners(FamsaVersion="1.6.2", Muscle5Version="MUSCLE v3.8.31 by Robert C. Edgar")
+        self.assertIn("is not version 2 or later", Aligner.Famsa("").check())
+        self.assertIn("is not version 5 or later", Aligner.Muscle5("").check())
+        os.environ["PATH"] = self.TmpDir
+        self.assertIn("can not be launched", Aligner.Famsa("").check())
+
+    def test_get_aligner(self):
+        LargeFile = write_fasta(self.path("large.fa"), [("s%s" %(i), "ACGT") for i in range(10)])
+        # A small family is aligned by mafft with a planned strategy
+        Process = Aligner.get_aligner(self.InputFile, 3, "famsa", 5)
+        self.assertTrue(isinstance(Process, Aligner.Mafft))
+        self.assertTrue(Process.PlanStrategy)
+        # The count given by the caller is used, the files are not read
+        Process = Aligner.get_aligner(self.InputFile, 13, "famsa", 5, AddFile=LargeFile)
+        self.assertTrue(isinstance(Process, Aligner.Famsa))
+        self.assertEqual(Process.AddOption, LargeFile)
+        Process = Aligner.get_aligner("", 10, "famsa", 5)
+        self.assertTrue(isinstance(Process, Aligner.Famsa))
+        self.assertTrue(isinstance(Aligner.get_aligner(LargeFile, 10, "muscle5", 5), Aligner.Muscle5))
+        self.assertTrue(isinstance(Aligner.get_aligner(LargeFile, 10, "", 5), Aligner.Mafft))
+        # MUSCLE 5 can not add sequences
+        Process = Aligner.get_aligner(LargeFile, 13, "muscle5", 5, AddFile=self.InputFile)
+        self.assertTrue(isinstance(Process, Aligner.Mafft))
+        self.assertEqual(Process.AddOption, self.InputFile)
+        # mafft is used if the backend is too old or missing
+        self.fake_aligners(Muscle5Version="MUSCLE v3.8.31 by Robert C. Edgar")
+        self.assertTrue(isinstance(Aligner.get_aligner(LargeFile, 10, "muscle5", 5), Aligner.Mafft))
+        os.remove(os.path.join(self.BinDir, "famsa"))
+        os.environ["PATH"] = self.BinDir
+        self.assertTrue(isinstance(Aligner.get_aligner(LargeFile, 10, "famsa", 5), Aligner.Mafft))
+
+
+class TestAlignment(unittest.TestCase):
+    def test_parse(self):
+        Alignment = Aligner.Alignment().parse(">s1 description\nacg-\nt\n>s2\n\nac--gt\n")
+        self.assertEqual(list(Alignment), [("s1", "acg-t"), ("s2", "ac--gt")])
+        self.assertEqual(Aligner.Alignment().parse(Alignment.to_fasta()).Sequences, Alignment.Sequences)
+        self.assertEqual(len(Aligner.Alignment().parse("")), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,444 @@
+# File: test_BlastPlus.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import os
+import json
+import itertools
+import time
+import random
+import unittest
+
+from helpers import TmpDirTestCase, random_sequence, write_fasta
+import test_seq_dispatcher
+
+import Fasta
+import BlastPlus
+import HitAssignment
+
+
+# Fake blastn: each query has hits on targets drawn from a generator seeded
+# by its sequence, its calls and the queries it searched are logged in the
+# calls file and in the queries file
+FakeBlastn = """import sys, json, random, zlib
+Args = sys.argv[1:]
+with open(%r, "a") as Calls:
+    Calls.write(json.dumps(Args) + "\\n")
+Query = Args[Args.index("-query") + 1]
+Output = open(Args[Args.index("-out") + 1], "w") if "-out" in Args else sys.stdout
+Records = []
+for line in open(Query):
+    if line.startswith(">"):
+        Records.append([line[1:].split()[0], ""])
+    else:
+        Records[-1][1] += line.strip()
+with open(%r, "a") as Queries:
+    Queries.write("".join([Name + "\\n" for (Name, _) in Records]))
+for (Name, Sequence) in Records:
+    Random = random.Random(zlib.crc32(Sequence.upper().encode()))
+    for Target in Random.sample(range(40), Random.randint(0, 5)):
+        Score = Random.choice([50, 60, 70, 80, 90, 100])
+        Output.write("%%s\\tt%%d\\t90.0\\t%%d\\t1\\t0\\t1\\t%%d\\t1\\t%%d\\t1e-09\\t%%d\\n" %%
+                     (Name, Target, len(Sequence), len(Sequence), len(Sequence), Score))
+"""
+
+FakeBlastdbcmd = """import sys
+print("Database: targets\\n\\t40 sequences; 12,000 total bases")
+"""
+
+# Fake makeblastdb and blastdbcmd of the registry tests: the database is a
+# copy of the fasta file, their calls are logged in the calls file
+FakeMakeblastdb = """import sys, json, shutil
+Args = sys.argv[1:]
+with open(%r, "a") as Calls:
+    Calls.write(json.dumps(["makeblastdb"] + Args) + "\\n")
+if "empty" in open(Args[Args.index("-in") + 1]).read():
+    sys.stderr.write("BLAST options error: empty fasta file\\n")
+    sys.exit(1)
+shutil.copy(Args[Args.index("-in") + 1], Args[Args.index("-out") + 1] + ".nsq")
+"""
+
+FakeCheckingBlastdbcmd = """import os, sys, json
+Args = sys.argv[1:]
+with open(%r, "a") as Calls:
+    Calls.write(json.dumps(["blastdbcmd"] + Args) + "\\n")
+if not os.path.isfile(Args[Args.index("-db") + 1] + ".nsq"):
+    sys.stderr.write("BLAST Database error: No alias or index file found\\n")
+    sys.exit(2)
+print("Database: targets\\n\\t40 sequences; 12,000 total bases")
+"""
+
+
+class BlastTestCase(TmpDirTestCase):
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        self.fake_program("blastn", FakeBlastn %(self.path("calls.log"), self.path("queries.log")))
+        self.fake_program("blastdbcmd", FakeBlastdbcmd)
+        Random = random.Random(5)
+        self.QueryFile = write_fasta(self.path("queries.fa"),
+                                     [("q%s" %(i), random_sequence(Random.randint(50, 300), Random))
+                                      for i in range(60)])
+
+    def calls(self):
+        with open(self.path("calls.log")) as Calls:
+            return [json.loads(line) for line in Calls]
+
+    def searched_queries(self):
+        """Return the queries searched by blastn since the last call"""
+        if not os.path.isfile(self.path("queries.log")):
+            return []
+        with open(self.path("queries.log")) as Queries:
+            Names = [line.strip() for line in Queries]
+        os.remove(self.path("queries.log"))
+        return Names
+
+    def blast(self):
+        Blast = BlastPlus.Blast("blastn", self.QueryFile, db_list=[self.path("targets")])
+        Blast.OutFormat = 6
+        Blast.Threads = 4
+        return Blast
+
+    def read(self, Filename):
+        with open(Filename) as File:
+            return File.read()
+
+
+class TestBlastPipe(BlastTestCase):
+    def test_pipe_gives_the_file_output(self):
+        Blast = self.blast()
+        (_, err) = Blast.launch(self.path("single.blast"))
+        self.assertEqual(err, "")
+        Pipe = Blast.launch_pipe()
+        Output = Pipe.stdout.read()
+        self.assertEqual(Blast.wait(Pipe), "")
+        self.assertEqual(Output, self.read(self.path("single.blast")))
+        [FileCall, PipeCall] = self.calls()
+        self.assertEqual(PipeCall, [Arg for Arg in FileCall if not Arg in ["-out", self.path("single.blast")]])
+
+    def test_pipe_by_chunks(self):
+        Blast = self.blast()
+        Blast.launch(self.path("single.blast"))
+        Pipe = Blast.launch_pipe()
+        Blocks = list(HitAssignment.iter_query_blocks(HitAssignment.read_blast_table(Pipe.stdout, chunksize=7)))
+        self.assertEqual(Blast.wait(Pipe), "")
+        Table = HitAssignment.read_blast_table(self.path("single.blast"))
+        self.assertEqual(sum([list(Block.qid) for Block in Blocks], []), list(Table.qid))
+        self.assertEqual(sum([list(Block.score) for Block in Blocks], []), list(Table.score))
+        # The hits of a query are in one block
+        BlockQueries = sum([list(Block.qid.drop_duplicates()) for Block in Blocks], [])
+        self.assertEqual(BlockQueries, list(Table.qid.drop_duplicates()))
+        self.assertTrue(len(Blocks) > 1)
+
+    def test_pipe_error(self):
+        self.fake_program("blastn", "import sys\nsys.stderr.write('BLAST query error\\n')\nsys.exit(2)\n")
+        Blast = self.blast()
+        Pipe = Blast.launch_pipe()
+        self.assertEqual(Pipe.stdout.read(), "")
+        self.assertEqual(Blast.wait(Pipe), "BLAST query error\n")
+        self.fake_program("blastn", "import sys\nsys.exit(3)\n")
+        Pipe = Blast.launch_pipe()
+        self.assertEqual(Blast.wait(Pipe), "blastn exited with code 3")
+
+
+class TestStreamedHits(BlastTestCase):
+    def test_iter_hits(self):
+        Blast = self.blast()
+        Blast.launch(self.path("single.blast"))
+        Lines = self.read(self.path("single.blast")).splitlines(True)
+        self.assertEqual(list(Blast.iter_lines()), Lines)
+        self.assertEqual(Blast.Error, "")
+        Hits = list(Blast.iter_hits())
+        self.assertEqual(Blast.Error, "")
+        self.assertEqual(len(Hits), len(Lines))
+        Fields = Lines[0].rstrip("\n").split("\t")
+        self.assertEqual((Hits[0].qid, Hits[0].alilen, Hits[0].qend, Hits[0].evalue, Hits[0].score),
+                         (Fields[0], int(Fields[3]), int(Fields[7]), float(Fields[10]), float(Fields[11])))
+        Groups = list(Blast.iter_hits(ByQuery=True))
+        self.assertEqual([Query for (Query, _) in Groups],
+                         [Query for (Query, _) in itertools.groupby([Hit.qid for Hit in Hits])])
+        self.assertEqual(sum([QueryHits for (_, QueryHits) in Groups], []), Hits)
+
+    def test_early_stop(self):
+        Blast = self.blast()
+        Lines = Blast.iter_lines()
+        self.assertTrue(next(Lines))
+        Lines.close()
+        self.assertEqual(Blast.Error, "")
+
+    def test_errors(self):
+        self.fake_program("blastn", "import sys\nsys.stderr.write('BLAST query error\\n')\nsys.exit(2)\n")
+        Blast = self.blast()
+        self.assertEqual(list(Blast.iter_hits()), [])
+        self.assertEqual(Blast.Error, "BLAST query error\n")
+        Blast.OutFormat = 7
+        self.assertEqual(list(Blast.iter_hits()), [])
+        self.assertIn("format 6", Blast.Error)
+
+
+class TestShardedBlast(BlastTestCase):
+    def test_shards_give_the_single_blast_output(self):
+        Blast = self.blast()
+        (_, err) = Blast.launch(self.path("single.blast"))
+        self.assertEqual(err, "")
+        (_, err) = Blast.launch_sharded(self.path("sharded.blast"), 4, self.TmpDir)
+        self.assertEqual(err, "")
+        self.assertEqual(self.read(self.path("sharded.blast")), self.read(self.path("single.blast")))
+        ShardCalls = self.calls()[1:]
+        self.assertEqual(len(ShardCalls), 4)
+        for Args in ShardCalls:
+            self.assertEqual(Args[Args.index("-dbsize") + 1], "12000")
+            self.assertEqual(Args[Args.index("-num_threads") + 1], "1")
+
+    def test_shards_do_not_change_the_blast(self):
+        Blast = self.blast()
+        Prefix = Blast.cache_prefix()
+        Blast.launch_sharded(self.path("sharded.blast"), 3, self.TmpDir)
+        self.assertEqual(Blast.DbSize, 0)
+        self.assertEqual(Blast.cache_prefix(), Prefix)
+        Blast.launch(self.path("single.blast"))
+        self.assertNotIn("-dbsize", self.calls()[-1])
+
+    def test_split_fasta(self):
+        Files = BlastPlus.split_fasta(self.QueryFile, 4, self.path("split"))
+        self.assertEqual(len(Files), 4)
+        Records = list(Fasta.iter_fasta(self.QueryFile))
+        self.assertEqual(sum([list(Fasta.iter_fasta(Filename)) for Filename in Files], []), Records)
+        Lengths = [sum([len(Sequence) for (_, Sequence) in Fasta.iter_fasta(Filename)]) for Filename in Files]
+        # Similar number of residues
+        self.assertTrue(max(Lengths) - min(Lengths) < 2 * max([len(Sequence) for (_, Sequence) in Records]))
+        self.assertEqual(BlastPlus.split_fasta(self.QueryFile, 1, self.path("split")), [self.QueryFile])
+
+
+class TestBlastCache(BlastTestCase):
+    def cached_blast(self):
+        Blast = self.blast()
+        Blast.Cache = BlastPlus.BlastCache(self.path("cache"))
+        return Blast
+
+    def test_cached_hits_are_replayed(self):
+        (_, err) = self.blast().launch(self.path("single.blast"))
+        self.assertEqual(err, "")
+        self.searched_queries()
+        (_, err) = self.cached_blast().launch(self.path("first.blast"))
+        self.assertEqual(err, "")
+        self.assertEqual(len(self.searched_queries()), 60)
+        self.assertEqual(self.read(self.path("first.blast")), self.read(self.path("single.blast")))
+
+        # New queries and renamed copies of cached ones
+        Random = random.Random(6)
+        Records = list(Fasta.iter_fasta(self.QueryFile))
+        Records = [("copy_%s" %(Name), Sequence) for (Name, Sequence) in Records[:30]] + \
+                  [("new%s" %(i), random_sequence(200, Random)) for i in range(10)]
+        self.QueryFile = write_fasta(self.path("queries2.fa"), Records)
+        (_, err) = self.blast().launch(self.path("single2.blast"))
+        self.searched_queries()
+        Blast = self.cached_blast()
+        (_, err) = Blast.launch(self.path("second.blast"))
+        self.assertEqual(err, "")
+        self.assertEqual(self.searched_queries(), ["new%s" %(i) for i in range(10)])
+        self.assertEqual((Blast.Cache.Hits, Blast.Cache.Misses), (30, 10))
+        self.assertEqual(self.read(self.path("second.blast")), self.read(self.path("single2.blast")))
+
+    def test_options_are_in_the_key(self):
+        self.cached_blast().launch(self.path("first.blast"))
+        self.searched_queries()
+        Blast = self.cached_blast()
+        Blast.Evalue = 1e-3
+        Blast.launch(self.path("second.blast"))
+        self.assertEqual(len(self.searched_queries()), 60)
+
+    def test_eviction(self):
+        Cache = BlastPlus.BlastCache(self.path("cache"))
+        Cache.MaxSize = 100
+        Connection = Cache.connect()
+        Cache.put(Connection, [("a", "x" * 40)])
+        time.sleep(0.01)
+        Cache.put(Connection, [("b", "x" * 40)])
+        time.sleep(0.01)
+        # a is used again, b is the least recently used
+        self.assertEqual(Cache.find(Connection, ["a", "c"]), set(["a"]))
+        time.sleep(0.01)
+        Cache.put(Connection, [("c", "x" * 40)])
+        self.assertEqual(Cache.find(Connection, ["a", "b", "c"]), set(["a", "c"]))
+        self.assertEqual(Cache.get(Connection, "c"), "x" * 40)
+        self.assertEqual(Cache.get(Connection, "b"), "")
+        Connection.close()
+
+
+class TestSearchCost(unittest.TestCase):
+    def test_search_cost(self):
+        # Few short queries on a large database, or the reverse
+        Forward = BlastPlus.search_cost(10, 5000, 10000000, BuildDatabase=False)
+        Reverse = BlastPlus.search_cost(10000, 10000000, 5000, BuildDatabase=False)
+        self.assertTrue(Forward < Reverse)
+        self.assertEqual(BlastPlus.search_cost(1, 10, 1000) - BlastPlus.search_cost(1, 10, 1000, BuildDatabase=False),
+                         BlastPlus.DatabaseBuildCost * 1000)
+        # One more batch of queries scans the database once more
+        self.assertEqual(BlastPlus.search_cost(2, BlastPlus.QueryBatchLength + 1, 1000, BuildDatabase=False),
+                         2 * 1000 + 2 * BlastPlus.QueryCost)
+
+
+class TestDatabaseRegistry(BlastTestCase):
+    def setUp(self):
+        BlastTestCase.setUp(self)
+        self.fake_program("makeblastdb", FakeMakeblastdb %(self.path("calls.log")))
+        self.fake_program("blastdbcmd", FakeCheckingBlastdbcmd %(self.path("calls.log")))
+        self.TargetFile = write_fasta(self.path("targets.fa"), [("t%s" %(i), "ACGT" * 20) for i in range(40)])
+
+    def programs(self):
+        """Return the programs called since the last call"""
+        if not os.path.isfile(self.path("calls.log")):
+            return []
+        Programs = [Args[0] for Args in self.calls()]
+        os.remove(self.path("calls.log"))
+        return Programs
+
+    def test_database_built_once(self):
+        DatabaseName = BlastPlus.DatabaseRegistry(self.path("registry")).database(self.TargetFile)
+        self.assertTrue(DatabaseName.startswith(self.path("registry")))
+        self.assertEqual(self.programs(), ["makeblastdb", "blastdbcmd"])
+        # Another job with a copy of the fasta file
+        Copy = write_fasta(self.path("copy.fa"), Fasta.iter_fasta(self.TargetFile))
+        self.assertEqual(BlastPlus.DatabaseRegistry(self.path("registry")).database(Copy), DatabaseName)
+        self.assertEqual(self.programs(), [])
+        # Other makeblastdb options, other database
+        Registry = BlastPlus.DatabaseRegistry(self.path("registry"))
+        Registry.IndexedDatabase = False
+        self.assertNotEqual(Registry.database(self.TargetFile), DatabaseName)
+        self.assertEqual(self.programs(), ["makeblastdb", "blastdbcmd"])
+
+    def test_changed_database_checked_again(self):
+        Registry = BlastPlus.DatabaseRegistry(self.path("registry"))
+        DatabaseName = Registry.database(self.TargetFile)
+        self.programs()
+        self.assertTrue(Registry.is_database(DatabaseName))
+        self.assertEqual(self.programs(), [])
+        with open(DatabaseName + ".nsq", "a") as Database:
+            Database.write(">t40\nACGT\n")
+        self.assertTrue(Registry.is_database(DatabaseName))
+        self.assertEqual(self.programs(), ["blastdbcmd"])
+        os.remove(DatabaseName + ".nsq")
+        self.assertFalse(Registry.is_database(DatabaseName))
+        # The removed database is built again
+        self.assertEqual(Registry.database(self.TargetFile), DatabaseName)
+        self.assertEqual(self.programs(), ["blastdbcmd", "blastdbcmd", "makeblastdb", "blastdbcmd"])
+
+    def test_build_failure(self):
+        EmptyFile = write_fasta(self.path("empty.fa"), [("empty", "ACGT")])
+        Registry = BlastPlus.DatabaseRegistry(self.path("registry"))
+        self.assertEqual(Registry.database(EmptyFile), "")
+        self.assertEqual(Registry.database(EmptyFile), "")
+        self.assertEqual(self.programs(), ["makeblastdb", "makeblastdb"])
+
+
+
+class TestVolumeBlast(TmpDirTestCase):
+    """Blast on the volumes of a database with the fake blast suite of test_seq_dispatcher"""
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        self.fake_program("makeblastdb", test_seq_dispatcher.FakeMakeblastdb)
+        self.fake_program("blastdbcmd", test_seq_dispatcher.FakeBlastdbcmd)
+        # The calls of blastn are logged in the calls file
+        self.fake_program("blastn", "import sys, json\nwith open(%r, 'a') as Calls:\n    Calls.write(json.dumps(sys.argv[1:]) + '\\n')\n"
+                          %(self.path("calls.log")) + test_seq_dispatcher.FakeBlastn)
+        Random = random.Random(20)
+        # Each target has a copy in the other volume: the best targets of a query are near ties
+        Volumes = [[], []]
+        for i in range(30):
+            Sequence = random_sequence(Random.randint(200, 400), Random)
+            Volumes[0].append(("a%s" %(i), Sequence))
+            Volumes[1].append(("b%s" %(i), test_seq_dispatcher.mutate(Sequence, Random, Random.randint(0, 2))))
+        Volumes[1].extend([("c%s" %(i), random_sequence(300, Random)) for i in range(20)])
+        write_fasta(self.path("whole.fsa"), Volumes[0] + Volumes[1])
+        for (i, Records) in enumerate(Volumes):
+            write_fasta(self.path("volumes.%02d.fsa" %(i)), Records)
+        with open(self.path("volumes.nal"), "w") as Alias:
+            Alias.write('TITLE volumes\nDBLIST "volumes.00" "volumes.01"\n')
+        # Queries of a few lengths
+        Queries = []
+        for i in range(40):
+            (_, Target) = Random.choice(Volumes[0])
+            Length = Random.choice([60, 90, 150])
+            Start = Random.randint(0, len(Target) - Length)
+            Queries.append(("q%s" %(i), Target[Start:Start + Length]))
+        self.QueryFile = write_fasta(self.path("queries.fa"), Queries)
+
+    def calls(self):
+        with open(self.path("calls.log")) as Calls:
+            return [json.loads(line) for line in Calls]
+
+    def blast(self, Database):
+        Blast = BlastPlus.Blast("blastn", self.QueryFile, db_list=[self.path(Database)])
+        Blast.OutFormat = 6
+        Blast.Evalue = 1e-5
+        Blast.max_target_seqs = 3
+        Blast.Threads = 4
+        return Blast
+
+    def test_volumes_do_not_change_the_blast(self):
+        (_, err) = self.blast("whole").launch(self.path("whole.blast"))
+        self.assertEqual(err, "")
+        os.remove(self.path("calls.log"))
+        Blast = self.blast("volumes")
+        Prefix = Blast.cache_prefix()
+        (_, err) = Blast.launch_volumes(self.path("merged.blast"), self.TmpDir)
+        self.assertEqual(err, "")
+        with open(self.path("whole.blast")) as Whole:
+            Expected = Whole.read()
+        self.assertTrue(len(Expected.splitlines()) > 40)
+        with open(self.path("merged.blast")) as Volumes:
+            self.assertEqual(Volumes.read(), Expected)
+        # One blast of each volume by query length, after the blast of the search spaces
+        Calls = self.calls()
+        self.assertEqual(Calls[0][Calls[0].index("-outfmt") + 1], "0")
+        Lengths = Fasta.fasta_lengths(self.path("whole.fsa"))
+        self.assertEqual(sorted([(Args[Args.index("-db") + 1], Args[Args.index("-searchsp") + 1]) for Args in Calls[1:]]),
+                         sorted([(self.path(Volume), str(Length * (sum(Lengths) - 5 * len(Lengths))))
+                                 for Volume in ["volumes.00", "volumes.01"] for Length in [60, 90, 150]]))
+        self.assertEqual(Blast.DbSize, 0)
+        self.assertEqual(Blast.cache_prefix(), Prefix)
+        self.assertEqual(sorted(os.listdir(self.TmpDir)), sorted(["bin", "calls.log", "queries.fa", "whole.blast", "merged.blast", "whole.fsa",
+                                                                  "volumes.nal", "volumes.00.fsa", "volumes.01.fsa"]))
+
+    def test_split_by_search_space(self):
+        Groups = BlastPlus.split_by_search_space(self.QueryFile, {"q1": 20, "q2": 10, "q3": 20, "q5": 10},
+                                                 self.path("groups"), BufferSize=10)
+        self.assertEqual([(SearchSpace, Names) for (SearchSpace, _, Names) in Groups], [(10, ["q2", "q5"]), (20, ["q1", "q3"])])
+        Sequences = dict(Fasta.iter_fasta(self.QueryFile))
+        for (_, GroupFile, Names) in Groups:
+            self.assertEqual(list(Fasta.iter_fasta(GroupFile)), [(Name, Sequences[Name]) for Name in Names])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+# File: test_Collapser.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import random
+import subprocess
+import unittest
+
+import numpy
+import pandas
+
+from helpers import TmpDirTestCase, random_sequence, write_fasta
+from test_seq_dispatcher import FakeBlastn
+
+import Fasta
+import Collapser
+import HitAssignment
+
+
+def blast_table(Hits):
+    return pandas.DataFrame(Hits, columns=HitAssignment.FieldNames).astype(HitAssignment.FieldTypes)
+
+
+class TestCollapse(TmpDirTestCase):
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        Random = random.Random(14)
+        self.Long = random_sequence(300, Random)
+        self.Other = random_sequence(200, Random)
+        self.QueryFile = write_fasta(self.path("queries.fa"),
+                                     [("TRINITY_DN1_c0_g1_i1", self.Long[50:150]),
+                                      ("TRINITY_DN1_c0_g1_i2", self.Long),
+                                      ("TRINITY_DN1_c0_g1_i3", self.Long.lower()),
+                                      ("TRINITY_DN2_c0_g1_i1", self.Other),
+                                      ("TRINITY_DN3_c0_g1_i1", self.Long[50:150])])
+
+    def collapse(self, Contained):
+        QueryCollapser = Collapser.QueryCollapser()
+        QueryCollapser.Contained = Contained
+        RepresentativeNb = QueryCollapser.collapse(self.QueryFile, self.path("representatives.fa"))
+        Names = [Name for (Name, _) in Fasta.iter_fasta(self.path("representatives.fa"))]
+        self.assertEqual(RepresentativeNb, len(Names))
+        return (QueryCollapser, Names)
+
+    def test_duplicates(self):
+        (QueryCollapser, Names) = self.collapse(False)
+        self.assertEqual(Names, ["TRINITY_DN1_c0_g1_i1", "TRINITY_DN1_c0_g1_i2", "TRINITY_DN2_c0_g1_i1"])
+        self.assertEqual(QueryCollapser.Members, {"TRINITY_DN1_c0_g1_i2": [("TRINITY_DN1_c0_g1_i3", 0, 300)],
+                                                  "TRINITY_DN1_c0_g1_i1": [("TRINITY_DN3_c0_g1_i1", 0, 100)]})
+
+    def test_contained_isoforms(self):
+        (QueryCollapser, Names) = self.collapse(True)
+        # The representatives keep the query order, a copy of a contained
+        # isoform in another gene is a member of the same representative
+        self.assertEqual(Names, ["TRINITY_DN1_c0_g1_i2", "TRINITY_DN2_c0_g1_i1"])
+        self.assertEqual(sorted(QueryCollapser.Members["TRINITY_DN1_c0_g1_i2"]),
+                         [("TRINITY_DN1_c0_g1_i1", 50, 100), ("TRINITY_DN1_c0_g1_i3", 0, 300),
+                          ("TRINITY_DN3_c0_g1_i1", 50, 100)])
+        self.assertEqual(QueryCollapser.Lengths, {"TRINITY_DN1_c0_g1_i2": 300})
+
+
+class TestFanOut(unittest.TestCase):
+    def setUp(self):
+        self.Collapser = Collapser.QueryCollapser()
+        self.Collapser.Members = {"rep": [("dup", 0, 300), ("part", 50, 100)]}
+        self.Collapser.Lengths = {"rep": 300}
+
+    def test_duplicates_get_the_same_hits(self):
+        Table = blast_table([("rep", "t1", 100.0, 40, 0, 0, 201, 240, 1, 40, 1e-8, 70.0)])
+        Hits = self.Collapser.fan_out(Table)
+        self.assertEqual(list(Hits.qid), ["rep", "dup"])
+        self.assertEqual(Hits.iloc[1, 1:].tolist(), Table.iloc[0, 1:].tolist())
+
+    def test_contained_hits_are_clipped(self):
+        Table = blast_table([("rep", "t1", 100.0, 40, 0, 0, 61, 100, 11, 50, 1e-8, 70.0),
+                             ("rep", "t2", 100.0, 100, 0, 0, 101, 200, 300, 201, 1e-20, 180.0),
+                             ("rep", "t3", 100.0, 40, 0, 0, 201, 240, 1, 40, 1e-8, 70.0)])
+        Hits = self.Collapser.fan_out(Table)
+        Part = Hits[Hits.qid == "part"].set_index("tid")
+        self.assertEqual(sorted(Part.index), ["t1", "t2"])
+        # Contained hit: same alignment in the member coordinates, the evalue
+        # is the one of a search space 3 times smaller
+        self.assertEqual(Part.loc["t1", ["qstart", "qend", "tstart", "tend", "alilen"]].tolist(), [11, 50, 11, 50, 40])
+        self.assertAlmostEqual(Part.loc["t1", "score"], 70.0)
+        self.assertAlmostEqual(Part.loc["t1", "evalue"] / 1e-8, 1 / 3.0)
+        # Reverse hit overlapping the end of the member: half of it is kept
+        self.assertEqual(Part.loc["t2", ["qstart", "qend", "tstart", "tend", "alilen"]].tolist(), [51, 100, 300, 251, 50])
+        self.assertAlmostEqual(Part.loc["t2", "score"], 90.0)
+        self.assertAlmostEqual(numpy.log2(Part.loc["t2", "evalue"]), numpy.log2(1e-20 / 3) + 180 - 90)
+
+    def test_decreasing_query_coordinates(self):
+        # Reverse hit with decreasing query coordinates, as blast gives it with
+        # increasing query coordinates and decreasing target ones
+        Table = blast_table([("rep", "t1", 100.0, 40, 0, 0, 100, 61, 11, 50, 1e-8, 70.0),
+                             ("rep", "t2", 100.0, 40, 0, 0, 61, 100, 50, 11, 1e-8, 70.0)])
+        Hits = self.Collapser.fan_out(Table)
+        Columns = ["qstart", "qend", "tstart", "tend", "alilen", "score", "evalue"]
+        for Member in ["dup", "part"]:
+            MemberHits = Hits[Hits.qid == Member].set_index("tid")
+            self.assertEqual(MemberHits.loc["t1", Columns].tolist(), MemberHits.loc["t2", Columns].tolist())
+        self.assertEqual(Hits[Hits.qid == "part"].set_index("tid").loc["t1", ["qstart", "qend", "tstart", "tend"]].tolist(),
+                         [11, 50, 50, 11])
+
+    def test_clipped_hits_above_the_evalue_threshold_are_discarded(self):
+        Table = blast_table([("rep", "t1", 100.0, 100, 0, 0, 1, 100, 1, 100, 1e-50, 180.0),
+                             ("rep", "t2", 100.0, 100, 0, 0, 141, 240, 1, 100, 1e-50, 180.0)])
+        self.Collapser.Evalue = 1e-6
+        Hits = self.Collapser.fan_out(Table)
+        # t1 keeps 50 residues of the member (90 bits), t2 only 10 (18 bits)
+        self.assertEqual(Hits[Hits.qid == "part"].tid.tolist(), ["t1"])
+        self.assertEqual(Hits[Hits.qid == "dup"].tid.tolist(), ["t1", "t2"])
+
+    def test_null_evalues(self):
+        Table = blast_table([("rep", "t1", 100.0, 300, 0, 0, 1, 300, 1, 300, 0.0, 550.0),
+                             ("rep", "t2", 100.0, 100, 0, 0, 61, 160, 1, 100, 1e-40, 180.0)])
+        Hits = self.Collapser.fan_out(Table)
+        Part = Hits[Hits.qid == "part"].set_index("tid")
+        # The search space is read on the hit with a non null evalue
+        self.assertAlmostEqual(numpy.log2(Part.loc["t1", "evalue"]), numpy.log2(1e-40 / 3) + 180 - 550 / 3.0)
+        self.assertEqual(Hits[Hits.qid == "dup"].evalue.tolist(), [0.0, 1e-40])
+
+
+class TestMemberSearch(TmpDirTestCase):
+    """The hits given to a contained isoform are those of its own search"""
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        self.fake_program("blastn", FakeBlastn)
+        Random = random.Random(15)
+        self.Long = random_sequence(300, Random)
+        Complement = dict(zip("ACGT", "TGCA"))
+        # A forward target and a reverse one, overlapping the contained isoform on 30 bases
+        write_fasta(self.path("db.fsa"), [("t1", self.Long[:200]),
+                                          ("t2", "".join([Complement[Base] for Base in reversed(self.Long[120:])])),
+                                          ("t3", random_sequence(300, Random))])
+
+    def blastn(self, Name, Records):
+        QueryFile = write_fasta(self.path("%s.fa" %(Name)), Records)
+        subprocess.check_call(["blastn", "-query", QueryFile, "-db", self.path("db"), "-evalue", "1e-5",
+                               "-max_target_seqs", "10", "-out", self.path("%s.blast" %(Name))])
+        return HitAssignment.read_blast_table(self.path("%s.blast" %(Name)))
+
+    def test_contained_isoform(self):
+        QueryCollapser = Collapser.QueryCollapser()
+        QueryCollapser.Contained = True
+        QueryCollapser.Evalue = 1e-5
+        QueryCollapser.collapse(write_fasta(self.path("queries.fa"), [("TRINITY_DN1_c0_g1_i1", self.Long),
+                                                                       ("TRINITY_DN1_c0_g1_i2", self.Long[50:150])]),
+                                self.path("representatives.fa"))
+        Representatives = list(Fasta.iter_fasta(self.path("representatives.fa")))
+        self.assertEqual([Name for (Name, _) in Representatives], ["TRINITY_DN1_c0_g1_i1"])
+        Hits = QueryCollapser.fan_out(self.blastn("representatives", Representatives))
+        Fanned = Hits[Hits.qid == "TRINITY_DN1_c0_g1_i2"].set_index("tid").sort_index()
+        Direct = self.blastn("member", [("TRINITY_DN1_c0_g1_i2", self.Long[50:150])]).set_index("tid").sort_index()
+        self.assertEqual(list(Fanned.index), ["t1", "t2"])
+        self.assertEqual(list(Fanned.index), list(Direct.index))
+        Columns = ["qstart", "qend", "tstart", "tend", "alilen"]
+        self.assertEqual(Fanned[Columns].values.tolist(), Direct[Columns].values.tolist())
+        numpy.testing.assert_allclose(Fanned.score.values, Direct.score.values, atol=0.1)
+        # The evalues are written with 2 digits by blast
+        numpy.testing.assert_allclose(Fanned.evalue.values, Direct.evalue.values, rtol=0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
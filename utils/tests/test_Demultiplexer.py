@@ -0,0 +1,94 @@
+# File: test_Demultiplexer.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import os
+import glob
+import random
+import unittest
+
+from helpers import TmpDirTestCase, random_sequence, write_fasta
+
+import Fasta
+import Demultiplexer
+
+
+class TestFamilyDemultiplexer(TmpDirTestCase):
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        Random = random.Random(4)
+        self.Records = [("q%s" %(i), random_sequence(Random.randint(10, 200), Random).lower()) for i in range(50)]
+        self.QueryFile = write_fasta(self.path("queries.fa"), self.Records)
+        self.Retained = dict([(Name, ("F%s" %(Random.randint(0, 4)), "t%s" %(Random.randint(0, 9))))
+                              for (Name, _) in Random.sample(self.Records, 30)])
+        self.Reversed = set(Random.sample(sorted(self.Retained), 10))
+
+    def dispatch(self, Name, BufferSize):
+        os.mkdir(self.path(Name))
+        Dispatcher = Demultiplexer.FamilyDemultiplexer(self.path("%s/Trinity.A.sp" %(Name)), "sp", "A")
+        Dispatcher.Sp2SeqByFamily = True
+        Dispatcher.TableOneFile = True
+        Dispatcher.BufferSize = BufferSize
+        RankedRetained = [(Rank, self.Retained[Query][0], self.Retained[Query][1], Query in self.Reversed)
+                          for (Rank, (Query, _)) in enumerate(self.Records) if Query in self.Retained]
+        self.assertEqual(Dispatcher.dispatch_ranked(self.QueryFile, iter(RankedRetained)), 30)
+        Outputs = {}
+        for Filename in glob.glob(self.path("%s/*" %(Name))):
+            with open(Filename) as File:
+                Outputs[os.path.basename(Filename)] = File.read()
+        return Outputs
+
+    def test_dispatch(self):
+        Outputs = self.dispatch("large", 10000000)
+        # A small buffer is flushed several times
+        self.assertEqual(self.dispatch("small", 100), Outputs)
+
+        Sequences = dict(self.Records)
+        Table = [line.split("\t") for line in Outputs["Trinity.A.sp_table.tsv"].splitlines()]
+        RetainedNames = [Name for (Name, _) in self.Records if Name in self.Retained]
+        self.assertEqual(len(Table), 30)
+        for ((SeqName, Target, Family), Query) in zip(Table, RetainedNames):
+            # Numbered in the query order
+            self.assertEqual(SeqName, "TRA0%s_%s" %(str(RetainedNames.index(Query) + 1).zfill(10), Family))
+            self.assertEqual((Family, Target), self.Retained[Query])
+            Written = dict(Fasta.iter_fasta(self.path("large/Trinity.A.sp.%s.fa" %(Family))))
+            Expected = Sequences[Query].upper()
+            if Query in self.Reversed:
+                Expected = Fasta.rev_complement(Expected)
+            self.assertEqual(Written[SeqName], Expected)
+            self.assertIn("sp:%s\n" %(SeqName), Outputs["Trinity.A.sp.%s.sp2seq.txt" %(Family)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# File: test_FastSearch.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import json
+import random
+import unittest
+
+from helpers import TmpDirTestCase, random_sequence, write_fasta, which
+
+import Fasta
+import FastSearch
+
+
+class TestMmseqsStrands(TmpDirTestCase):
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        Random = random.Random(6)
+        Target = random_sequence(900, Random)
+        self.TargetFile = write_fasta(self.path("target.fa"), [("target", Target)])
+        self.QueryFile = write_fasta(self.path("query.fa"),
+                                     [("forward", Target[100:500]),
+                                      ("reverse", Fasta.rev_complement(Target[300:800]))])
+
+    def launch(self):
+        Search = FastSearch.Mmseqs(self.QueryFile, self.TargetFile)
+        Search.TmpDirName = self.TmpDir
+        Search.Evalue = 1e-10
+        Output = self.path("hits.tsv")
+        (_, err) = Search.launch(Output)
+        self.assertEqual(err, "")
+        with open(Output) as File:
+            return [line.rstrip("\n").split("\t") for line in File]
+
+    def test_both_strands_are_searched(self):
+        self.fake_program("mmseqs", "import sys, json\n"
+                          "json.dump(sys.argv[1:], open(%r, 'w'))\n"
+                          "open(sys.argv[4], 'w').close()\n" %(self.path("args.json")))
+        self.launch()
+        with open(self.path("args.json")) as File:
+            Args = json.load(File)
+        self.assertEqual(Args[Args.index("--strand") + 1], "2")
+
+    @unittest.skipUnless(which("mmseqs"), "mmseqs is not installed")
+    def test_reverse_complemented_query(self):
+        Hits = dict([(Hit[0], Hit) for Hit in reversed(self.launch())])
+        self.assertEqual(sorted(Hits), ["forward", "reverse"])
+        for (Query, Reverse) in [("forward", False), ("reverse", True)]:
+            (qstart, qend, tstart, tend) = [int(Field) for Field in Hits[Query][6:10]]
+            self.assertEqual((qend - qstart) * (tend - tstart) < 0, Reverse)
+
+
+class TestPaf2Blast(unittest.TestCase):
+    def test_forward(self):
+        line = "q1\t300\t10\t250\t+\tt1\t1000\t100\t345\t230\t245\t60\tNM:i:15\tAS:i:410\tcg:Z:100M3I50M2D90M\n"
+        self.assertEqual(FastSearch.paf2blast(line).split("\t"),
+                         ["q1", "t1", "93.878", "245", "10", "2", "11", "250", "101", "345", "0", "410\n"])
+
+    def test_reverse(self):
+        # The target coordinates are reversed on the minus strand, as in blast
+        line = "q1\t300\t0\t300\t-\tt1\t1000\t500\t800\t300\t300\t60\tNM:i:0\tcg:Z:300M\n"
+        Fields = FastSearch.paf2blast(line).split("\t")
+        self.assertEqual(Fields[6:10], ["1", "300", "800", "501"])
+        # Without AS tag, the score is the number of matches
+        self.assertEqual(Fields[11], "300\n")
+
+    def test_short_line(self):
+        self.assertEqual(FastSearch.paf2blast("q1\t300\n"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# File: test_Fasta.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import unittest
+
+from helpers import TmpDirTestCase
+
+import Fasta
+
+
+class TestFasta(TmpDirTestCase):
+    def test_iter_fasta(self):
+        with open(self.path("seqs.fa"), "w") as File:
+            File.write("ignored\n>s1 description\nACGT\nAC\n\n>s2\n>s3\nGG\n")
+        self.assertEqual(list(Fasta.iter_fasta(self.path("seqs.fa"))),
+                         [("s1", "ACGTAC"), ("s2", ""), ("s3", "GG")])
+        self.assertEqual([Header for (_, Header, _) in Fasta.iter_fasta_headers(self.path("seqs.fa"))],
+                         ["s1 description", "s2", "s3"])
+
+    def test_rev_complement(self):
+        self.assertEqual(Fasta.rev_complement("AACGTN\nRYacgt"), "acgtRYNACGTT")
+        self.assertEqual(Fasta.rev_complement(Fasta.rev_complement("ACGGTTARYSWB")), "ACGGTTARYSWB")
+
+    def test_format_fasta(self):
+        self.assertEqual(Fasta.format_fasta("s1", "ACGTA", width=2), ">s1\nAC\nGT\nA\n")
+        self.assertEqual(Fasta.format_fasta("s1", "AC", width=2), ">s1\nAC\n")
+
+    def test_extract_sequences(self):
+        with open(self.path("seqs.fa"), "w") as File:
+            File.write(">s1\nACGT\n>s2 description\nAC\n>s3\nGGG\n")
+        self.assertEqual(Fasta.fasta_lengths(self.path("seqs.fa")), [4, 2, 3])
+        self.assertEqual(Fasta.extract_sequences(self.path("seqs.fa"), ["s3", "s2", "s9"], self.path("subset.fa")), [2, 3])
+        self.assertEqual(list(Fasta.iter_fasta(self.path("subset.fa"))), [("s2", "AC"), ("s3", "GGG")])
+
+
+if __name__ == "__main__":
+    unittest.main()
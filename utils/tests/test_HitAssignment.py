@@ -0,0 +1,318 @@
+# File: test_HitAssignment.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import os
+import random
+import unittest
+
+import pandas
+
+from helpers import TmpDirTestCase, write_fasta
+
+import HitAssignment
+import TargetIndex
+
+
+def baseline_hit_dic(Hits, QueryNames, Target2Family):
+    """First step of the original seq_dispatcher.py on a list of blast hits
+    (qid, tid, qstart, qend, tstart, tend, score). Return (HitDic, NoHitList)"""
+    (HitDic, NoHitList) = ({}, [])
+    for Query in QueryNames:
+        Query = Query.split()[0]
+        TmpHits = [Hit for Hit in Hits if Hit[0] == Query]
+        if not TmpHits:
+            NoHitList.append(Query)
+            continue
+        TmpBestScore = max([Hit[6] for Hit in TmpHits])
+        BestHits = [Hit for Hit in TmpHits if Hit[6] >= TmpBestScore]
+        TmpFamily = set([Target2Family[Hit[1]] for Hit in BestHits])
+        if len(TmpFamily) > 1:
+            continue
+        Family = TmpFamily.pop()
+        for Hit in BestHits:
+            Target = Hit[1]
+            FirstHit = [Other for Other in BestHits if Other[1] == Target][0]
+            HitDic.setdefault(Family, {})
+            HitDic[Family].setdefault(Target, {"Query":[], "Score":[], "Reverse":[], "Retained":[]})
+            HitDic[Family][Target]["Query"].append(Query)
+            HitDic[Family][Target]["Score"].append(TmpBestScore)
+            HitDic[Family][Target]["Reverse"].append((FirstHit[3] - FirstHit[2]) * (FirstHit[5] - FirstHit[4]) < 0)
+    return (HitDic, NoHitList)
+
+
+def baseline_retained(Hits, QueryNames, Target2Family):
+    """Two steps of the original seq_dispatcher.py on a list of blast hits:
+    the queries of a target with a score >= 0.9 * the best score of the target
+    are retained. Return a dictionary retained query -> (family, reverse)."""
+    (HitDic, _) = baseline_hit_dic(Hits, QueryNames, Target2Family)
+    Retained = {}
+    for Family in HitDic:
+        for Target in HitDic[Family]:
+            Hits = HitDic[Family][Target]
+            BestScore = max(Hits["Score"])
+            for (Query, Score, Reverse) in zip(Hits["Query"], Hits["Score"], Hits["Reverse"]):
+                if Score >= 0.9 * BestScore:
+                    Retained[Query] = (Family, Retained.get(Query, (Family, False))[1] or Reverse)
+    return Retained
+
+
+def baseline_check(Hits, QueryNames, Target2Family, ExpectedFamily):
+    """Original check_family.py on a list of blast hits. Return (RetainedQuery, DiscardedQuery)"""
+    (RetainedQuery, DiscardedQuery) = ([], [])
+    for Query in QueryNames:
+        Query = Query.split()[0]
+        TmpHits = [Hit for Hit in Hits if Hit[0] == Query]
+        if not TmpHits:
+            continue
+        TmpBestScore = max([Hit[6] for Hit in TmpHits])
+        TmpFamily = []
+        for Hit in TmpHits:
+            if Hit[6] == TmpBestScore and not Target2Family[Hit[1]] in TmpFamily:
+                TmpFamily.append(Target2Family[Hit[1]])
+        if len(TmpFamily) > 1:
+            DiscardedQuery.append(Query + "\t" + ",".join(TmpFamily))
+        elif TmpFamily[0] != ExpectedFamily:
+            DiscardedQuery.append(Query + "\t" + TmpFamily[0])
+        else:
+            RetainedQuery.append(Query)
+    return (RetainedQuery, DiscardedQuery)
+
+
+def random_case(Random):
+    """Return (hits, query names, target -> family) of a random search with
+    ties and scores close to the 0.9 threshold"""
+    Target2Family = dict([("t%s" %(i), "F%s" %(Random.randint(0, Random.randint(1, 5))))
+                          for i in range(Random.randint(1, 15))])
+    Targets = sorted(Target2Family)
+    (Hits, Queries) = ([], ["q%s" %(i) for i in range(Random.randint(1, 30))])
+    for Query in Queries:
+        QueryHits = []
+        for Target in Random.sample(Targets, Random.randint(0, min(6, len(Targets)))):
+            (QueryStart, QueryEnd) = sorted(Random.sample(range(1, 500), 2))
+            (TargetStart, TargetEnd) = sorted(Random.sample(range(1, 500), 2))
+            if Random.random() < 0.3:
+                (TargetStart, TargetEnd) = (TargetEnd, TargetStart)
+            Score = Random.choice([50.0, 45.0, 44.9, 90.0, 81.0, 80.9, 100.0])
+            QueryHits.append((Query, Target, QueryStart, QueryEnd, TargetStart, TargetEnd, Score))
+            if Random.random() < 0.2:
+                # Another HSP of the same score on the other strand
+                QueryHits.append((Query, Target, QueryStart, QueryEnd, TargetEnd, TargetStart, Score))
+        # Blast sorts the hits of a query by score
+        Hits.extend(sorted(QueryHits, key=lambda Hit: -Hit[6]))
+    # The fasta headers may have a description
+    Queries = [Query + Random.choice(["", " description"]) for Query in Queries]
+    return (Hits, Queries, Target2Family)
+
+
+def blast_table(Hits, Target2Family):
+    """Return the blast table of the hits with the family of their target"""
+    BlastTable = pandas.DataFrame([(Query, Target, 100.0, 100, 0, 0, QueryStart, QueryEnd, TargetStart, TargetEnd, 1e-10, Score)
+                                   for (Query, Target, QueryStart, QueryEnd, TargetStart, TargetEnd, Score) in Hits],
+                                  columns=HitAssignment.FieldNames).astype(HitAssignment.FieldTypes)
+    return pandas.merge(BlastTable, target2family_table(Target2Family), how='left', left_on=['tid'], right_on=['Target'])
+
+
+def target2family_table(Target2Family):
+    return pandas.DataFrame(sorted(Target2Family.items()), columns=["Target", "Family"])
+
+
+class TestBaselineEquivalence(TmpDirTestCase):
+    CaseNb = 200
+
+    def target_index(self, Target2Family):
+        TargetFile = write_fasta(self.path("targets.fa"), [(Target, "ACGT") for Target in sorted(Target2Family)])
+        with open(self.path("t2f.tsv"), "w") as File:
+            for Target in sorted(Target2Family):
+                File.write("%s\t%s\n" %(Target, Target2Family[Target]))
+        Index = TargetIndex.TargetFamilyIndex()
+        Index.build(TargetFile, self.path("t2f.tsv"))
+        return Index
+
+    def named(self, RetainedQueries, Index):
+        """Return {query: (family, reverse)} of retained queries (rank, family, target, reverse)"""
+        RetainedQueries = list(RetainedQueries)
+        Ranks = [Rank for (Rank, _, _, _) in RetainedQueries]
+        self.assertEqual(Ranks, sorted(set(Ranks)))
+        Names = dict(zip(Index.Ranks, Index.Names))
+        return dict([(Names[Rank], (Family, Reverse)) for (Rank, Family, _, Reverse) in RetainedQueries])
+
+    def test_assign_families(self):
+        Random = random.Random(2020)
+        for Case in range(self.CaseNb):
+            (Hits, Queries, Target2Family) = random_case(Random)
+            Codes = self.target_index(Target2Family)
+            Index = HitAssignment.QueryIndex(Queries)
+            (Assigned, NoHitList) = HitAssignment.assign_families(Codes.add_families(blast_table(Hits, Target2Family)[HitAssignment.FieldNames]),
+                                                                  Index)
+            self.assertEqual(NoHitList, baseline_hit_dic(Hits, Queries, Target2Family)[1], "case %s" %(Case))
+            self.assertEqual(self.named(Assigned.retained(Threshold=0.9).iter_named(Codes), Index),
+                             baseline_retained(Hits, Queries, Target2Family), "case %s" %(Case))
+
+    def assigners(self, Random, Hits, Queries, GroupStarts, Codes):
+        """Yield the retained queries of the in-memory and spilled assigners"""
+        Index = HitAssignment.QueryIndex(Queries)
+        Table = blast_table(Hits, {})[HitAssignment.FieldNames]
+        # Blocks cut inside the hits of a query
+        ChunkSize = max(1, len(Table.index) // Random.randint(1, 3) + 1)
+        Chunks = [Table.iloc[Start:Start + ChunkSize] for Start in range(0, len(Table.index), ChunkSize)]
+
+        Assigner = HitAssignment.FamilyAssigner(Index, Codes)
+        for BlastTable in HitAssignment.iter_query_blocks(Chunks):
+            Assigner.add_hits(BlastTable)
+        self.assertEqual(Assigner.HitNb, len(Hits))
+        self.assertEqual(Assigner.HitQueryNb, len(set([Hit[0] for Hit in Hits])))
+        self.assertEqual(Assigner.AssignedNb, Assigner.get_hits().query_nb())
+        self.assertEqual(Assigner.AssignedNb + sum(Assigner.AmbiguousNb.values()), Assigner.HitQueryNb)
+        yield ("memory", Assigner.get_hits().retained(Threshold=0.9, GroupStarts=GroupStarts).iter_named(Codes))
+
+        # Resident memory of 2 MB after the first block: the hits are kept
+        # in memory below the budget of 1 MB, on disk from the second block,
+        # and always on disk without budget
+        for (Kind, MaxMemory) in [("spilled", 0), ("budget", 1), ("unreached budget", 1000)]:
+            Assigner = HitAssignment.SpilledFamilyAssigner(Index, Codes, self.path("spill%s" %(len(os.listdir(self.TmpDir)))))
+            Assigner.MaxMemory = MaxMemory
+            Assigner.GroupStarts = GroupStarts
+            Assigner.ChunkSize = Random.randint(5, 50)
+            Assigner.BucketNb = Random.randint(1, 4)
+            Memory = [0.5]
+            BlockNb = -1
+            RssMb = HitAssignment.Metrics.rss_mb
+            HitAssignment.Metrics.rss_mb = lambda: Memory[0]
+            try:
+                for (BlockNb, BlastTable) in enumerate(HitAssignment.iter_query_blocks(Chunks)):
+                    Assigner.add_hits(BlastTable)
+                    Memory[0] = 2.0
+            finally:
+                HitAssignment.Metrics.rss_mb = RssMb
+            self.assertEqual(Assigner.Spilling, MaxMemory == 0 or (MaxMemory == 1 and BlockNb > 0))
+            self.assertEqual(os.path.isdir(Assigner.SpillDirName), Assigner.Spilling)
+            yield (Kind, Assigner.iter_named())
+
+    def test_random_cases(self):
+        # The queries of one or two samples, confirmed separately
+        Random = random.Random(5)
+        for Case in range(self.CaseNb // 4):
+            (Hits, Queries, Target2Family) = random_case(Random)
+            Codes = self.target_index(Target2Family)
+            Split = Random.randint(1, len(Queries))
+            Expected = {}
+            for SampleQueries in [Queries[:Split], Queries[Split:]]:
+                Names = [Query.split()[0] for Query in SampleQueries]
+                Expected.update(baseline_retained([Hit for Hit in Hits if Hit[0] in Names], SampleQueries, Target2Family))
+            for (Kind, RetainedQueries) in self.assigners(Random, Hits, Queries, [0, Split], Codes):
+                self.assertEqual(self.named(RetainedQueries, HitAssignment.QueryIndex(Queries)), Expected,
+                                 "case %s (%s assigner)" %(Case, Kind))
+
+    def test_estimated_scores(self):
+        # The estimated scores of the queries assigned by the prefilter are not compared with the blast scores
+        Codes = self.target_index({"t1": "F1"})
+        Index = HitAssignment.QueryIndex(["q0", "q1", "q2"])
+        BlastHits = HitAssignment.HitTable([0], [0], [0], [100.0], [False])
+        DirectHits = HitAssignment.HitTable([1, 2], [0, 0], [0, 0], [600.0, 300.0], [False, True], Approximate=[True, True])
+        Expected = [(0, "F1", "t1", False), (1, "F1", "t1", False)]
+        Hits = HitAssignment.concat_hit_tables([BlastHits, DirectHits])
+        self.assertEqual(list(Hits.retained(Threshold=0.9).iter_named(Codes)), Expected)
+        Assigner = HitAssignment.SpilledFamilyAssigner(Index, Codes, self.path("spill"))
+        Assigner.add_hit_table(BlastHits)
+        Assigner.add_hit_table(DirectHits)
+        self.assertEqual(list(Assigner.iter_named()), Expected)
+
+    def test_check_families(self):
+        Random = random.Random(7)
+        for Case in range(self.CaseNb):
+            (Hits, Queries, Target2Family) = random_case(Random)
+            ExpectedFamily = Random.choice(sorted(Target2Family.values()))
+            self.assertEqual(HitAssignment.check_families(blast_table(Hits, Target2Family), Queries, ExpectedFamily),
+                             baseline_check(Hits, Queries, Target2Family, ExpectedFamily), "case %s" %(Case))
+
+    def test_compare_assignments(self):
+        Random = random.Random(9)
+        (Hits, Queries, Target2Family) = random_case(Random)
+        Codes = self.target_index(Target2Family)
+        Index = HitAssignment.QueryIndex(Queries)
+        (Assigned, _) = HitAssignment.assign_families(Codes.add_families(blast_table(Hits, Target2Family)[HitAssignment.FieldNames]),
+                                                      Index)
+        Ranks = range(len(Queries))
+        AssignedNb = Assigned.query_nb()
+        self.assertTrue(0 < AssignedNb < len(Queries))
+        self.assertEqual(HitAssignment.compare_assignments(Assigned, Assigned, Ranks),
+                         (len(Queries), len(Queries), len(Queries)))
+        # Reversed orientations
+        Reversed = HitAssignment.HitTable(Assigned.Query, Assigned.Target, Assigned.Family, Assigned.Score, ~Assigned.Reverse)
+        self.assertEqual(HitAssignment.compare_assignments(Reversed, Assigned, Ranks),
+                         (len(Queries), len(Queries), len(Queries) - AssignedNb))
+        self.assertEqual(HitAssignment.compare_assignments(HitAssignment.HitTable(), Assigned, Ranks),
+                         (len(Queries), len(Queries) - AssignedNb, len(Queries) - AssignedNb))
+
+
+class TestBlastTable(TmpDirTestCase):
+    def test_read(self):
+        with open(self.path("hits.blast"), "w") as File:
+            File.write("0001\t1e5\t99.5\t100\t1\t0\t1\t100\t200\t101\t1e-40\t180\n"
+                       "0001\tt2\t98.0\t50\t1\t0\t51\t100\t1\t50\t2e-10\t90.5\n")
+        Table = HitAssignment.read_blast_table(self.path("hits.blast"))
+        self.assertEqual(list(Table.columns), HitAssignment.FieldNames)
+        # The names are not converted to numbers
+        self.assertEqual(list(Table.qid), ["0001", "0001"])
+        self.assertEqual(list(Table.tid), ["1e5", "t2"])
+        self.assertEqual(list(Table.score), [180.0, 90.5])
+        self.assertEqual(list(Table.tstart), [200, 1])
+        Chunks = list(HitAssignment.read_blast_table(self.path("hits.blast"), chunksize=1))
+        self.assertEqual([len(Chunk.index) for Chunk in Chunks], [1, 1])
+
+    def test_read_empty(self):
+        open(self.path("empty.blast"), "w").close()
+        Table = HitAssignment.read_blast_table(self.path("empty.blast"))
+        self.assertEqual(list(Table.columns), HitAssignment.FieldNames)
+        self.assertEqual(len(Table.index), 0)
+        self.assertEqual(list(HitAssignment.iter_query_blocks(HitAssignment.read_blast_table(self.path("empty.blast"), chunksize=10))), [])
+
+    def test_query_blocks(self):
+        Table = blast_table([("q%s" %(i // 3), "t%s" %(i), 1, 10, 1, 10, 50.0) for i in range(10)], {})
+        Chunks = [Table.iloc[Start:Start + 4] for Start in range(0, 10, 4)]
+        Blocks = list(HitAssignment.iter_query_blocks(Chunks))
+        self.assertEqual([list(Block.qid) for Block in Blocks],
+                         [["q0"] * 3, ["q1"] * 3, ["q2"] * 3, ["q3"]])
+
+    def test_query_index(self):
+        Index = HitAssignment.QueryIndex(["q10 description", "q1", "q2", "q1", ""])
+        self.assertEqual(len(Index), 3)
+        self.assertEqual(list(Index.get(["q1", "q10", "q2", "q", "q100"])), [1, 0, 2, -1, -1])
+        self.assertEqual(list(HitAssignment.QueryIndex([]).get(["q1"])), [-1])
+        self.assertEqual(Index.names_by_rank([2, 0]), ["q10", "q2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
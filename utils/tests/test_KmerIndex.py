@@ -0,0 +1,124 @@
+# File: test_KmerIndex.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import random
+import unittest
+
+import numpy
+
+from helpers import TmpDirTestCase, random_sequence, write_fasta
+
+import Fasta
+import KmerIndex
+import HitAssignment
+
+
+class TestMinimizers(unittest.TestCase):
+    def test_canonical(self):
+        Sequence = random_sequence(500, random.Random(7))
+        (Codes, Forward) = KmerIndex.minimizers(Sequence, 15, 10)
+        (ReverseCodes, ReverseForward) = KmerIndex.minimizers(Fasta.rev_complement(Sequence), 15, 10)
+        self.assertEqual(sorted(Codes), sorted(ReverseCodes))
+        self.assertEqual(sorted(zip(Codes, Forward)), sorted(zip(ReverseCodes, ~ReverseForward)))
+
+    def test_short_and_invalid(self):
+        self.assertEqual(len(KmerIndex.minimizers("ACGT", 15, 10)[0]), 0)
+        self.assertEqual(len(KmerIndex.minimizers("N" * 100, 15, 10)[0]), 0)
+
+
+class TestPrefilter(TmpDirTestCase):
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        Random = random.Random(3)
+        self.Targets = [("t%s" %(i), random_sequence(600, Random)) for i in range(4)]
+        # t3 is a paralog of t0 in another family
+        self.Targets[3] = ("t3", self.Targets[0][1][:300] + random_sequence(300, Random))
+        self.TargetFile = write_fasta(self.path("targets.fa"), self.Targets)
+        self.Target2FamilyDic = {"t0": "F0", "t1": "F1", "t2": "F1", "t3": "F3"}
+        self.Index = KmerIndex.MinimizerIndex(15, 10)
+        self.Index.build(self.TargetFile, self.Target2FamilyDic)
+        self.Random = Random
+
+    def test_classify(self):
+        (Status, Targets, Family, Reverse, Score) = self.Index.classify(self.Targets[1][1][100:400])
+        self.assertEqual((Status, Targets, Family, Reverse), ("assigned", ["t1"], "F1", False))
+        self.assertAlmostEqual(Score, KmerIndex.BitsPerBase * 300)
+        (Status, Targets, Family, Reverse, Score) = self.Index.classify(Fasta.rev_complement(self.Targets[2][1][:200]))
+        self.assertEqual((Status, Targets, Family, Reverse), ("assigned", ["t2"], "F1", True))
+        # Shared by two families
+        self.assertEqual(self.Index.classify(self.Targets[0][1][:300])[0], "ambiguous")
+        # Both orientations
+        self.assertEqual(self.Index.classify(self.Targets[1][1][:200] + Fasta.rev_complement(self.Targets[1][1][300:500]))[0],
+                         "ambiguous")
+        self.assertEqual(self.Index.classify(random_sequence(300, self.Random))[0], "no_support")
+
+    def test_prefilter(self):
+        QueryFile = write_fasta(self.path("queries.fa"),
+                                [("q1", self.Targets[1][1][:300]),
+                                 ("q2", self.Targets[0][1][:300]),
+                                 ("q3", random_sequence(300, self.Random))])
+        (Assigned, NoSupportNb, AmbiguousNb) = KmerIndex.prefilter(QueryFile, self.Index, self.path("searched.fa"))
+        self.assertEqual(list(Assigned.qid), ["q1"])
+        self.assertEqual(list(Assigned.tid), ["t1"])
+        self.assertEqual((NoSupportNb, AmbiguousNb), (1, 1))
+        self.assertEqual([Name for (Name, _) in Fasta.iter_fasta(self.path("searched.fa"))], ["q2"])
+
+    def test_save_load(self):
+        self.Index.Fingerprint = "fingerprint"
+        self.Index.save(self.path("index.npz"))
+        Index = KmerIndex.MinimizerIndex(15, 10)
+        Index.Fingerprint = "fingerprint"
+        self.assertTrue(Index.load(self.path("index.npz")))
+        self.assertTrue(numpy.array_equal(Index.Codes, self.Index.Codes))
+        self.assertEqual(Index.classify(self.Targets[1][1][:300])[:3], ("assigned", ["t1"], "F1"))
+        Index = KmerIndex.MinimizerIndex(15, 10)
+        Index.Fingerprint = "other fingerprint"
+        self.assertFalse(Index.load(self.path("index.npz")))
+        self.assertFalse(KmerIndex.MinimizerIndex(17, 10).load(self.path("index.npz")))
+
+
+class TestApproximateScores(unittest.TestCase):
+    def test_retained_separately(self):
+        # A blastn hit and a query assigned by the prefilter with a higher estimated score on the same target
+        Hits = HitAssignment.concat_hit_tables([HitAssignment.HitTable([0], [5], [1], [100.], [False]),
+                                                HitAssignment.HitTable([1, 2], [5, 5], [1, 1], [400., 300.], [False, True],
+                                                                       Approximate=[True, True])])
+        Retained = Hits.retained(Threshold=0.9)
+        self.assertEqual(list(Retained.Query), [0, 1])
+        self.assertEqual(list(Retained.Approximate), [False, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
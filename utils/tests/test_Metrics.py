@@ -0,0 +1,80 @@
+# File: test_Metrics.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+
+
+import os
+import json
+import unittest
+
+from helpers import TmpDirTestCase
+
+import Metrics
+
+
+class TestStageMetrics(TmpDirTestCase):
+    def test_write(self):
+        RunMetrics = Metrics.StageMetrics("test")
+        RunMetrics.start("first")
+        RunMetrics.set("queries", 3)
+        RunMetrics.start("second")
+        RunMetrics.add("retained")
+        RunMetrics.add("retained", 2)
+        RunMetrics.write(self.path("metrics.json"), 1)
+        self.assertFalse(os.path.exists(self.path("metrics.json.tmp")))
+        with open(self.path("metrics.json")) as MetricsFile:
+            Written = json.load(MetricsFile)
+        self.assertEqual((Written["program"], Written["exit_code"]), ("test", 1))
+        self.assertEqual([Stage["name"] for Stage in Written["stages"]], ["first", "second"])
+        self.assertEqual(Written["counters"], {"queries": 3, "retained": 3})
+        self.assertTrue(Written["process_peak_rss_mb"] > 0)
+        for Stage in Written["stages"]:
+            self.assertTrue(Stage["rss_mb"] > 0 and Stage["process_peak_rss_mb"] > 0, Stage)
+
+    def test_rss(self):
+        # The current resident memory follows the allocations
+        Before = Metrics.rss_mb()
+        Buffer = "x" * (64 * 1024 * 1024)
+        self.assertTrue(Metrics.rss_mb() >= Before + 60)
+        del Buffer
+
+    def test_stop_without_stage(self):
+        RunMetrics = Metrics.StageMetrics("test")
+        RunMetrics.stop()
+        self.assertEqual(RunMetrics.Stages, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
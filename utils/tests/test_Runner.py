@@ -0,0 +1,123 @@
+# File: test_Runner.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import time
+import threading
+import unittest
+
+import helpers
+
+import Runner
+
+
+class Usage(object):
+    """Jobs recording the cores and the memory used at the same time"""
+    def __init__(self):
+        self.Lock = threading.Lock()
+        self.Cores = 0
+        self.Memory = 0
+        self.MaxCores = 0
+        self.MaxMemory = 0
+        self.Started = []
+
+    def job(self, Name, Cores=1, Memory=0, Error=""):
+        with self.Lock:
+            self.Started.append(Name)
+            self.Cores += Cores
+            self.Memory += Memory
+            self.MaxCores = max(self.MaxCores, self.Cores)
+            self.MaxMemory = max(self.MaxMemory, self.Memory)
+        time.sleep(0.02)
+        with self.Lock:
+            self.Cores -= Cores
+            self.Memory -= Memory
+        return ("out %s" %(Name), Error)
+
+
+class TestConcurrentRunner(unittest.TestCase):
+    def test_results_in_order(self):
+        Used = Usage()
+        JobRunner = Runner.ConcurrentRunner(3)
+        for i in range(10):
+            JobRunner.add(Used.job, [i])
+        Results = JobRunner.run()
+        self.assertEqual(Results, [("out %s" %(i), "") for i in range(10)])
+        self.assertEqual(Used.Started, list(range(10)))
+        self.assertTrue(1 < Used.MaxCores <= 3)
+        self.assertEqual(JobRunner.Jobs, [])
+
+    def test_core_and_memory_budget(self):
+        Used = Usage()
+        JobRunner = Runner.ConcurrentRunner(4)
+        JobRunner.Memory = 1000
+        for (i, (Cores, Memory)) in enumerate([(2, 100), (3, 600), (1, 500), (8, 0), (1, 2000), (2, 400)]):
+            # A job asking for more than the budget uses the whole budget
+            JobRunner.add(Used.job, [i, min(Cores, 4), min(Memory, 1000)], Cores=Cores, Memory=Memory)
+        Results = JobRunner.run()
+        self.assertEqual([err for (out, err) in Results], [""] * 6)
+        self.assertTrue(Used.MaxCores <= 4)
+        self.assertTrue(Used.MaxMemory <= 1000)
+
+    def test_stop_on_error(self):
+        Used = Usage()
+        JobRunner = Runner.ConcurrentRunner(1)
+        JobRunner.add(Used.job, [0])
+        JobRunner.add(Used.job, [1, 1, 0, "failed"])
+        JobRunner.add(Used.job, [2])
+        Results = JobRunner.run()
+        self.assertEqual(Results[:2], [("out 0", ""), ("out 1", "failed")])
+        self.assertEqual(Results[2], ("", "Cancelled after a previous error"))
+        self.assertEqual(Used.Started, [0, 1])
+
+    def test_continue_after_error(self):
+        Used = Usage()
+        JobRunner = Runner.ConcurrentRunner(1)
+        JobRunner.StopOnError = False
+        JobRunner.add(Used.job, [0, 1, 0, "failed"])
+        JobRunner.add(Used.job, [1])
+        self.assertEqual(JobRunner.run(), [("out 0", "failed"), ("out 1", "")])
+
+    def test_exception(self):
+        def fail():
+            raise OSError(2, "No such file or directory")
+        JobRunner = Runner.ConcurrentRunner(2)
+        JobRunner.add(fail)
+        (out, err) = JobRunner.run()[0]
+        self.assertEqual(out, "")
+        self.assertTrue(err.startswith("OSError"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# File: test_TargetIndex.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import os
+import unittest
+
+import pandas
+
+from helpers import TmpDirTestCase, write_fasta
+
+import TargetIndex
+
+
+class TestTargetIndex(TmpDirTestCase):
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        self.TargetFile = write_fasta(self.path("targets.fa"),
+                                      [("t%s" %(i), "ACGT") for i in range(20)] + [("lonely1", "ACGT"), ("lonely2", "ACGT")])
+        self.Target2FamilyFilename = self.path("t2f.tsv")
+        with open(self.Target2FamilyFilename, "w") as File:
+            for i in range(20):
+                File.write("t%s\tF%s\n" %(i, i % 3))
+        self.IndexDirName = self.path("targets.t2f_index")
+
+    def load_or_build(self, Fingerprint="fingerprint", BuildDirName=""):
+        return TargetIndex.load_or_build(self.IndexDirName, self.TargetFile, self.Target2FamilyFilename,
+                                         Fingerprint, BuildDirName=BuildDirName)
+
+    def test_codes_and_families(self):
+        (Index, Missing, Duplicated) = self.load_or_build()
+        self.assertEqual(Missing, ["lonely1", "lonely2"])
+        self.assertEqual(Duplicated, [])
+        Codes = Index.codes(["t4", "unknown", "lonely2"])
+        self.assertEqual(Codes[1], -1)
+        self.assertEqual(list(Index.Families[Index.TargetFamily[Codes[[0, 2]]]]), ["F1", "lonely2"])
+        self.assertEqual(Index.target2family_dic()["t5"], "F2")
+        (Targets, Unknown) = Index.family_targets(["F0", "F9"])
+        self.assertEqual(sorted(Targets), sorted(["t%s" %(i) for i in range(0, 20, 3)]))
+        self.assertEqual(Unknown, ["F9"])
+        Table = Index.add_families(pandas.DataFrame({"tid": ["t1", "other", "lonely1"]}))
+        self.assertEqual(list(Table.Family), ["F1", "other", "lonely1"])
+        self.assertEqual(list(Table.family < 0), [False, True, False])
+
+    def test_load_keeps_missing_targets(self):
+        self.load_or_build()
+        with open(self.Target2FamilyFilename, "a") as File:
+            File.write("lonely1\tF0\n")
+        # Same fingerprint: the saved index is loaded, not rebuilt
+        (Index, Missing, Duplicated) = self.load_or_build()
+        self.assertEqual(Missing, ["lonely1", "lonely2"])
+        self.assertEqual(Index.codes(["t19"])[0], 19)
+
+    def test_outdated_index_rebuilt_elsewhere(self):
+        self.load_or_build()
+        Before = sorted(os.listdir(self.IndexDirName))
+        Mtime = os.path.getmtime("%s/index.json" %(self.IndexDirName))
+        BuildDirName = self.path("tmp.t2f_index")
+        (Index, Missing, Duplicated) = self.load_or_build("new fingerprint", BuildDirName)
+        self.assertEqual(Missing, ["lonely1", "lonely2"])
+        self.assertEqual(sorted(os.listdir(self.IndexDirName)), Before)
+        self.assertEqual(os.path.getmtime("%s/index.json" %(self.IndexDirName)), Mtime)
+        self.assertTrue(os.path.isfile("%s/index.json" %(BuildDirName)))
+        (Index, Missing, Duplicated) = TargetIndex.load_or_build(BuildDirName, self.TargetFile, self.Target2FamilyFilename,
+                                                                 "new fingerprint")
+        self.assertEqual(Missing, ["lonely1", "lonely2"])
+
+    def test_duplicated_targets_not_saved(self):
+        with open(self.Target2FamilyFilename, "a") as File:
+            File.write("t1\tF2\n")
+        (Index, Missing, Duplicated) = self.load_or_build()
+        self.assertEqual(Duplicated, ["t1"])
+        self.assertFalse(os.path.exists(self.IndexDirName))
+
+    def test_duplicated_missing_targets(self):
+        # A target absent of the link file is duplicated in the fasta file
+        with open(self.TargetFile, "a") as File:
+            File.write(">lonely1\nACGT\n")
+        (Index, Missing, Duplicated) = self.load_or_build()
+        self.assertEqual(Duplicated, ["lonely1"])
+        self.assertFalse(os.path.exists(self.IndexDirName))
+
+    def test_add_families_without_family(self):
+        # No family in the index: all the targets are unknown
+        Index = TargetIndex.TargetFamilyIndex()
+        Table = Index.add_families(pandas.DataFrame({"tid": ["t1", "other", "t1"]}))
+        self.assertEqual(list(Table.Family), ["t1", "other", "t1"])
+        self.assertEqual(list(Table.family), [-1, -1, -1])
+        self.assertEqual(list(Table.target), [-1, -1, -1])
+        self.assertEqual(len(Index.add_families(pandas.DataFrame({"tid": []})).index), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+# File: test_check_family.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import os
+import sys
+import random
+import subprocess
+import unittest
+
+from helpers import TmpDirTestCase, ScriptsDir, LibDir, random_sequence, write_fasta
+from test_seq_dispatcher import FakeDatabase, FakeMakeblastdb, FakeBlastn, mutate
+
+import Fasta
+
+
+# Fake blastdbcmd: -info, or the sequences of the -entry_batch names as
+# blastdbcmd -outfmt %f: the name and the title, and the upper case sequence
+# by lines of 80 characters
+FakeBlastdbcmd = FakeDatabase + """Database = Args[Args.index("-db") + 1]
+Records = read_database(Database)
+if "-info" in Args:
+    print("Database: %s\\n\\t%s sequences; %s total bases" %(Database, len(Records), "{:,}".format(sum([len(Sequence) for (_, Sequence) in Records]))))
+    sys.exit(0)
+Sequences = dict(Records)
+Headers = {}
+for line in open(Database + ".fsa"):
+    if line.startswith(">"):
+        Header = " ".join(line[1:].strip().split(None, 1))
+        Headers[Header.split()[0]] = Header
+Output = open(Args[Args.index("-out") + 1], "w") if "-out" in Args else sys.stdout
+for Name in open(Args[Args.index("-entry_batch") + 1]).read().split():
+    Sequence = Sequences[Name]
+    Output.write(">%s\\n%s\\n" %(Headers[Name], "\\n".join([Sequence[i:i + 80] for i in range(0, len(Sequence), 80)])))
+"""
+
+
+RepositoryDir = os.path.dirname(os.path.dirname(ScriptsDir))
+
+def baseline_script(Name):
+    """Return the first version of a script of the repository, or None"""
+    Process = subprocess.Popen(["git", "log", "--reverse", "--format=%H", "--", "lib/scripts/%s" %(Name)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=RepositoryDir)
+    (out, _) = Process.communicate()
+    if Process.returncode or not out.split():
+        return None
+    Process = subprocess.Popen(["git", "show", "%s:lib/scripts/%s" %(out.split()[0], Name)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=RepositoryDir)
+    (out, _) = Process.communicate()
+    return out if not Process.returncode else None
+
+
+class TestCheckFamily(TmpDirTestCase):
+    """Run check_family.py with a fake blast suite on each family and on a
+    manifest of all the families"""
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        self.fake_program("makeblastdb", FakeMakeblastdb)
+        self.fake_program("blastdbcmd", FakeBlastdbcmd)
+        self.fake_program("blastn", FakeBlastn)
+        Random = random.Random(2)
+
+        # 4 families of 3 paralogs
+        Targets = []
+        for Family in range(4):
+            Core = random_sequence(150, Random)
+            for Paralog in range(3):
+                Targets.append(("F%s_t%s" %(Family, Paralog), random_sequence(100, Random) +
+                                mutate(Core, Random, Paralog * 3) + random_sequence(100, Random)))
+        self.TargetFile = write_fasta(self.path("targets.fa"), Targets)
+        with open(self.path("t2f.tsv"), "w") as File:
+            for (Name, _) in Targets:
+                File.write("%s\t%s\n" %(Name, Name.split("_")[0]))
+
+        # The fasta file of each family has the same query names, and
+        # queries of the other families or without hit
+        self.Jobs = []
+        for Family in range(4):
+            Queries = []
+            for i in range(12):
+                Kind = Random.random()
+                if Kind < 0.7:
+                    (_, Target) = Targets[3 * Family + Random.randint(0, 2)]
+                elif Kind < 0.9:
+                    (_, Target) = Random.choice(Targets)
+                else:
+                    Target = random_sequence(300, Random)
+                Start = Random.randint(0, len(Target) - 100)
+                Sequence = Target[Start:Start + Random.randint(80, 200)]
+                # Some queries have a title or are in lower case
+                Queries.append(("q%s" %(i) + (" len=%s" %(len(Sequence)) if i % 2 else ""),
+                                Sequence.lower() if i % 3 == 0 else Sequence))
+            self.Jobs.append((write_fasta(self.path("F%s.fa" %(Family)), Queries), "F%s" %(Family)))
+
+    def check_family(self, Name, Options, Script=os.path.join(ScriptsDir, "check_family.py")):
+        Environment = dict(os.environ)
+        Environment["PYTHONPATH"] = LibDir + os.pathsep + Environment.get("PYTHONPATH", "")
+        Process = subprocess.Popen([sys.executable, Script,
+                                    "-t", self.TargetFile, "-t2f", self.path("t2f.tsv"),
+                                    "-d", self.path("db/targets"),
+                                    "-tmp", self.path("tmp_%s" %(Name)), "-log", self.path("%s.log" %(Name))] + Options,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=Environment)
+        (out, err) = Process.communicate()
+        self.assertEqual(Process.returncode, 0, err)
+
+    def read(self, Filename):
+        with open(Filename) as File:
+            return File.read()
+
+    def test_manifest(self):
+        for (FastaFile, Family) in self.Jobs:
+            self.check_family(Family, ["-i", FastaFile, "-f", Family, "-o", self.path("single/%s.fa" %(Family))])
+        with open(self.path("manifest.tsv"), "w") as Manifest:
+            for (FastaFile, Family) in self.Jobs:
+                Manifest.write("%s\t%s\t%s\n" %(FastaFile, Family, self.path("batch/%s.fa" %(Family))))
+        self.check_family("batch", ["-manifest", self.path("manifest.tsv"), "-threads", "2"])
+
+        RetainedNb = 0
+        for (FastaFile, Family) in self.Jobs:
+            Output = self.read(self.path("single/%s.fa" %(Family)))
+            self.assertEqual(self.read(self.path("batch/%s.fa" %(Family))), Output, Family)
+            # The best hits of the retained sequences are targets of the family
+            BestHits = {}
+            for Fields in [line.split("\t") for line in self.read(self.path("tmp_%s/Queries_Targets.blast" %(Family))).splitlines()]:
+                BestHits.setdefault(Fields[0], []).append((float(Fields[11]), Fields[1]))
+            Sequences = dict(Fasta.iter_fasta(FastaFile))
+            for (Name, Sequence) in Fasta.iter_fasta(self.path("single/%s.fa" %(Family))):
+                self.assertEqual(Sequences[Name].upper(), Sequence)
+                BestScore = max(BestHits[Name])[0]
+                self.assertEqual(set([Target.split("_")[0] for (Score, Target) in BestHits[Name] if Score == BestScore]),
+                                 set([Family]))
+                RetainedNb += 1
+        self.assertTrue(RetainedNb > 20)
+        self.assertTrue(RetainedNb < 4 * 12)
+
+    def test_baseline(self):
+        """The outputs are those of the first check_family.py, which extracted
+        the retained sequences with makeblastdb and blastdbcmd"""
+        Script = baseline_script("check_family.py")
+        if Script is None:
+            self.skipTest("no git history")
+        with open(self.path("baseline_check_family.py"), "w") as File:
+            File.write(Script)
+        with open(self.path("manifest.tsv"), "w") as Manifest:
+            for (FastaFile, Family) in self.Jobs:
+                Manifest.write("%s\t%s\t%s\n" %(FastaFile, Family, self.path("batch/%s.fa" %(Family))))
+        self.check_family("batch", ["-manifest", self.path("manifest.tsv")])
+        for (FastaFile, Family) in self.Jobs:
+            self.check_family("baseline_%s" %(Family), ["-i", FastaFile, "-f", Family, "-o", self.path("baseline/%s.fa" %(Family))],
+                              Script=self.path("baseline_check_family.py"))
+            self.check_family(Family, ["-i", FastaFile, "-f", Family, "-o", self.path("single/%s.fa" %(Family))])
+            Output = self.read(self.path("baseline/%s.fa" %(Family)))
+            self.assertTrue(Output.count(">") > 2)
+            self.assertEqual(self.read(self.path("single/%s.fa" %(Family))), Output, Family)
+            self.assertEqual(self.read(self.path("batch/%s.fa" %(Family))), Output, Family)
+
+
+if __name__ == "__main__":
+    unittest.main()
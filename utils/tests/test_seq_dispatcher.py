@@ -0,0 +1,370 @@
+# File: test_seq_dispatcher.py
+# Created by: Carine Rey
+# Created on: October 2026
+#
+#
+# Copyright 2026 Carine Rey
+# This software is a computer program whose purpose is to assembly
+# sequences from RNA-Seq data (paired-end or single-end) using one or
+# more reference homologous sequences.
+# This software is governed by the CeCILL license under French law and
+# abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+# In this respect, the user's attention is drawn to the risks associated
+# with loading,  using,  modifying and/or developing or reproducing the
+# software by the user in light of its specific status of free software,
+# that may mean  that it is complicated to manipulate,  and  that  also
+# therefore means  that it is reserved for developers  and  experienced
+# professionals having in-depth computer knowledge. Users are therefore
+# encouraged to load and test the software's suitability as regards their
+# requirements in conditions enabling the security of their systems and/or
+# data to be ensured and,  more generally, to use and operate it in the
+# same conditions as regards security.
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+
+
+import os
+import sys
+import glob
+import json
+import random
+import subprocess
+import unittest
+
+from helpers import TmpDirTestCase, ScriptsDir, LibDir, random_sequence, write_fasta
+from test_HitAssignment import baseline_retained
+
+import Fasta
+
+
+# Fake blast databases: makeblastdb copies the fasta file in <database>.fsa,
+# blastdbcmd -info reads it (or the volumes of <database>.nal)
+FakeDatabase = """import os, sys
+def volumes(Database):
+    if os.path.isfile(Database + ".nal"):
+        for line in open(Database + ".nal"):
+            if line.startswith("DBLIST"):
+                return [os.path.join(os.path.dirname(Database), Volume.strip('"')) for Volume in line.split()[1:]]
+    return [Database]
+def read_fasta(Filename):
+    Records = []
+    for line in open(Filename):
+        if line.startswith(">"):
+            Records.append([line[1:].split()[0], ""])
+        elif line.strip():
+            Records[-1][1] += line.strip().upper()
+    return Records
+def read_database(Database):
+    Records = []
+    for DatabaseName in Database.split():
+        for Volume in volumes(DatabaseName):
+            if not os.path.isfile(Volume + ".fsa"):
+                sys.stderr.write("BLAST Database error: No alias or index file found for nucleotide database [%s]\\n" %(Volume))
+                sys.exit(2)
+            Records.extend(read_fasta(Volume + ".fsa"))
+    return Records
+Args = sys.argv[1:]
+"""
+
+FakeMakeblastdb = FakeDatabase + """import shutil
+shutil.copy(Args[Args.index("-in") + 1], Args[Args.index("-out") + 1] + ".fsa")
+"""
+
+FakeBlastdbcmd = FakeDatabase + """Database = Args[Args.index("-db") + 1]
+Records = read_database(Database)
+print("Database: %s\\n\\t%s sequences; %s total bases" %(Database, len(Records), "{:,}".format(sum([len(Sequence) for (_, Sequence) in Records]))))
+"""
+
+# Fake blastn: a hit is the longest exact stretch (>= 25 bp) shared by the query
+# and a target on one strand, its bit score is 1.9 by base and its evalue
+# search space * 2^-score. As with blast, the search space is the query length
+# times the database size shortened by a length adjustment by sequence, or
+# -searchsp. The pairwise output (-outfmt 0) only gives the search spaces.
+FakeBlastn = FakeDatabase + """Targets = read_database(Args[Args.index("-db") + 1])
+DbSize = int(Args[Args.index("-dbsize") + 1]) if "-dbsize" in Args else sum([len(Sequence) for (_, Sequence) in Targets])
+LengthAdjustment = 5
+SearchSpace = lambda QueryLength: int(Args[Args.index("-searchsp") + 1]) if "-searchsp" in Args else QueryLength * (DbSize - LengthAdjustment * len(Targets))
+MaxEvalue = float(Args[Args.index("-evalue") + 1])
+MaxTargetNb = int(Args[Args.index("-max_target_seqs") + 1])
+Output = open(Args[Args.index("-out") + 1], "w") if "-out" in Args else sys.stdout
+if "-outfmt" in Args and Args[Args.index("-outfmt") + 1] == "0":
+    for (Query, QuerySequence) in read_fasta(Args[Args.index("-query") + 1]):
+        Output.write("Query= %s\\n\\nLength=%s\\n\\n***** No hits found *****\\n\\nEffective search space used: %s\\n\\n" %(
+            Query, len(QuerySequence), SearchSpace(len(QuerySequence))))
+    sys.exit(0)
+K = 12
+Kmers = {}
+for (Index, (Target, Sequence)) in enumerate(Targets):
+    for j in range(len(Sequence) - K + 1):
+        Kmers.setdefault(Sequence[j:j + K], []).append((Index, j))
+Complement = dict(zip("ACGTN", "TGCAN"))
+for (Query, QuerySequence) in read_fasta(Args[Args.index("-query") + 1]):
+    Best = {}
+    for Strand in (1, -1):
+        Sequence = QuerySequence if Strand == 1 else "".join([Complement.get(Base, "N") for Base in reversed(QuerySequence)])
+        for i in range(len(Sequence) - K + 1):
+            for (Index, j) in Kmers.get(Sequence[i:i + K], []):
+                TargetSequence = Targets[Index][1]
+                if i > 0 and j > 0 and Sequence[i - 1] == TargetSequence[j - 1]:
+                    continue
+                Length = 0
+                while i + Length < len(Sequence) and j + Length < len(TargetSequence) and Sequence[i + Length] == TargetSequence[j + Length]:
+                    Length += 1
+                Score = 1.9 * Length
+                Evalue = SearchSpace(len(Sequence)) * 2 ** -Score
+                if Length < 25 or Evalue > MaxEvalue:
+                    continue
+                if Strand == 1:
+                    Hit = (Score, i + 1, i + Length, j + 1, j + Length, Evalue, Length)
+                else:
+                    Hit = (Score, len(Sequence) - i - Length + 1, len(Sequence) - i, j + Length, j + 1, Evalue, Length)
+                if not Index in Best or Hit[0] > Best[Index][0]:
+                    Best[Index] = Hit
+    for Index in sorted(Best, key=lambda Index: (-Best[Index][0], Index))[:MaxTargetNb]:
+        (Score, QueryStart, QueryEnd, TargetStart, TargetEnd, Evalue, Length) = Best[Index]
+        Output.write("%s\\t%s\\t100.000\\t%s\\t0\\t0\\t%s\\t%s\\t%s\\t%s\\t%.2g\\t%.1f\\n" %(
+            Query, Targets[Index][0], Length, QueryStart, QueryEnd, TargetStart, TargetEnd, Evalue, Score))
+"""
+
+
+def mutate(Sequence, Random, Nb):
+    Sequence = list(Sequence)
+    for Position in Random.sample(range(len(Sequence)), Nb):
+        Sequence[Position] = Random.choice([Base for Base in "ACGT" if Base != Sequence[Position]])
+    return "".join(Sequence)
+
+
+def read_outputs(Prefix):
+    """Return {family file name: content} of the outputs of a run"""
+    Outputs = {}
+    for Filename in glob.glob(Prefix + ".*") + glob.glob(Prefix + "_table.tsv"):
+        with open(Filename) as File:
+            Outputs[os.path.basename(Filename)[len(os.path.basename(Prefix)):]] = File.read()
+    return Outputs
+
+
+class TestSeqDispatcher(TmpDirTestCase):
+    """Run seq_dispatcher.py with a fake blast suite and compare its outputs
+    with the original algorithm and between its search and assignment modes"""
+    def setUp(self):
+        TmpDirTestCase.setUp(self)
+        self.fake_program("makeblastdb", FakeMakeblastdb)
+        self.fake_program("blastdbcmd", FakeBlastdbcmd)
+        self.fake_program("blastn", FakeBlastn)
+        Random = random.Random(1)
+
+        # 8 families of 5 paralogs sharing a core, and 2 targets absent of the link file
+        (Targets, self.Target2Family) = ([], {})
+        for Family in range(8):
+            Core = random_sequence(150, Random)
+            for Paralog in range(5):
+                Name = "F%s_t%s" %(Family, Paralog)
+                Targets.append((Name, random_sequence(Random.randint(50, 250), Random) + mutate(Core, Random, Paralog * 3) +
+                                random_sequence(Random.randint(50, 250), Random)))
+                self.Target2Family[Name] = "F%s" %(Family)
+        for Lonely in range(2):
+            Targets.append(("lonely%s" %(Lonely), random_sequence(400, Random)))
+        self.TargetFile = write_fasta(self.path("targets.fa"), Targets)
+        with open(self.path("t2f.tsv"), "w") as File:
+            for (Name, _) in Targets[:-2]:
+                File.write("%s\t%s\n" %(Name, self.Target2Family[Name]))
+        self.Target2Family.update([(Name, Name) for (Name, _) in Targets[-2:]])
+
+        Queries = []
+        for i in range(120):
+            (_, Target) = Random.choice(Targets)
+            Start = Random.randint(0, len(Target) - 80)
+            Query = Target[Start:Start + Random.randint(80, 400)]
+            Kind = Random.random()
+            if Kind < 0.2:
+                Query = mutate(Query, Random, Random.randint(1, 6))
+            elif Kind < 0.3:
+                # Chimera
+                (_, Other) = Random.choice(Targets)
+                Query = Query[:len(Query) // 2] + Other[:len(Query) // 2]
+            elif Kind < 0.35:
+                Query = random_sequence(300, Random)
+            if Random.random() < 0.3:
+                Query = Fasta.rev_complement(Query)
+            Queries.append(("TRINITY_DN%s_c0_g1_i1" %(i), Query))
+        # A duplicated name is written once
+        Queries.append(Queries[3])
+        self.Queries = Queries
+        self.QueryFile = write_fasta(self.path("queries.fa"), Queries)
+
+    def run_dispatcher(self, Name, Options, QueryFile=None, ID="A", Samples=None):
+        """Run seq_dispatcher.py on a query file (default: self.QueryFile) or
+        on samples, return its output prefix"""
+        Prefix = self.path("%s/Trinity" %(Name))
+        if Samples is None:
+            Samples = ["-q", QueryFile or self.QueryFile, "-qs", "sp", "-qid", ID]
+            Prefix += ".%s.sp" %(ID)
+        Environment = dict(os.environ)
+        Environment["PYTHONPATH"] = LibDir + os.pathsep + Environment.get("PYTHONPATH", "")
+        Process = subprocess.Popen([sys.executable, os.path.join(ScriptsDir, "seq_dispatcher.py")] + Samples +
+                                   ["-t", self.TargetFile, "-t2f", self.path("t2f.tsv"),
+                                    "-out", Prefix, "--sp2seq_tab_out_by_family", "--tab_out_one_file",
+                                    "-tmp", self.path("tmp_%s" %(Name)), "-log", self.path("%s.log" %(Name)),
+                                    "-e", "1e-6"] + Options,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=Environment)
+        (out, err) = Process.communicate()
+        self.assertEqual(Process.returncode, 0, err)
+        return Prefix
+
+    def expected(self, BlastOutputFile, Queries):
+        """Return the sequences the original algorithm retains, in the query order"""
+        with open(BlastOutputFile) as BlastOutput:
+            Hits = [(Fields[0], Fields[1], int(Fields[6]), int(Fields[7]), int(Fields[8]), int(Fields[9]), float(Fields[11]))
+                    for Fields in (line.split("\t") for line in BlastOutput)]
+        Names = []
+        for (Name, _) in Queries:
+            if not Name in Names:
+                Names.append(Name)
+        Retained = baseline_retained(Hits, Names, self.Target2Family)
+        Sequences = dict(Queries)
+        return [(Retained[Name][0], Fasta.rev_complement(Sequences[Name]) if Retained[Name][1] else Sequences[Name])
+                for Name in Names if Name in Retained]
+
+    def written(self, Prefix):
+        """Return (family, sequence) of the written sequences in the order of their names"""
+        Written = []
+        for Filename in glob.glob(Prefix + ".*.fa"):
+            Written.extend([(Name, Name.rsplit("_", 1)[1], Sequence) for (Name, Sequence) in Fasta.iter_fasta(Filename)])
+        return [(Family, Sequence) for (_, Family, Sequence) in sorted(Written)]
+
+    def test_search_modes(self):
+        Prefix = self.run_dispatcher("default", [])
+        Reference = read_outputs(Prefix)
+        Expected = self.expected(self.path("tmp_default/Queries_Targets.blast"), self.Queries)
+        self.assertTrue(len(Expected) > 30)
+        self.assertTrue(len(set([Family for (Family, _) in Expected])) > 5)
+        self.assertEqual(self.written(Prefix), Expected)
+
+        for (Name, Options) in [("stream", ["--stream_blast", "--blast_chunksize", "10"]),
+                                ("shard", ["-blast_shards", "3", "-threads", "3"]),
+                                ("volume", ["-db_volumes", "3", "-threads", "3"]),
+                                # The database is built once: the second run only replays the cached hits
+                                ("cache", ["-d", self.path("db/targets"), "-blast_cache", self.path("cache")]),
+                                ("cache_replay", ["-d", self.path("db/targets"), "-blast_cache", self.path("cache")]),
+                                ("registry", ["-db_registry", self.path("registry")]),
+                                ("registry_replay", ["-db_registry", self.path("registry")]),
+                                ("max_memory", ["-max_memory", "1"]),
+                                ("max_memory_unreached", ["-max_memory", "100000"]),
+                                ("collapse", ["--collapse_duplicates"])]:
+            self.assertEqual(read_outputs(self.run_dispatcher(Name, Options)), Reference, Name)
+        with open(self.path("cache_replay.log")) as Log:
+            self.assertIn("Blast cache: %s hits, 0 misses" %(len(self.Queries)), Log.read())
+        self.assertEqual(len(glob.glob(self.path("registry/*.done"))), 1)
+        # The hits are kept on disk above the memory budget only
+        for (Name, Kept) in [("max_memory", "on disk"), ("max_memory_unreached", "in memory")]:
+            with open(self.path("%s.log" %(Name))) as Log:
+                self.assertIn("Second Step (hits kept %s)" %(Kept), Log.read())
+
+    def test_kmer_prefilter(self):
+        Prefix = self.run_dispatcher("prefilter", ["--kmer_prefilter", "-kmer_size", "11", "-kmer_window", "5"])
+        Searched = [Name for (Name, _) in Fasta.iter_fasta(self.path("tmp_prefilter/Prefiltered_queries.fa"))]
+        self.assertTrue(0 < len(Searched) < len(self.Queries))
+        # The searched queries are retained as without prefilter: the
+        # estimated scores of the assigned queries are not compared with theirs
+        Expected = self.expected(self.path("tmp_prefilter/Queries_Targets.blast"),
+                                 [(Name, Sequence) for (Name, Sequence) in self.Queries if Name in Searched])
+        Sequences = dict(self.Queries)
+        SearchedSequences = set([Sequences[Name] for Name in Searched])
+        SearchedSequences.update([Fasta.rev_complement(Sequence) for Sequence in SearchedSequences])
+        Written = self.written(Prefix)
+        self.assertEqual([(Family, Sequence) for (Family, Sequence) in Written if Sequence in SearchedSequences], Expected)
+        self.assertTrue(len(Written) > len(Expected))
+
+    def test_family_subset(self):
+        Reference = self.written(self.run_dispatcher("default", []))
+        Families = ["F1", "F4", "F6", "lonely0"]
+        with open(self.path("families.txt"), "w") as File:
+            File.write("\n".join(Families + ["unknown"]) + "\n")
+        Expected = [(Family, Sequence) for (Family, Sequence) in Reference if Family in Families]
+        self.assertTrue(0 < len(Expected) < len(Reference))
+        for Direction in ["forward", "reverse", "auto"]:
+            Options = ["-family_subset", self.path("families.txt"), "-search_direction", Direction,
+                       "-subset_db", self.path("subset/db"), "-query_db", self.path("subset/queries"),
+                       "-metrics_json", self.path("subset_%s.json" %(Direction))]
+            self.assertEqual(self.written(self.run_dispatcher("subset_%s" %(Direction), Options)), Expected, Direction)
+            with open(self.path("subset_%s.json" %(Direction))) as MetricsFile:
+                Counters = json.load(MetricsFile)["counters"]
+            self.assertEqual(Counters["retained"], len(Expected))
+            self.assertTrue(Counters["subset_no_hit"] > 0)
+            with open(self.path("subset_%s.log" %(Direction))) as Log:
+                self.assertEqual("the queries with a hit are approximate" in Log.read(), Counters["search_direction"] == "reverse")
+        # The reverse search is only run on demand
+        self.run_dispatcher("subset_default", ["-family_subset", self.path("families.txt"), "-metrics_json", self.path("subset_default.json")])
+        with open(self.path("subset_default.json")) as MetricsFile:
+            self.assertEqual(json.load(MetricsFile)["counters"]["search_direction"], "forward")
+        # The databases are kept between runs
+        with open(self.path("subset_auto.log")) as Log:
+            self.assertIn("Database %s exists" %(self.path("subset/queries" if Counters["search_direction"] == "reverse" else "subset/db")),
+                          Log.read())
+
+    def test_metrics(self):
+        Prefix = self.run_dispatcher("metrics", ["-metrics_json", self.path("metrics.json")])
+        with open(self.path("metrics.json")) as MetricsFile:
+            Metrics = json.load(MetricsFile)
+        self.assertEqual(Metrics["exit_code"], 0)
+        Stages = [Stage["name"] for Stage in Metrics["stages"]]
+        for Stage in ["makeblastdb", "target_index", "search", "retention_and_output"]:
+            self.assertIn(Stage, Stages)
+        for Stage in Metrics["stages"]:
+            self.assertTrue(Stage["wall_time_s"] >= 0 and Stage["rss_mb"] > 0, Stage)
+        self.assertTrue(Metrics["process_peak_rss_mb"] >= max([Stage["process_peak_rss_mb"] for Stage in Metrics["stages"]]))
+        Counters = Metrics["counters"]
+        with open(self.path("tmp_metrics/Queries_Targets.blast")) as BlastOutput:
+            Hits = [line.split("\t") for line in BlastOutput]
+        # The duplicated name is counted once
+        self.assertEqual(Counters["queries"], len(self.Queries) - 1)
+        self.assertEqual(Counters["hits"], len(Hits))
+        self.assertEqual(Counters["queries_with_hits"], len(set([Fields[0] for Fields in Hits])))
+        Written = self.written(Prefix)
+        self.assertEqual(Counters["retained"], len(Written))
+        self.assertEqual(Counters["reversed"], len([Sequence for (_, Sequence) in Written if not Sequence in dict(self.Queries).values()]))
+        [Sample] = Counters["samples"]
+        self.assertEqual((Sample["id"], Sample["written"]), ("A", len(Written)))
+        self.assertEqual(sum(Sample["retained_by_family"].values()), len(Written))
+
+        # An early exit still writes its exit code
+        Environment = dict(os.environ)
+        Environment["PYTHONPATH"] = LibDir + os.pathsep + Environment.get("PYTHONPATH", "")
+        Process = subprocess.Popen([sys.executable, os.path.join(ScriptsDir, "seq_dispatcher.py"),
+                                    "-q", self.path("missing.fa"), "-qs", "sp", "-qid", "A",
+                                    "-t", self.TargetFile, "-t2f", self.path("t2f.tsv"), "-out", self.path("missing"),
+                                    "-tmp", self.path("tmp_missing"), "-log", self.path("missing.log"),
+                                    "-metrics_json", self.path("missing.json")],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=Environment)
+        Process.communicate()
+        self.assertNotEqual(Process.returncode, 0)
+        with open(self.path("missing.json")) as MetricsFile:
+            self.assertEqual(json.load(MetricsFile)["exit_code"], Process.returncode)
+
+    def test_samples(self):
+        Samples = []
+        for (ID, Queries) in [("A", self.Queries[:60]), ("B", self.Queries[60:])]:
+            QueryFile = write_fasta(self.path("queries_%s.fa" %(ID)), Queries)
+            Samples.extend(["-sample", QueryFile, "sp", ID])
+        Prefilter = ["--kmer_prefilter", "-kmer_size", "11", "-kmer_window", "5"]
+        for (Name, Options) in [("samples", []),
+                                ("samples_prefilter", Prefilter),
+                                ("samples_max_memory", Prefilter + ["-max_memory", "1"])]:
+            Prefix = self.run_dispatcher(Name, Options, Samples=Samples)
+            for ID in ["A", "B"]:
+                Single = self.run_dispatcher("single_%s_%s" %(Name, ID), Options, self.path("queries_%s.fa" %(ID)), ID)
+                self.assertEqual(read_outputs("%s.%s.sp" %(Prefix, ID)), read_outputs(Single), (Name, ID))
+
+
+if __name__ == "__main__":
+    unittest.main()